@@ -66,6 +66,16 @@ const complaintSchema = new mongoose.Schema(
       type: mongoose.Schema.Types.ObjectId,
       ref: 'Complaint',
     },
+    // Encoded image embedding returned by the ML server (base64, int8).
+    // Sent back as a duplicate-detection candidate so the image is not re-downloaded.
+    mlEmbedding: {
+      type: String,
+      select: false,
+    },
+    // Key of this complaint's stored ML features (used by bulk re-scoring on the ML server)
+    mlFeatureId: {
+      type: String,
+    },
     slaDays: {
       type: Number,
     },
@@ -2,6 +2,7 @@ const express = require('express');
 const { body, validationResult } = require('express-validator');
 const Complaint = require('../models/Complaint');
 const { auth, adminAuth } = require('../middleware/auth');
+const mlService = require('../services/mlService');
 
 const router = express.Router();
 
@@ -221,6 +222,7 @@ router.put(
         return res.status(400).json({ errors: errors.array() });
       }
 
+      const { priority, category, severity, adminNotes } = req.body;
       const complaint = await Complaint.findById(req.params.id);
 
       if (!complaint) {
@@ -228,6 +230,7 @@ router.put(
       }
 
       const oldPriority = complaint.priority;
+      const oldCategory = complaint.category;
 
       if (priority) complaint.priority = priority;
       if (category) complaint.category = category;
@@ -254,6 +257,11 @@ router.put(
       await complaint.save();
       await complaint.populate('user', 'name email');
 
+      // Teach the ML category model the supervisor's correction (best effort, not awaited)
+      if (category && category !== oldCategory && complaint.mlFeatureId) {
+        mlService.sendCategoryFeedback(complaint.mlFeatureId, category);
+      }
+
       res.json(complaint);
     } catch (error) {
       console.error('Update complaint error:', error);
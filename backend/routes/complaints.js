@@ -75,15 +75,21 @@ router.post(
       
       // We limit to 20 to prevent enormous payloads
       const existingComplaints = await Complaint.find(candidateQuery)
-                                                .select('_id image.url category')
+                                                .select('_id image.url category +mlEmbedding')
                                                 .limit(20);
                                                 
       // Format mapped candidates for the ML Server
-      // Sending { id, image_url } array
-      const candidates = existingComplaints.map(c => ({
-          complaint_id: c._id.toString(),
-          image_url: c.image.url
-      }));
+      // Sending { id, image_url } array, plus the stored embedding when we have one
+      const candidates = existingComplaints.map(c => {
+          const candidate = {
+              complaint_id: c._id.toString(),
+              image_url: c.image.url
+          };
+          if (c.mlEmbedding) {
+              candidate.embedding = c.mlEmbedding;
+          }
+          return candidate;
+      });
 
       // Get ML predictions (category, priority, severity, description, duplicate)
       const mlPredictions = await mlService.getAllPredictions(
@@ -157,6 +163,8 @@ router.post(
         status: 'Submitted',
         duplicate: isDuplicate,
         duplicateReference: duplicateReference,
+        mlEmbedding: mlPredictions.embedding || undefined,
+        mlFeatureId: mlPredictions.feature_id || undefined,
         slaDays: slaDays,
         slaDeadline: slaDeadline,
         statusHistory: [{ status: 'Submitted' }],
@@ -0,0 +1,191 @@
+/**
+ * mlRpcClient.js
+ * Persistent binary RPC connection to the ML server (see ml-server/api/rpc_server.py).
+ *
+ * One long-lived TCP connection carries many concurrent calls. Each frame is
+ *   u32 length | u32 requestId | u16 headerLen | header JSON | u16 blobCount | (u32 len | bytes)*
+ * Image bytes and embeddings travel as raw blobs (no multipart, no base64).
+ */
+const net = require('net');
+
+const MAX_FRAME_BYTES = 32 * 1024 * 1024;
+
+function encodeFrame(requestId, header, blobs) {
+  const headerBuf = Buffer.from(JSON.stringify(header), 'utf8');
+  const parts = [];
+  const head = Buffer.alloc(6);
+  head.writeUInt32BE(requestId, 0);
+  head.writeUInt16BE(headerBuf.length, 4);
+  parts.push(head, headerBuf);
+
+  const count = Buffer.alloc(2);
+  count.writeUInt16BE(blobs.length, 0);
+  parts.push(count);
+  for (const blob of blobs) {
+    const len = Buffer.alloc(4);
+    len.writeUInt32BE(blob.length, 0);
+    parts.push(len, blob);
+  }
+
+  const body = Buffer.concat(parts);
+  const prefix = Buffer.alloc(4);
+  prefix.writeUInt32BE(body.length, 0);
+  return Buffer.concat([prefix, body]);
+}
+
+function decodeFrame(body) {
+  const requestId = body.readUInt32BE(0);
+  const headerLen = body.readUInt16BE(4);
+  let offset = 6;
+  const header = headerLen ? JSON.parse(body.subarray(offset, offset + headerLen).toString('utf8')) : {};
+  offset += headerLen;
+  const blobCount = body.readUInt16BE(offset);
+  offset += 2;
+  const blobs = [];
+  for (let i = 0; i < blobCount; i++) {
+    const len = body.readUInt32BE(offset);
+    offset += 4;
+    blobs.push(body.subarray(offset, offset + len));
+    offset += len;
+  }
+  return { requestId, header, blobs };
+}
+
+class MLRpcClient {
+  constructor(host, port) {
+    this.host = host;
+    this.port = port;
+    this.socket = null;
+    this.connecting = null;
+    this.buffer = Buffer.alloc(0);
+    this.pending = new Map();
+    this.nextId = 1;
+  }
+
+  connect() {
+    if (this.socket && !this.socket.destroyed) return Promise.resolve(this.socket);
+    if (this.connecting) return this.connecting;
+
+    this.connecting = new Promise((resolve, reject) => {
+      const socket = net.createConnection({ host: this.host, port: this.port });
+      socket.setNoDelay(true);
+      socket.setKeepAlive(true, 30000);
+
+      socket.once('connect', () => {
+        this.socket = socket;
+        this.connecting = null;
+        console.log(`🔌 ML RPC connected to ${this.host}:${this.port}`);
+        resolve(socket);
+      });
+      socket.on('data', (chunk) => this._onData(chunk));
+      socket.on('error', (err) => {
+        if (this.connecting) {
+          this.connecting = null;
+          reject(err);
+        }
+        this._failAll(err);
+      });
+      socket.on('close', () => {
+        this.socket = null;
+        this.buffer = Buffer.alloc(0);
+        const err = new Error('ML RPC connection closed');
+        err.code = 'ERR_ML_RPC_CLOSED';
+        this._failAll(err);
+      });
+    });
+    return this.connecting;
+  }
+
+  _onData(chunk) {
+    this.buffer = this.buffer.length ? Buffer.concat([this.buffer, chunk]) : chunk;
+    while (this.buffer.length >= 4) {
+      const length = this.buffer.readUInt32BE(0);
+      if (length > MAX_FRAME_BYTES) {
+        this.socket.destroy(new Error(`ML RPC frame too large (${length} bytes)`));
+        return;
+      }
+      if (this.buffer.length < 4 + length) break;
+
+      const body = this.buffer.subarray(4, 4 + length);
+      this.buffer = this.buffer.subarray(4 + length);
+
+      const { requestId, header, blobs } = decodeFrame(body);
+      const call = this.pending.get(requestId);
+      if (!call) continue;
+      this.pending.delete(requestId);
+      clearTimeout(call.timer);
+
+      if (header.ok) {
+        call.resolve({ result: header.result, blobs });
+      } else {
+        const err = new Error(header.error || 'ML RPC call failed');
+        err.status = header.status;
+        call.reject(err);
+      }
+    }
+  }
+
+  _failAll(err) {
+    for (const call of this.pending.values()) {
+      clearTimeout(call.timer);
+      call.reject(err);
+    }
+    this.pending.clear();
+  }
+
+  /**
+   * Send one call; many may be in flight on the same connection.
+   * @returns {Promise<{result: Object, blobs: Buffer[]}>}
+   */
+  async call(header, blobs = [], timeout = 120000) {
+    const socket = await this.connect();
+    const requestId = this.nextId;
+    this.nextId = this.nextId >= 0xffffffff ? 1 : this.nextId + 1;
+
+    return new Promise((resolve, reject) => {
+      const timer = setTimeout(() => {
+        this.pending.delete(requestId);
+        const err = new Error(`ML RPC call timed out after ${timeout}ms`);
+        err.code = 'ERR_ML_RPC_TIMEOUT';
+        reject(err);
+      }, timeout);
+      this.pending.set(requestId, { resolve, reject, timer });
+      socket.write(encodeFrame(requestId, header, blobs));
+    });
+  }
+
+  /**
+   * predict_all over RPC. Candidates are { complaint_id, image_url, embedding? (base64) };
+   * stored embeddings are sent as raw blobs. Returns the same shape as POST /predict/all.
+   */
+  async predictAll(imageBuffer, { block, classroom, candidates = [], returnEmbedding, deadlineMs } = {}, timeout) {
+    const blobs = [imageBuffer];
+    const rpcCandidates = candidates.map((c) => {
+      const { embedding, ...rest } = c;
+      if (embedding) {
+        blobs.push(Buffer.from(embedding, 'base64'));
+        return { ...rest, embedding_blob: blobs.length - 1 };
+      }
+      return rest;
+    });
+
+    const { result, blobs: responseBlobs } = await this.call({
+      method: 'predict_all',
+      image_blob: 0,
+      block,
+      classroom,
+      return_embedding: returnEmbedding,
+      deadline_ms: deadlineMs,
+      candidates: rpcCandidates,
+    }, blobs, timeout);
+
+    if (result.embedding_blob !== undefined) {
+      // Stored with the complaint as base64, same as the HTTP response
+      result.embedding = responseBlobs[result.embedding_blob].toString('base64');
+      delete result.embedding_blob;
+    }
+    return result;
+  }
+}
+
+module.exports = { MLRpcClient, encodeFrame, decodeFrame };
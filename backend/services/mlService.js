@@ -2,8 +2,52 @@ const axios = require('axios');
 const FormData = require('form-data');
 const fs = require('fs');
 
+const { MLRpcClient } = require('./mlRpcClient');
+
 const ML_API_URL = process.env.ML_API_URL || 'http://localhost:8000';
 
+// How long we wait for /predict/all. The ML server gets a slightly smaller budget so it
+// can skip optional work (duplicate detection) and still answer before we give up.
+const ML_TIMEOUT_MS = parseInt(process.env.ML_TIMEOUT_MS || '120000', 10);
+const ML_DEADLINE_MARGIN_MS = parseInt(process.env.ML_DEADLINE_MARGIN_MS || '2000', 10);
+const ML_DEADLINE_MS = Math.max(ML_TIMEOUT_MS - ML_DEADLINE_MARGIN_MS, 0);
+
+// RPC failures where the request never reached a pipeline run; only these are retried over HTTP
+const RPC_CONNECTION_ERRORS = new Set([
+  'ECONNREFUSED', 'ECONNRESET', 'EPIPE', 'ENOTFOUND', 'EHOSTUNREACH', 'ENETUNREACH', 'ETIMEDOUT',
+  'ERR_ML_RPC_CLOSED',
+]);
+
+// Operator token of the ML server (its ML_ADMIN_TOKEN); needed to send category corrections
+const ML_ADMIN_TOKEN = process.env.ML_ADMIN_TOKEN;
+
+// Optional persistent binary RPC connection for the hot /predict/all path
+const rpcClient = process.env.ML_RPC_PORT
+  ? new MLRpcClient(process.env.ML_RPC_HOST || new URL(ML_API_URL).hostname, parseInt(process.env.ML_RPC_PORT, 10))
+  : null;
+
+function defaultPredictions(note) {
+  // Returned when the ML service is unavailable
+  return {
+    category: 'Other',
+    priority: 'Medium',
+    severity: 'Moderate',
+    description: note || 'Damage reported',
+    duplicate: {
+      is_duplicate: false,
+      similarity_score: 0,
+      similar_complaint_id: null,
+    },
+  };
+}
+
+function logDegraded(predictions) {
+  if (predictions && Array.isArray(predictions.degraded) && predictions.degraded.length > 0) {
+    console.warn(`⏱️ ML result degraded under deadline: ${predictions.degraded.join(', ')}`);
+  }
+  return predictions;
+}
+
 class MLService {
   /**
    * Get all ML predictions for a complaint
@@ -13,6 +57,33 @@ class MLService {
    * @returns {Promise<Object>} ML predictions
    */
   async getAllPredictions(imageBuffer, note = '', existingImageUrls = []) {
+    // ML_TIMEOUT_MS covers the whole call: an HTTP fallback only gets what the RPC attempt left
+    const startedAt = Date.now();
+    if (rpcClient) {
+      try {
+        return logDegraded(await rpcClient.predictAll(imageBuffer, {
+          candidates: existingImageUrls || [],
+          returnEmbedding: 'int8',
+          deadlineMs: ML_DEADLINE_MS,
+        }, ML_TIMEOUT_MS));
+      } catch (error) {
+        if (!RPC_CONNECTION_ERRORS.has(error.code)) {
+          // The server took the request (timed out or answered with an error); running it
+          // again over HTTP would only add load and overrun the caller's timeout
+          console.error('❌ ML RPC call failed:', error.message);
+          return defaultPredictions(note);
+        }
+        console.error('⚠️ ML RPC connection failed, falling back to HTTP:', error.message);
+      }
+    }
+
+    const timeoutMs = ML_TIMEOUT_MS - (Date.now() - startedAt);
+    if (timeoutMs <= 0) {
+      console.error('❌ ML SERVICE ERROR: no time left for the HTTP fallback');
+      return defaultPredictions(note);
+    }
+    const deadlineMs = Math.max(timeoutMs - ML_DEADLINE_MARGIN_MS, 0);
+
     try {
       const formData = new FormData();
       formData.append('file', imageBuffer, {
@@ -25,17 +96,19 @@ class MLService {
       if (existingImageUrls && existingImageUrls.length > 0) {
         formData.append('candidates', JSON.stringify(existingImageUrls));
       }
+      // Ask for the compact embedding so it can be stored with the complaint
+      formData.append('return_embedding', 'int8');
 
       const response = await axios.post(
         `${ML_API_URL}/predict/all`,
         formData,
         {
-          headers: formData.getHeaders(),
-          timeout: 120000, // 120 second timeout
+          headers: { ...formData.getHeaders(), 'X-Request-Deadline-Ms': String(deadlineMs) },
+          timeout: timeoutMs,
         }
       );
 
-      return response.data;
+      return logDegraded(response.data);
     } catch (error) {
       console.error('❌ ML SERVICE ERROR:', error.message);
       if (error.response) {
@@ -45,18 +118,39 @@ class MLService {
         console.error('   No response received from ML Server at', `${ML_API_URL}/predict/all`);
       }
 
-      // Return defaults if ML service is unavailable
-      return {
-        category: 'Other',
-        priority: 'Medium',
-        severity: 'Moderate',
-        description: note || 'Damage reported',
-        duplicate: {
-          is_duplicate: false,
-          similarity_score: 0,
-          similar_complaint_id: null,
-        },
-      };
+      return defaultPredictions(note);
+    }
+  }
+
+  /**
+   * Send a supervisor's category correction for online learning
+   * @param {string} featureId - mlFeatureId of the complaint's original prediction
+   * @param {string} label - Corrected category
+   * @returns {Promise<Object|null>} Online learning status, or null if not sent
+   */
+  async sendCategoryFeedback(featureId, label) {
+    if (!ML_ADMIN_TOKEN) {
+      return null;
+    }
+    try {
+      const formData = new FormData();
+      formData.append('label', label);
+      formData.append('feature_id', featureId);
+
+      const response = await axios.post(
+        `${ML_API_URL}/feedback/category`,
+        formData,
+        {
+          headers: { ...formData.getHeaders(), 'X-Admin-Token': ML_ADMIN_TOKEN },
+          timeout: 10000,
+        }
+      );
+      return response.data;
+    } catch (error) {
+      // 404: the prediction's features were not kept (e.g. answered by the cascade student)
+      const detail = error.response ? `${error.response.status} ${JSON.stringify(error.response.data)}` : error.message;
+      console.error('⚠️ ML category feedback not recorded:', detail);
+      return null;
     }
   }
 
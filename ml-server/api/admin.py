@@ -0,0 +1,24 @@
+"""
+Operator Access
+Gate for endpoints and headers that change server behaviour or expose
+request data (profiling, traffic capture). They require the `X-Admin-Token`
+header to match ML_ADMIN_TOKEN; without ML_ADMIN_TOKEN they are disabled.
+"""
+import hmac
+import os
+from typing import Optional
+
+from fastapi import Header, HTTPException
+
+
+def is_admin(token: Optional[str]) -> bool:
+    expected = os.environ.get("ML_ADMIN_TOKEN")
+    return bool(expected) and token is not None and hmac.compare_digest(token.encode(), expected.encode())
+
+
+async def require_admin(x_admin_token: Optional[str] = Header(None)):
+    """FastAPI dependency for operator-only endpoints."""
+    if not os.environ.get("ML_ADMIN_TOKEN"):
+        raise HTTPException(status_code=403, detail="Operator endpoints are disabled (set ML_ADMIN_TOKEN)")
+    if not is_admin(x_admin_token):
+        raise HTTPException(status_code=401, detail="Invalid or missing X-Admin-Token")
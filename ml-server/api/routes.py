@@ -1,14 +1,44 @@
-from fastapi import APIRouter, File, UploadFile, HTTPException, Form
+from fastapi import APIRouter, Depends, File, UploadFile, HTTPException, Form, Header, Response
+from fastapi.responses import FileResponse
 from pydantic import BaseModel
-from typing import Optional, List
+from typing import Optional, List, Dict
+import asyncio
 import json
+import os
+import time
+import numpy as np
 
+from api.admin import is_admin, require_admin
 from pipeline.inference_pipeline import InferencePipeline
+from pipeline.request_coalescer import RequestCoalescer
+from pipeline.embedding_codec import DTYPE_CODES
+from pipeline.memory_stats import process_memory
+from pipeline.profiler import RequestProfiler
+from pipeline.memory_governor import MemoryGovernor, MemoryBudgetTimeout
+from pipeline.stage_trace import StageTrace
+from pipeline.traffic_capture import TrafficCapture
+from pipeline.deadline import Deadline
 
 router = APIRouter()
 
+
+class RescoreRules(BaseModel):
+    """Thresholds to re-apply to every stored complaint (omitted fields keep current values)."""
+    edge_density_low: Optional[float] = None
+    edge_density_high: Optional[float] = None
+    priority_medium: Optional[float] = None
+    priority_high: Optional[float] = None
+    low_confidence: Optional[float] = None
+    base_severity: Optional[Dict[str, str]] = None
+    severity_scores: Optional[Dict[str, float]] = None
+    include_results: bool = True
+
 # Initialize pipeline once at startup
 pipeline = InferencePipeline()
+coalescer = RequestCoalescer()
+profiler = RequestProfiler()
+governor = MemoryGovernor()
+capture = TrafficCapture()
 
 @router.get("/")
 async def root():
@@ -20,7 +50,11 @@ async def root():
             "/predict/severity",
             "/detect/duplicate",
             "/generate/description",
-            "/predict/all"
+            "/predict/all",
+            "/stats",
+            "/profiles",
+            "/features/rescore",
+            "/feedback/category"
         ]
     }
 
@@ -28,12 +62,141 @@ async def root():
 async def health():
     return {"status": "ok"}
 
+@router.get("/stats")
+async def stats():
+    return {
+        "coalescing": coalescer.stats(),
+        "category_cascade": pipeline.category_classifier.cascade_stats(),
+        "memory": process_memory(),
+        "profiling": profiler.stats(),
+        "memory_governor": governor.usage(),
+        "feature_store": pipeline.feature_store.stats(),
+        "online_learning": pipeline.online_learner.stats(),
+        "candidate_cache": pipeline.duplicate_detector.candidate_cache.stats(),
+        "traffic_capture": capture.stats()
+    }
+
+@router.get("/profiles", dependencies=[Depends(require_admin)])
+async def list_profiles():
+    return {"traces": profiler.list_traces()}
+
+@router.get("/profiles/{trace_id}", dependencies=[Depends(require_admin)])
+async def get_profile(trace_id: str):
+    path = profiler.trace_path(trace_id)
+    if path is None or not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="Trace not found")
+    return FileResponse(path, media_type="application/json", filename=f"{trace_id}.json")
+
+@router.post("/profiles/settings", dependencies=[Depends(require_admin)])
+async def update_profile_settings(sample_rate: float = Form(...)):
+    """Operator setting: fraction of /predict/all requests to profile (0 disables sampling)."""
+    if not 0.0 <= sample_rate <= 1.0:
+        raise HTTPException(status_code=400, detail="sample_rate must be between 0 and 1")
+    # Saved to a settings file every worker polls, so all of them follow
+    profiler.update_settings(sample_rate)
+    return profiler.stats()
+
+@router.post("/capture/settings", dependencies=[Depends(require_admin)])
+async def update_capture_settings(
+    enabled: bool = Form(...),
+    image_rate: Optional[float] = Form(None)
+):
+    """Operator setting: record /predict/all and /detect/duplicate traffic for replay_traffic.py."""
+    if image_rate is not None and not 0.0 <= image_rate <= 1.0:
+        raise HTTPException(status_code=400, detail="image_rate must be between 0 and 1")
+    # Saved to a settings file every worker polls, so all of them follow
+    capture.update_settings(enabled, image_rate)
+    return capture.stats()
+
+@router.post("/features/rescore")
+async def rescore_features(rules: RescoreRules):
+    """Re-apply severity/priority rules to all stored complaint features in one vectorized pass."""
+    overrides = rules.model_dump(exclude_none=True)
+    include_results = overrides.pop("include_results", True)
+    try:
+        # Reads every segment; keep the event loop free while it runs
+        scored = await asyncio.to_thread(pipeline.feature_store.rescore, **overrides)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    priorities, counts = np.unique(scored["priority"], return_counts=True)
+    response = {
+        "count": len(scored["ids"]),
+        "elapsed_ms": scored["elapsed_ms"],
+        "priority_counts": {str(p): int(c) for p, c in zip(priorities, counts)}
+    }
+    if include_results:
+        response["results"] = [
+            {
+                "feature_id": str(scored["ids"][i]),
+                "category": str(scored["category"][i]),
+                "severity_label": str(scored["severity_label"][i]),
+                "severity_score": float(scored["severity_score"][i]),
+                "priority": str(scored["priority"][i])
+            }
+            for i in range(len(scored["ids"]))
+        ]
+    return response
+
+@router.post("/feedback/category", dependencies=[Depends(require_admin)])
+async def category_feedback(
+    label: str = Form(...),
+    file: Optional[UploadFile] = File(None),
+    embedding: Optional[str] = Form(None),
+    feature_id: Optional[str] = Form(None)
+):
+    """
+    Supervisor correction of a predicted category. Provide the image or the
+    `feature_id` of the original prediction (whose classifier features were stored).
+    """
+    learner = pipeline.online_learner
+    if not learner.available:
+        raise HTTPException(status_code=503, detail="Online learning unavailable (category model not loaded)")
+    if embedding:
+        # Duplicate-detection embeddings come from a different network than the category head
+        raise HTTPException(status_code=400, detail="Raw embeddings are not accepted; send file or feature_id")
+    classifier = pipeline.category_classifier
+    try:
+        if feature_id:
+            features = pipeline.feature_store.get_classifier_features(feature_id, classifier.feature_source)
+            if features is None:
+                raise HTTPException(
+                    status_code=404,
+                    detail="No classifier features stored for this feature_id with the current model; send the image"
+                )
+        elif file is not None:
+            contents = await file.read()
+            async with governor.admit(contents):
+                features = classifier.extract_features(contents)
+        else:
+            raise HTTPException(status_code=400, detail="Provide file or feature_id")
+
+        learner.add(features, label, classifier.feature_source)
+        return learner.stats()
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except MemoryBudgetTimeout as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/feedback/status")
+async def feedback_status():
+    return pipeline.online_learner.stats()
+
 @router.post("/predict/category")
 async def predict_category(file: UploadFile = File(...)):
     try:
         contents = await file.read()
-        category = await pipeline.category_classifier.predict(contents)
-        return {"category": category, "confidence": 0.85}
+        async with governor.admit(contents):
+            result = await pipeline.category_classifier.classify(contents)
+        return {"category": result["category"], "confidence": result["confidence"], "model": result["model"]}
+    except MemoryBudgetTimeout as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -41,8 +204,11 @@ async def predict_category(file: UploadFile = File(...)):
 async def predict_severity(file: UploadFile = File(...)):
     try:
         contents = await file.read()
-        severity_str, score = await pipeline.severity_detector.predict(contents)
+        async with governor.admit(contents):
+            severity_str, score = await pipeline.severity_detector.predict(contents)
         return {"severity": severity_str, "score": score}
+    except MemoryBudgetTimeout as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -52,24 +218,43 @@ async def detect_duplicate(
     category: str = Form(...),
     block: Optional[str] = Form(None),
     classroom: Optional[str] = Form(None),
-    candidates: Optional[str] = Form(None)
+    candidates: Optional[str] = Form(None),
+    x_request_deadline_ms: Optional[str] = Header(None)
 ):
+    deadline = Deadline.from_header(x_request_deadline_ms)
+    started = time.perf_counter()
+    trace = StageTrace()
+    contents, candidates_list, status = b"", [], 200
     try:
         contents = await file.read()
-        candidates_list = []
         if candidates:
             candidates_list = json.loads(candidates)
             
-        result = await pipeline.duplicate_detector.detect(
-            image_bytes=contents,
-            category=category,
-            block=block,
-            classroom=classroom,
-            candidates=candidates_list
-        )
+        async with governor.admit(contents, timeout=deadline.remaining()):
+            with trace.stage("duplicate"):
+                result = await pipeline.detect_duplicate_threaded(
+                    image_bytes=contents,
+                    category=category,
+                    block=block,
+                    classroom=classroom,
+                    candidates=candidates_list,
+                    deadline=deadline
+                )
         return result
+    except MemoryBudgetTimeout as e:
+        status = 503
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
+        status = 500
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        capture.record(
+            "/detect/duplicate", contents, candidates_list,
+            timings=trace.timings(),
+            total_ms=(time.perf_counter() - started) * 1000,
+            status=status,
+            category=category
+        )
 
 @router.post("/generate/description")
 async def generate_description(
@@ -83,27 +268,107 @@ async def generate_description(
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+async def run_predict_all(
+    contents: bytes,
+    block: Optional[str],
+    classroom: Optional[str],
+    candidates_list: List[dict],
+    return_embedding: Optional[str],
+    trace_id: Optional[str] = None,
+    endpoint: str = "/predict/all",
+    deadline: Optional[Deadline] = None
+) -> dict:
+    """Full pipeline behind coalescing and memory admission (shared by HTTP and RPC)."""
+    deadline = deadline or Deadline()
+    # Retries and double-submits share one pipeline run. Only requests with the same
+    # budget join: the leader started first, so its deadline never outlasts a joiner's,
+    # and a joiner never gets a result degraded by a tighter budget than its own.
+    key = coalescer.make_key(
+        contents, block=block, classroom=classroom,
+        candidates=candidates_list, return_embedding=return_embedding,
+        trace_id=trace_id, deadline_ms=deadline.budget_ms
+    )
+    started = time.perf_counter()
+    trace = StageTrace() if capture.enabled else None
+
+    async def run():
+        # Only the request doing the work needs a memory reservation
+        # Waiting for memory past the deadline is pointless; shed the request instead
+        async with governor.admit(contents, timeout=deadline.remaining()):
+            return await pipeline.run_pipeline_threaded(
+                profiler=profiler if trace_id else None,
+                trace_id=trace_id,
+                trace=trace,
+                deadline=deadline,
+                image_bytes=contents,
+                block=block,
+                classroom=classroom,
+                existing_complaints=candidates_list,
+                return_embedding=return_embedding
+            )
+
+    if trace is None:
+        return await coalescer.run(key, run)
+
+    result, status = None, 200
+    try:
+        result = await coalescer.run(key, run)
+        return result
+    except MemoryBudgetTimeout:
+        status = 503
+        raise
+    except Exception:
+        status = 500
+        raise
+    finally:
+        capture.record(
+            endpoint, contents, candidates_list,
+            timings=trace.timings(),
+            total_ms=(time.perf_counter() - started) * 1000,
+            status=status,
+            # A request that joined another's run has no stages of its own
+            coalesced=not trace.spans,
+            return_embedding=return_embedding,
+            category=result.get("category") if result else None,
+            degraded=result.get("degraded") if result else None
+        )
+
 @router.post("/predict/all")
 async def predict_all(
+    response: Response,
     file: UploadFile = File(...),
     block: Optional[str] = Form(None),
     classroom: Optional[str] = Form(None),
-    candidates: Optional[str] = Form(None)
+    candidates: Optional[str] = Form(None),
+    return_embedding: Optional[str] = Form(None),
+    x_profile: Optional[str] = Header(None),
+    x_admin_token: Optional[str] = Header(None),
+    x_request_deadline_ms: Optional[str] = Header(None)
 ):
+    if return_embedding and return_embedding not in DTYPE_CODES:
+        raise HTTPException(status_code=400, detail=f"return_embedding must be one of {list(DTYPE_CODES)}")
     try:
         print("⚡ REQUEST RECEIVED: /predict/all ⚡")
+        # Time budget for the whole pipeline (caller's header, else ML_REQUEST_DEADLINE_MS)
+        deadline = Deadline.from_header(x_request_deadline_ms)
         contents = await file.read()
         candidates_list = []
         if candidates:
             candidates_list = json.loads(candidates)
-            
-        result = await pipeline.run_pipeline(
-            image_bytes=contents,
-            block=block,
-            classroom=classroom,
-            existing_complaints=candidates_list
+
+        # X-Profile is an operator control: ignored without a valid X-Admin-Token
+        x_profile = x_profile if is_admin(x_admin_token) else None
+        # Profiled runs get their own trace, so they never join another request
+        trace_id = profiler.new_trace_id() if profiler.should_profile(x_profile) else None
+        if trace_id:
+            response.headers["X-Profile-Trace"] = trace_id
+
+        return await run_predict_all(
+            contents, block, classroom, candidates_list, return_embedding, trace_id,
+            deadline=deadline
         )
-        return result
+    except MemoryBudgetTimeout as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         import traceback
         traceback.print_exc()
@@ -0,0 +1,49 @@
+"""
+RPC Frame Codec
+Encoding and parsing of the binary RPC frames served by api/rpc_server.py
+(layout documented there). Kept free of the pipeline imports so it can be
+used and tested on its own.
+"""
+import json
+import struct
+
+U32 = struct.Struct(">I")
+U16 = struct.Struct(">H")
+
+
+class RpcError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+def decode_frame(body: bytes):
+    """Split a frame body (after the length prefix) into (request_id, header, blobs)."""
+    request_id, = U32.unpack_from(body, 0)
+    header_len, = U16.unpack_from(body, 4)
+    offset = 6
+    header = json.loads(body[offset:offset + header_len]) if header_len else {}
+    if not isinstance(header, dict):
+        raise ValueError("header must be a JSON object")
+    offset += header_len
+    blob_count, = U16.unpack_from(body, offset)
+    offset += 2
+    blobs = []
+    for _ in range(blob_count):
+        length, = U32.unpack_from(body, offset)
+        offset += 4
+        if offset + length > len(body):
+            raise RpcError(400, "Truncated blob")
+        blobs.append(body[offset:offset + length])
+        offset += length
+    return request_id, header, blobs
+
+
+def encode_frame(request_id: int, header: dict, blobs=()) -> bytes:
+    header_bytes = json.dumps(header).encode("utf-8")
+    parts = [U32.pack(request_id), U16.pack(len(header_bytes)), header_bytes, U16.pack(len(blobs))]
+    for blob in blobs:
+        parts.append(U32.pack(len(blob)))
+        parts.append(blob)
+    body = b"".join(parts)
+    return U32.pack(len(body)) + body
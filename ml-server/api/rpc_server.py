@@ -0,0 +1,160 @@
+"""
+Binary RPC Server
+Long-lived, length-prefixed binary protocol for backend-to-ML traffic.
+Raw image bytes and embeddings travel as binary blobs (no multipart parsing,
+no base64/JSON escaping); many calls can be in flight on one connection.
+
+Frame (big-endian), same layout for requests and responses:
+    u32 frame_length                      (bytes after this field)
+    u32 request_id                        (echoed in the response)
+    u16 header_length, header (UTF-8 JSON, small metadata only)
+    u16 blob_count, then per blob: u32 length, bytes
+
+Request headers:
+    {"method": "predict_all", "image_blob": 0, "block": ..., "classroom": ...,
+     "return_embedding": "int8", "deadline_ms": 10000,
+     "candidates": [{"complaint_id": ..., "image_url": ..., "embedding_blob": 1}, ...]}
+    {"method": "detect_duplicate", "image_blob": 0, "category": ..., "candidates": [...]}
+    {"method": "ping"}
+Response header: {"ok": true, "result": {...}} or {"ok": false, "status": 500, "error": "..."}.
+A returned embedding is sent as a raw blob, referenced by result["embedding_blob"].
+"""
+import asyncio
+import base64
+import os
+import socket
+import struct
+import traceback
+
+from api.routes import pipeline, governor, run_predict_all
+from api.rpc_protocol import U32, RpcError, decode_frame, encode_frame
+from pipeline.deadline import Deadline
+from pipeline.embedding_codec import DTYPE_CODES, unpack_embedding
+from pipeline.memory_governor import MemoryBudgetTimeout
+
+MAX_FRAME_BYTES = int(os.environ.get("RPC_MAX_FRAME_MB", 32)) * 1024 * 1024
+
+
+def _blob(blobs, index, field: str) -> bytes:
+    """The blob a header field points at; a bad reference is the client's error."""
+    if isinstance(index, bool) or not isinstance(index, int) or not 0 <= index < len(blobs):
+        raise RpcError(400, f"{field} must be the index of one of the {len(blobs)} blob(s)")
+    return blobs[index]
+
+
+def _resolve_candidates(header: dict, blobs) -> list:
+    candidates = []
+    for candidate in header.get("candidates") or []:
+        if not isinstance(candidate, dict):
+            raise RpcError(400, "candidates must be objects")
+        candidate = dict(candidate)
+        if "embedding_blob" in candidate:
+            blob = _blob(blobs, candidate.pop("embedding_blob"), "embedding_blob")
+            try:
+                unpack_embedding(blob)
+            except ValueError as e:
+                raise RpcError(400, f"Invalid embedding_blob for candidate {candidate.get('complaint_id')}: {e}")
+            # decode_embedding accepts the raw binary form directly
+            candidate["embedding"] = blob
+        candidates.append(candidate)
+    return candidates
+
+
+async def _dispatch(header: dict, blobs):
+    """Returns (result dict, response blobs)."""
+    method = header.get("method")
+    if method == "ping":
+        return {"status": "ok"}, []
+
+    if "image_blob" not in header:
+        raise RpcError(400, "image_blob missing")
+    image_bytes = _blob(blobs, header["image_blob"], "image_blob")
+    candidates = _resolve_candidates(header, blobs)
+
+    if method == "predict_all":
+        return_embedding = header.get("return_embedding")
+        if return_embedding and return_embedding not in DTYPE_CODES:
+            raise RpcError(400, f"return_embedding must be one of {list(DTYPE_CODES)}")
+        result = dict(await run_predict_all(
+            image_bytes, header.get("block"), header.get("classroom"), candidates, return_embedding,
+            endpoint="rpc:predict_all",
+            deadline=Deadline.from_header(header.get("deadline_ms"))
+        ))
+        response_blobs = []
+        if result.get("embedding"):
+            response_blobs.append(base64.b64decode(result.pop("embedding")))
+            result["embedding_blob"] = 0
+        return result, response_blobs
+
+    if method == "detect_duplicate":
+        deadline = Deadline.from_header(header.get("deadline_ms"))
+        async with governor.admit(image_bytes, timeout=deadline.remaining()):
+            result = await pipeline.detect_duplicate_threaded(
+                image_bytes=image_bytes,
+                category=header.get("category", "Other"),
+                block=header.get("block"),
+                classroom=header.get("classroom"),
+                candidates=candidates,
+                deadline=deadline
+            )
+        return result, []
+
+    raise RpcError(404, f"Unknown method '{method}'")
+
+
+async def _handle_call(body: bytes, writer: asyncio.StreamWriter, write_lock: asyncio.Lock):
+    request_id = U32.unpack_from(body, 0)[0] if len(body) >= 4 else 0
+    try:
+        try:
+            request_id, header, blobs = decode_frame(body)
+        except (struct.error, ValueError) as e:
+            raise RpcError(400, f"Malformed frame: {e}")
+        result, response_blobs = await _dispatch(header, blobs)
+        frame = encode_frame(request_id, {"ok": True, "result": result}, response_blobs)
+    except RpcError as e:
+        frame = encode_frame(request_id, {"ok": False, "status": e.status, "error": str(e)})
+    except MemoryBudgetTimeout as e:
+        frame = encode_frame(request_id, {"ok": False, "status": 503, "error": str(e)})
+    except Exception as e:
+        traceback.print_exc()
+        frame = encode_frame(request_id, {"ok": False, "status": 500, "error": str(e)})
+
+    # Responses complete out of order; never interleave two frames on the socket
+    async with write_lock:
+        writer.write(frame)
+        await writer.drain()
+
+
+async def _serve_connection(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    peer = writer.get_extra_info("peername")
+    print(f"🔌 [RPC] Connection from {peer}")
+    write_lock = asyncio.Lock()
+    calls = set()
+    try:
+        while True:
+            length, = U32.unpack(await reader.readexactly(4))
+            if length > MAX_FRAME_BYTES:
+                print(f"⚠️ [RPC] Frame of {length} bytes exceeds limit. Closing {peer}")
+                break
+            body = await reader.readexactly(length)
+            # Each call runs concurrently (multiplexed on this connection)
+            task = asyncio.create_task(_handle_call(body, writer, write_lock))
+            calls.add(task)
+            task.add_done_callback(calls.discard)
+    except (asyncio.IncompleteReadError, ConnectionResetError):
+        pass
+    finally:
+        if calls:
+            await asyncio.gather(*calls, return_exceptions=True)
+        writer.close()
+        print(f"🔌 [RPC] Connection closed {peer}")
+
+
+async def start_rpc_server(host: str, port: int):
+    """Start listening; reuse_port lets every pre-fork worker share the port."""
+    server = await asyncio.start_server(
+        _serve_connection, host, port,
+        reuse_port=hasattr(socket, "SO_REUSEPORT")
+    )
+    print(f"✅ Binary RPC listening on {host}:{port}")
+    return server
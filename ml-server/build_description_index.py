@@ -0,0 +1,78 @@
+"""
+Build the description template index used by DescriptionGenerator.
+
+Each template in DescriptionGenerator.category_templates gets a prototype
+vector: the mean category-classifier features (the head's input, the same
+features the pipeline already computes for every upload) of a few exemplar
+images showing that kind of damage. Lay the exemplars out as
+
+    datasets/description_templates/<Category>/<template number>/*.jpg
+
+e.g. datasets/description_templates/Chair/2/ for "Broken chair leg or support".
+Templates without exemplars are left out and never chosen over ones that have them.
+The index is tied to the classifier's weights: rebuild it after retraining.
+
+Usage: python build_description_index.py [--exemplars DIR] [--output description_index.npz]
+"""
+import argparse
+import os
+
+import numpy as np
+
+from pipeline.description_generator import DescriptionGenerator, DESCRIPTION_INDEX_PATH
+from models.category_classifier import CategoryClassifier
+
+VALID_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.gif')
+
+
+def build_index(exemplar_dir: str, output_path: str):
+    templates = DescriptionGenerator().category_templates
+    classifier = CategoryClassifier()
+    if classifier.model is None:
+        print("❌ Category model not available (PyTorch required).")
+        return
+
+    prototypes, categories, texts = [], [], []
+    for category, category_templates in templates.items():
+        for template_idx, text in enumerate(category_templates):
+            folder = os.path.join(exemplar_dir, category, str(template_idx))
+            if not os.path.isdir(folder):
+                continue
+
+            vectors = []
+            for name in sorted(os.listdir(folder)):
+                if not name.lower().endswith(VALID_EXTENSIONS):
+                    continue
+                with open(os.path.join(folder, name), "rb") as f:
+                    features = classifier.extract_features(f.read())
+                if features is not None:
+                    vectors.append(features / (np.linalg.norm(features) + 1e-8))
+            if not vectors:
+                continue
+
+            prototype = np.mean(vectors, axis=0)
+            prototypes.append(prototype / (np.linalg.norm(prototype) + 1e-8))
+            categories.append(category)
+            texts.append(text)
+            print(f"   {category} #{template_idx}: {len(vectors)} exemplar(s) — '{text}'")
+
+    if not prototypes:
+        print(f"❌ No exemplars found under '{exemplar_dir}'.")
+        return
+
+    np.savez(
+        output_path,
+        prototypes=np.stack(prototypes).astype(np.float32),
+        categories=np.array(categories),
+        texts=np.array(texts),
+        source=np.array(classifier.feature_source)
+    )
+    print(f"💾 Description index with {len(prototypes)} template(s) saved to: {os.path.abspath(output_path)}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Build the description template index")
+    parser.add_argument('--exemplars', default=os.path.join('datasets', 'description_templates'))
+    parser.add_argument('--output', default=DESCRIPTION_INDEX_PATH)
+    args = parser.parse_args()
+    build_index(args.exemplars, args.output)
@@ -0,0 +1,4 @@
+# pytest puts this directory on sys.path, so tests import pipeline.*, api.* as the server does.
+
+# Manual smoke script against a running server (python test_api.py), not a pytest module
+collect_ignore = ["test_api.py"]
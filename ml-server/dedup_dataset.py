@@ -0,0 +1,243 @@
+"""
+Group near-duplicate training images and write a leakage-free split manifest.
+
+Many images in the dataset are copies ("x - Copy.jpg") or near-identical
+re-saves. With a plain random_split they land on both sides of the split and
+inflate validation accuracy. This tool groups them in three passes, cheapest
+first:
+
+  1. exact content hash (sha256)
+  2. perceptual difference hash (64-bit dHash, Hamming distance <= --hash-distance)
+  3. embedding cosine similarity >= --embedding-threshold (one representative
+     per group so far; uses the duplicate detector's backbone, skip with 0)
+
+Each group keeps one image (the largest) and whole groups are assigned to
+train or val, stratified per class. Train with the manifest via
+
+    python dedup_dataset.py --data-dir datasets/category_classification
+    python train.py --manifest dataset_manifest.json
+
+Usage: python dedup_dataset.py [--data-dir DIR] [--output dataset_manifest.json]
+       [--hash-distance 6] [--embedding-threshold 0.95] [--val-fraction 0.2] [--seed 42]
+"""
+import argparse
+import hashlib
+import json
+import os
+import random
+import time
+from collections import Counter, defaultdict
+
+import numpy as np
+from PIL import Image
+
+VALID_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.gif')
+MANIFEST_PATH = 'dataset_manifest.json'
+
+
+class UnionFind:
+    def __init__(self, n: int):
+        self.parent = list(range(n))
+
+    def find(self, i: int) -> int:
+        while self.parent[i] != i:
+            self.parent[i] = self.parent[self.parent[i]]
+            i = self.parent[i]
+        return i
+
+    def union(self, a: int, b: int):
+        ra, rb = self.find(a), self.find(b)
+        if ra != rb:
+            self.parent[max(ra, rb)] = min(ra, rb)
+
+
+def scan(data_dir: str):
+    """(relative path, label) for every image under data_dir/<label>/."""
+    images = []
+    for label in sorted(os.listdir(data_dir)):
+        folder = os.path.join(data_dir, label)
+        if not os.path.isdir(folder):
+            continue
+        for name in sorted(os.listdir(folder)):
+            if name.lower().endswith(VALID_EXTENSIONS):
+                images.append((os.path.join(label, name), label))
+    return images
+
+
+def dhash(image: Image.Image) -> int:
+    """64-bit difference hash: brightness gradients of a 9x8 grayscale thumbnail."""
+    pixels = np.asarray(image.convert('L').resize((9, 8), Image.BILINEAR), dtype=np.int16)
+    bits = (pixels[:, 1:] > pixels[:, :-1]).flatten()
+    return int(np.packbits(bits).view('>u8')[0])
+
+
+def fingerprint(path: str) -> dict:
+    with open(path, 'rb') as f:
+        data = f.read()
+    info = {"sha256": hashlib.sha256(data).hexdigest(), "bytes": len(data), "dhash": None, "pixels": 0}
+    try:
+        with Image.open(path) as image:
+            image.draft('RGB', (64, 64))  # JPEG: decode at reduced scale, plenty for a 9x8 hash
+            info["pixels"] = image.size[0] * image.size[1]
+            info["dhash"] = dhash(image)
+    except Exception as e:
+        print(f"⚠️ Could not decode {path}: {e}")
+    return info
+
+
+def hamming_pairs(hashes: np.ndarray, max_distance: int):
+    """Index pairs whose 64-bit hashes differ in at most max_distance bits."""
+    pairs = []
+    for i in range(len(hashes) - 1):
+        diff = np.bitwise_xor(hashes[i + 1:], hashes[i])
+        distance = np.unpackbits(diff.view(np.uint8).reshape(-1, 8), axis=1).sum(axis=1)
+        pairs.extend((i, i + 1 + j) for j in np.nonzero(distance <= max_distance)[0])
+    return pairs
+
+
+def group_images(data_dir: str, images, hash_distance: int, embedding_threshold: float):
+    n = len(images)
+    uf = UnionFind(n)
+    infos = [fingerprint(os.path.join(data_dir, path)) for path, _ in images]
+
+    # 1. Byte-identical files
+    first_by_sha = {}
+    for i, info in enumerate(infos):
+        uf.union(first_by_sha.setdefault(info["sha256"], i), i)
+    exact_groups = len({uf.find(i) for i in range(n)})
+
+    # 2. Perceptual hash
+    hashed = [i for i, info in enumerate(infos) if info["dhash"] is not None]
+    if hash_distance >= 0 and hashed:
+        hashes = np.array([infos[i]["dhash"] for i in hashed], dtype=np.uint64)
+        for a, b in hamming_pairs(hashes, hash_distance):
+            uf.union(hashed[a], hashed[b])
+    hash_groups = len({uf.find(i) for i in range(n)})
+
+    # 3. Embedding similarity between group representatives
+    embedding_groups = hash_groups
+    if embedding_threshold > 0:
+        from pipeline.duplicate_detector import DuplicateDetector
+        detector = DuplicateDetector()
+        if detector.model is None:
+            print("⚠️ Embedding model not available; skipping the embedding pass.")
+        else:
+            roots = sorted({uf.find(i) for i in hashed})
+            vectors, owners = [], []
+            for root in roots:
+                with open(os.path.join(data_dir, images[root][0]), 'rb') as f:
+                    embedding = detector.embed(f.read())
+                if embedding is not None:
+                    vectors.append(embedding / (np.linalg.norm(embedding) + 1e-8))
+                    owners.append(root)
+            if vectors:
+                matrix = np.stack(vectors)
+                similarity = matrix @ matrix.T
+                for a, b in zip(*np.nonzero(np.triu(similarity >= embedding_threshold, k=1))):
+                    uf.union(owners[a], owners[b])
+            embedding_groups = len({uf.find(i) for i in range(n)})
+
+    groups = [uf.find(i) for i in range(n)]
+    return infos, groups, {"exact": exact_groups, "dhash": hash_groups, "embedding": embedding_groups}
+
+
+def group_split(members, val_fraction: float, seed: int):
+    """Assign whole groups to train/val, per class, until each class has ~val_fraction in val."""
+    rng = random.Random(seed)
+    by_label = defaultdict(list)
+    for group_id, labels in members.items():
+        by_label[Counter(labels).most_common(1)[0][0]].append(group_id)
+
+    split = {}
+    for label, group_ids in sorted(by_label.items()):
+        group_ids.sort()
+        rng.shuffle(group_ids)
+        target = val_fraction * len(group_ids)
+        for k, group_id in enumerate(group_ids):
+            split[group_id] = 'val' if k < round(target) else 'train'
+    return split
+
+
+def build_manifest(data_dir: str, output: str, hash_distance: int, embedding_threshold: float,
+                   val_fraction: float, seed: int):
+    since = time.time()
+    images = scan(data_dir)
+    if not images:
+        print(f"❌ No images found under '{data_dir}'.")
+        return
+    print(f"🔍 Grouping {len(images)} images from '{data_dir}'...")
+    infos, groups, pass_counts = group_images(data_dir, images, hash_distance, embedding_threshold)
+
+    members = defaultdict(list)
+    for (_, label), group in zip(images, groups):
+        members[group].append(label)
+    conflicts = sorted(g for g, labels in members.items() if len(set(labels)) > 1)
+
+    # One image per (group, label): the highest resolution, then the shortest name (the non-"Copy")
+    keep = {}
+    for i, ((path, label), group) in enumerate(zip(images, groups)):
+        best = keep.get((group, label))
+        if best is None or (infos[i]["pixels"], -len(path)) > (infos[best]["pixels"], -len(images[best][0])):
+            keep[(group, label)] = i
+    kept = set(keep.values())
+
+    split = group_split(members, val_fraction, seed)
+    group_ids = {g: k for k, g in enumerate(sorted(members))}
+    entries = [{
+        "path": path,
+        "label": label,
+        "group": group_ids[group],
+        "sha256": infos[i]["sha256"],
+        "keep": i in kept,
+        "split": split[group]
+    } for i, ((path, label), group) in enumerate(zip(images, groups))]
+
+    counts = Counter((e["split"], e["label"]) for e in entries if e["keep"])
+    stats = {
+        "images": len(images),
+        "kept": len(kept),
+        "groups": len(members),
+        "groups_after_pass": pass_counts,
+        "label_conflicts": len(conflicts),
+        "train": sum(v for (s, _), v in counts.items() if s == 'train'),
+        "val": sum(v for (s, _), v in counts.items() if s == 'val')
+    }
+    manifest = {
+        "data_dir": os.path.abspath(data_dir),
+        "created_at": time.time(),
+        "params": {
+            "hash_distance": hash_distance,
+            "embedding_threshold": embedding_threshold,
+            "val_fraction": val_fraction,
+            "seed": seed
+        },
+        "classes": sorted({label for _, label in images}),
+        "stats": stats,
+        "images": entries
+    }
+    with open(output, 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+    print(f"   Groups after exact hash: {pass_counts['exact']}, dHash: {pass_counts['dhash']}, "
+          f"embedding: {pass_counts['embedding']}")
+    print(f"   Keeping {len(kept)} of {len(images)} images ({len(images) - len(kept)} near-duplicates dropped)")
+    for label in manifest["classes"]:
+        print(f"   {label}: {counts[('train', label)]} train / {counts[('val', label)]} val")
+    if conflicts:
+        print(f"⚠️ {len(conflicts)} group(s) span several classes; check their labels in the manifest.")
+    print(f"💾 Manifest saved to: {os.path.abspath(output)} ({time.time() - since:.1f}s)")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Deduplicate a class-folder dataset into a split manifest")
+    parser.add_argument('--data-dir', default=os.path.join('datasets', 'category_classification'))
+    parser.add_argument('--output', default=MANIFEST_PATH)
+    parser.add_argument('--hash-distance', type=int, default=6,
+                        help="Max differing dHash bits to treat two images as near-duplicates (-1 disables)")
+    parser.add_argument('--embedding-threshold', type=float, default=0.95,
+                        help="Cosine similarity that merges groups (0 disables the embedding pass)")
+    parser.add_argument('--val-fraction', type=float, default=0.2)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+    build_manifest(args.data_dir, args.output, args.hash_distance, args.embedding_threshold,
+                   args.val_fraction, args.seed)
@@ -0,0 +1,179 @@
+"""
+Compare registered backbones on our dataset: accuracy vs. CPU latency vs. memory.
+
+Accuracy is a linear probe (logistic regression on frozen pretrained features,
+the same "freeze the base, train the head" setup as train.py). With --manifest
+it uses the deduplicated, group-aware split from dedup_dataset.py, so
+near-duplicates ("- Copy" twins, resaves) never straddle train and val.
+Without one, byte-identical files are dropped first and the rest get a fixed,
+seeded 80/20 split; near-duplicates can still leak there, so prefer a manifest.
+Every backbone sees the same images either way. Latency is single-image,
+single-thread CPU inference, like one serving worker.
+
+Each configuration runs in its own freshly spawned process, so its RSS delta
+(weights plus the activation memory of a forward pass, over a process that has
+only imported torch) is not skewed by allocator caches or weights left behind
+by the configurations measured before it.
+
+Usage:
+    python evaluate_backbones.py
+    python evaluate_backbones.py --backbones mobilenet_v3_small resnet18 --input-sizes 160 224
+    python evaluate_backbones.py --target-acc 0.85 --json backbones.json
+    python evaluate_backbones.py --manifest dataset_manifest.json
+
+The row marked ★ is the fastest configuration meeting --target-acc; train it with
+    python train.py --backbone <name> --input-size <size>
+"""
+import argparse
+import gc
+import hashlib
+import json
+import multiprocessing
+import os
+import time
+
+import numpy as np
+import torch
+from sklearn.linear_model import LogisticRegression
+from torch.utils.data import DataLoader, Subset
+from torchvision import datasets, transforms
+
+from models.backbones import BACKBONES, build_model, as_feature_extractor
+from pipeline.memory_stats import process_memory
+from train import ManifestDataset, load_manifest_splits
+
+DATA_DIR = os.path.join('datasets', 'category_classification')
+SEED = 42
+
+
+def probe_datasets(input_size: int, manifest=None):
+    """(train, val) datasets for the probe: the manifest split if given, else a seeded split of unique files."""
+    transform = transforms.Compose([
+        transforms.Resize((input_size, input_size)),
+        transforms.ToTensor(),
+        transforms.Normalize([0.485, 0.456, 0.406], [0.229, 0.224, 0.225])
+    ])
+    if manifest:
+        classes, train_samples, val_samples = load_manifest_splits(manifest)
+        return ManifestDataset(train_samples, classes, transform), ManifestDataset(val_samples, classes, transform)
+
+    dataset = datasets.ImageFolder(DATA_DIR, transform=transform)
+    # Exact copies would otherwise land on both sides of the split
+    seen, unique = set(), []
+    for index, (path, _) in enumerate(dataset.samples):
+        with open(path, 'rb') as f:
+            digest = hashlib.sha256(f.read()).hexdigest()
+        if digest not in seen:
+            seen.add(digest)
+            unique.append(index)
+    order = np.random.default_rng(SEED).permutation(unique)
+    split = int(0.8 * len(order))
+    return Subset(dataset, order[:split].tolist()), Subset(dataset, order[split:].tolist())
+
+
+def extract_features(model, dataset, batch_size: int = 32):
+    features, labels = [], []
+    with torch.no_grad():
+        for inputs, targets in DataLoader(dataset, batch_size=batch_size, shuffle=False, num_workers=0):
+            features.append(model(inputs).numpy())
+            labels.append(targets.numpy())
+    return np.concatenate(features), np.concatenate(labels)
+
+
+def probe_accuracy(model, input_size: int, manifest=None) -> float:
+    train_dataset, val_dataset = probe_datasets(input_size, manifest)
+    train_features, train_labels = extract_features(model, train_dataset)
+    val_features, val_labels = extract_features(model, val_dataset)
+    probe = LogisticRegression(max_iter=2000)
+    probe.fit(train_features, train_labels)
+    return float(probe.score(val_features, val_labels))
+
+
+def measure_latency(model, input_size: int, runs: int, warmup: int = 5) -> dict:
+    image = torch.randn(1, 3, input_size, input_size)
+    timings = []
+    with torch.no_grad():
+        for i in range(warmup + runs):
+            start = time.perf_counter()
+            model(image)
+            if i >= warmup:
+                timings.append((time.perf_counter() - start) * 1000)
+    return {"latency_p50_ms": float(np.percentile(timings, 50)), "latency_p90_ms": float(np.percentile(timings, 90))}
+
+
+def evaluate(name: str, input_size: int, runs: int, manifest=None) -> dict:
+    # Same threading as a serving worker (see CategoryClassifier)
+    torch.set_num_threads(1)
+    gc.collect()
+    rss_before = process_memory()["rss_mb"]
+    model = as_feature_extractor(build_model(name, pretrained=True), name).eval()
+    params_mb = sum(p.numel() * p.element_size() for p in model.parameters()) / (1024 * 1024)
+
+    latency = measure_latency(model, input_size, runs)
+    # Includes weights plus the activation memory of a forward pass
+    rss_delta = process_memory()["rss_mb"] - rss_before
+
+    return {
+        "backbone": name,
+        "input_size": input_size,
+        "accuracy": probe_accuracy(model, input_size, manifest),
+        **latency,
+        "params_mb": round(params_mb, 1),
+        "rss_delta_mb": round(rss_delta, 1)
+    }
+
+
+def evaluate_isolated(name: str, input_size: int, runs: int, manifest=None) -> dict:
+    """evaluate() in a fresh process, so memory is measured from the same clean baseline every time."""
+    with multiprocessing.get_context("spawn").Pool(1) as pool:
+        return pool.apply(evaluate, (name, input_size, runs, manifest))
+
+
+def print_table(results, best):
+    print("\n| Backbone | Input | Probe acc | p50 ms | p90 ms | Params MB | RSS Δ MB |")
+    print("|---|---|---|---|---|---|---|")
+    for r in sorted(results, key=lambda r: r["latency_p50_ms"]):
+        mark = " ★" if r is best else ""
+        print(f"| {r['backbone']}{mark} | {r['input_size']} | {r['accuracy']:.3f} | "
+              f"{r['latency_p50_ms']:.1f} | {r['latency_p90_ms']:.1f} | {r['params_mb']} | {r['rss_delta_mb']} |")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Accuracy / latency / memory comparison of backbones")
+    parser.add_argument('--backbones', nargs='+', default=list(BACKBONES), choices=list(BACKBONES))
+    parser.add_argument('--input-sizes', nargs='+', type=int, default=None,
+                        help="Resolutions to try (default: each backbone's default)")
+    parser.add_argument('--runs', type=int, default=50, help="Timed single-image runs per configuration")
+    parser.add_argument('--target-acc', type=float, default=None,
+                        help="Mark the fastest configuration with at least this probe accuracy")
+    parser.add_argument('--json', default=None, help="Also write the results to this file")
+    parser.add_argument('--manifest', default=None,
+                        help="Deduplicated split manifest from dedup_dataset.py (instead of a random split)")
+    args = parser.parse_args()
+
+    if args.manifest is None and not os.path.exists(DATA_DIR):
+        print(f"❌ Data directory '{DATA_DIR}' not found.")
+        raise SystemExit(1)
+
+    results = []
+    for name in args.backbones:
+        for size in args.input_sizes or [BACKBONES[name]["default_input_size"]]:
+            print(f"🔬 Evaluating {name} @ {size}px ...")
+            results.append(evaluate_isolated(name, size, args.runs, args.manifest))
+
+    best = None
+    if args.target_acc is not None:
+        eligible = [r for r in results if r["accuracy"] >= args.target_acc]
+        best = min(eligible, key=lambda r: r["latency_p50_ms"]) if eligible else None
+        if best is None:
+            print(f"⚠️ No configuration reaches {args.target_acc:.3f} probe accuracy.")
+
+    print_table(results, best)
+    if best is not None:
+        print(f"\n★ Fastest meeting {args.target_acc:.3f}: "
+              f"python train.py --backbone {best['backbone']} --input-size {best['input_size']}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"💾 Results saved to: {os.path.abspath(args.json)}")
@@ -3,7 +3,8 @@ from fastapi.middleware.cors import CORSMiddleware
 import uvicorn
 from dotenv import load_dotenv
 import os
-import psutil
+
+from pipeline.memory_stats import process_memory
 
 # Load environment variables
 load_dotenv()
@@ -28,12 +29,32 @@ app.include_router(api_router)
 
 @app.on_event("startup")
 async def startup_event():
-    process = psutil.Process(os.getpid())
-    print(f"Startup memory usage: {process.memory_info().rss / 1024 / 1024:.2f} MB")
+    mem = process_memory()
+    print(f"Startup memory usage (pid {mem['pid']}): RSS {mem['rss_mb']:.2f} MB, unique {mem['uss_mb']} MB")
+
+    # Optional persistent binary RPC endpoint for the backend (see api/rpc_server.py)
+    rpc_port = os.environ.get("RPC_PORT")
+    if rpc_port:
+        from api.rpc_server import start_rpc_server
+        app.state.rpc_server = await start_rpc_server("0.0.0.0", int(rpc_port))
+
     print("✅ ML Server started successfully")
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    # Pre-fork workers exit via os._exit, so atexit hooks never run there
+    from api.routes import pipeline
+    pipeline.feature_store.flush()
+
 if __name__ == "__main__":
     # Ensure Render dynamic port bindings or fallback safely
     port = int(os.environ.get("PORT", 8000))
-    uvicorn.run(app, host="0.0.0.0", port=port)
+    workers = int(os.environ.get("WEB_CONCURRENCY", 1))
+    if workers > 1:
+        # Models are already loaded in this process; workers share them copy-on-write
+        from api.routes import pipeline
+        from prefork import serve
+        serve(app, pipeline, host="0.0.0.0", port=port, workers=workers)
+    else:
+        uvicorn.run(app, host="0.0.0.0", port=port)
 
@@ -0,0 +1,104 @@
+"""
+Backbone Registry
+Single definition of the CNN backbones used by training (train.py), serving
+(CategoryClassifier, DuplicateDetector) and evaluation (evaluate_backbones.py).
+
+The category model's backbone and input size are written to model.json by
+train.py and read back at serving time, so both always agree. Embeddings use
+EMBEDDING_BACKBONE / EMBEDDING_INPUT_SIZE (defaults: mobilenet_v2 @ 224).
+"""
+import json
+import os
+from typing import Optional
+
+try:
+    import torch.nn as nn
+    from torchvision import models
+    TORCH_AVAILABLE = True
+except ImportError:
+    TORCH_AVAILABLE = False
+
+# name -> where the final Linear layer lives: (attribute, index inside a Sequential or None),
+# and the pinned pretrained weights. Never "DEFAULT": torchvision moves it to newer weights
+# (mobilenet_v2 -> IMAGENET1K_V2), which would silently change every stored embedding.
+BACKBONES = {
+    "mobilenet_v2":       {"head": ("classifier", 1), "default_input_size": 160, "weights": "IMAGENET1K_V1"},
+    "mobilenet_v3_small": {"head": ("classifier", 3), "default_input_size": 224, "weights": "IMAGENET1K_V1"},
+    "mobilenet_v3_large": {"head": ("classifier", 3), "default_input_size": 224, "weights": "IMAGENET1K_V1"},
+    "resnet18":           {"head": ("fc", None),      "default_input_size": 224, "weights": "IMAGENET1K_V1"},
+    "efficientnet_b0":    {"head": ("classifier", 1), "default_input_size": 224, "weights": "IMAGENET1K_V1"},
+}
+
+DEFAULT_BACKBONE = "mobilenet_v2"
+MODEL_CONFIG_PATH = "model.json"
+
+
+def _check(name: str):
+    if name not in BACKBONES:
+        raise ValueError(f"Unknown backbone '{name}' (available: {', '.join(BACKBONES)})")
+
+
+def build_model(name: str, num_classes: int = None, pretrained: bool = False):
+    """Build a torchvision backbone, optionally with a fresh `num_classes` head."""
+    _check(name)
+    model = getattr(models, name)(weights=BACKBONES[name]["weights"] if pretrained else None)
+    if num_classes is not None:
+        set_head(model, name, nn.Linear(get_head(model, name).in_features, num_classes))
+    return model
+
+
+def get_head(model, name: str):
+    attr, index = BACKBONES[name]["head"]
+    module = getattr(model, attr)
+    return module if index is None else module[index]
+
+
+def set_head(model, name: str, head):
+    attr, index = BACKBONES[name]["head"]
+    if index is None:
+        setattr(model, attr, head)
+    else:
+        getattr(model, attr)[index] = head
+
+
+def as_feature_extractor(model, name: str):
+    """Drop the final Linear so the model outputs the head's input features."""
+    set_head(model, name, nn.Identity())
+    return model
+
+
+def feature_dim(name: str) -> int:
+    return get_head(build_model(name), name).in_features
+
+
+def load_model_config() -> dict:
+    """Backbone / input size of the trained category model (model.json, else env, else defaults)."""
+    config = {}
+    if os.path.exists(MODEL_CONFIG_PATH):
+        with open(MODEL_CONFIG_PATH) as f:
+            config = json.load(f)
+    backbone = config.get("backbone") or os.environ.get("CATEGORY_BACKBONE", DEFAULT_BACKBONE)
+    _check(backbone)
+    input_size = int(config.get("input_size") or os.environ.get("CATEGORY_INPUT_SIZE", BACKBONES[backbone]["default_input_size"]))
+    return {
+        "backbone": backbone,
+        "input_size": input_size,
+        "categories": config.get("categories"),
+        "manifest": config.get("manifest")
+    }
+
+
+def save_model_config(backbone: str, input_size: int, categories, manifest: Optional[str] = None):
+    """manifest: split manifest the model was trained with (its val split is held out)."""
+    config = {"backbone": backbone, "input_size": input_size, "categories": list(categories)}
+    if manifest:
+        config["manifest"] = os.path.abspath(manifest)
+    with open(MODEL_CONFIG_PATH, "w") as f:
+        json.dump(config, f, indent=2)
+
+
+def embedding_config() -> dict:
+    backbone = os.environ.get("EMBEDDING_BACKBONE", DEFAULT_BACKBONE)
+    _check(backbone)
+    input_size = int(os.environ.get("EMBEDDING_INPUT_SIZE", 224))
+    return {"backbone": backbone, "input_size": input_size, "tag": f"{backbone}@{input_size}"}
@@ -14,27 +14,61 @@ try:
     torch.set_num_interop_threads(1)
     import torch.nn as nn
     from torchvision import models, transforms
+    from models.backbones import build_model, get_head, set_head
     TORCH_AVAILABLE = True
 except ImportError:
     TORCH_AVAILABLE = False
 
 from PIL import Image
 import io
+import hashlib
+import json
+import os
+import threading
+from typing import List
+
+from models.backbones import load_model_config
 try:
     import numpy as np
     NUMPY_AVAILABLE = True
 except ImportError:
     NUMPY_AVAILABLE = False
 
+# Below this top-class probability the prediction falls back to "Other"
+LOW_CONFIDENCE_THRESHOLD = 0.3
+
+# Head weights learned online from supervisor corrections (see pipeline/online_learner.py)
+ONLINE_HEAD_PATH = "online_head.pth"
+
+# Longest side of the downsampled image used by the rule-based fallback
+RULE_FEATURE_SIZE = 128
+
 class CategoryClassifier:
     def __init__(self):
         # CRITICAL: Must match ImageFolder alphabetical order from training
         self.categories = ['Bench', 'Chair', 'Other', 'Pipe', 'Projector', 'Socket']
         self.model = None
+        # Distilled student for the confidence-gated cascade (see train.py --distill)
+        self.student = None
+        self.student_transform = None
+        self.student_threshold = None
+        self.student_answered = 0
+        self.escalated = 0
+        self.head_version = 0
+        # Identifies the feature space of the head's input (backbone, resolution, weights);
+        # online-learning features must come from exactly this model
+        self.feature_source = None
+        # Head input of the last forward pass, per thread (see _install_feature_hook)
+        self._captured = threading.local()
+        self._feature_hook = None
+        # Architecture + input size shared with train.py (model.json)
+        self.config = load_model_config()
+        self.backbone = self.config["backbone"]
+        self.input_size = self.config["input_size"]
         if TORCH_AVAILABLE:
             self.device = torch.device('cpu')
             self.transform = transforms.Compose([
-                transforms.Resize((160, 160)),
+                transforms.Resize((self.input_size, self.input_size)),
                 transforms.ToTensor(),
                 transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225])
             ])
@@ -44,21 +78,18 @@ class CategoryClassifier:
         self.load_model()
     
     def load_model(self):
-        """Load pre-trained MobileNet model"""
+        """Load the trained backbone (MobileNetV2 unless model.json says otherwise)"""
         if not TORCH_AVAILABLE:
             print("⚠️  PyTorch not available. Using rule-based fallback.")
             self.model = None
             return
             
         try:
-            # Use MobileNet for lightweight inference
-            from torchvision.models import mobilenet_v2
-            self.model = mobilenet_v2(weights=None)
-            # Modify last layer for 6 categories
-            self.model.classifier[1] = nn.Linear(self.model.last_channel, len(self.categories))
+            # Build the registered backbone with a head for our categories
+            self.model = build_model(self.backbone, num_classes=len(self.categories))
+            print(f"ℹ️  Category backbone: {self.backbone} @ {self.input_size}px")
             
             # Load trained weights if available
-            import os
             if os.path.exists("model.pth"):
                 try:
                     state_dict = torch.load("model.pth", map_location=self.device)
@@ -73,6 +104,10 @@ class CategoryClassifier:
                     print(f"⚠️ Found model.pth but failed to load: {e}")
             else:
                 print("ℹ️  Using default ImageNet weights (untrained head)")
+
+            self._load_online_head()
+            self._install_feature_hook(self.get_head())
+            self.feature_source = f"{self.backbone}@{self.input_size}:{self._weights_digest()}"
             
             self.model.eval()
             self.model.to(self.device)
@@ -81,19 +116,162 @@ class CategoryClassifier:
         except Exception as e:
             print(f"⚠️  Could not load model: {e}. Using rule-based fallback.")
             self.model = None
+            return
+
+        self._load_student()
+
+    def _load_online_head(self):
+        """Apply the latest head learned from corrections, if any."""
+        if not os.path.exists(ONLINE_HEAD_PATH):
+            return
+        try:
+            checkpoint = torch.load(ONLINE_HEAD_PATH, map_location=self.device)
+            if checkpoint.get("categories") != self.categories:
+                print("⚠️ online_head.pth was trained on different categories. Ignoring it.")
+                return
+            if checkpoint.get("backbone", self.backbone) != self.backbone:
+                print(f"⚠️ online_head.pth was trained for {checkpoint['backbone']}. Ignoring it.")
+                return
+            self.get_head().load_state_dict(checkpoint["state_dict"])
+            self.head_version = checkpoint["version"]
+            print(f"🎉 Loaded online-updated head v{self.head_version}")
+        except Exception as e:
+            print(f"⚠️ Found {ONLINE_HEAD_PATH} but failed to load: {e}")
+
+    def _weights_digest(self) -> str:
+        if not os.path.exists("model.pth"):
+            return "imagenet"
+        sha = hashlib.sha256()
+        with open("model.pth", "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                sha.update(chunk)
+        return sha.hexdigest()[:16]
+
+    def _install_feature_hook(self, head):
+        """Record the head's input on every forward pass, per thread (pipeline threads run concurrently)."""
+        if self._feature_hook is None:
+            # A plain function, so copy.deepcopy(head) keeps this same object in the copy's hooks
+            def hook(module, inputs):
+                self._captured.features = inputs[0]
+            self._feature_hook = hook
+        # New heads are deep copies of the current one and carry its hook already; keep exactly one
+        for key, fn in list(head._forward_pre_hooks.items()):
+            if fn is self._feature_hook:
+                del head._forward_pre_hooks[key]
+        head.register_forward_pre_hook(self._feature_hook)
+
+    def _last_features(self):
+        features = getattr(self._captured, "features", None)
+        self._captured.features = None
+        return None if features is None else features[0].cpu().numpy().astype(np.float32)
+
+    def get_head(self):
+        """The final linear layer (the only part updated online)."""
+        return get_head(self.model, self.backbone)
+
+    def set_head(self, head, version: int):
+        """Swap in a new head. A single attribute assignment, so concurrent requests see old or new, never a mix."""
+        self._install_feature_hook(head)
+        set_head(self.model, self.backbone, head)
+        self.head_version = version
+
+    def extract_features(self, image_bytes: bytes):
+        """Backbone features (the head's input) as a 1-D float32 numpy array."""
+        image = Image.open(io.BytesIO(image_bytes)).convert('RGB')
+        image_tensor = self.transform(image).unsqueeze(0).to(self.device)
+        image.close()
+        with torch.no_grad():
+            self.model(image_tensor)
+        return self._last_features()
+
+    def _load_student(self):
+        """Load the distilled student and its calibrated confidence threshold, if trained."""
+        from models.student_network import (
+            build_student, STUDENT_INPUT_SIZE, STUDENT_WEIGHTS_PATH, STUDENT_META_PATH
+        )
+        if not (os.path.exists(STUDENT_WEIGHTS_PATH) and os.path.exists(STUDENT_META_PATH)):
+            print("ℹ️  No distilled student found. Every image uses the full model.")
+            return
+
+        try:
+            with open(STUDENT_META_PATH) as f:
+                meta = json.load(f)
+            if meta.get("categories") != self.categories:
+                print("⚠️ Student was trained on different categories. Ignoring it.")
+                return
+
+            student = build_student(len(self.categories))
+            student.load_state_dict(torch.load(STUDENT_WEIGHTS_PATH, map_location=self.device))
+            student.eval()
+            student.to(self.device)
+
+            input_size = meta.get("input_size", STUDENT_INPUT_SIZE)
+            self.student_transform = transforms.Compose([
+                transforms.Resize((input_size, input_size)),
+                transforms.ToTensor(),
+                transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225])
+            ])
+            self.student_threshold = float(meta["threshold"])
+            self.student = student
+            print(f"🎓 Loaded distilled student (escalation threshold: {self.student_threshold:.3f})")
+        except Exception as e:
+            print(f"⚠️ Found student model but failed to load: {e}")
+            self.student = None
+
+    def cascade_stats(self) -> dict:
+        total = self.student_answered + self.escalated
+        return {
+            "student_enabled": self.student is not None,
+            "threshold": self.student_threshold,
+            "student_answered": self.student_answered,
+            "escalated": self.escalated,
+            "escalation_rate": (self.escalated / total) if total else None
+        }
     
     async def predict(self, image_bytes: bytes) -> str:
         """
         Predict category from image bytes
         Returns: category name
         """
+        result = await self.classify(image_bytes)
+        return result["category"]
+
+    async def classify(self, image_bytes: bytes) -> dict:
+        """
+        Predict category from image bytes with details.
+        Returns: {"category", "confidence", "probabilities", "model"}
+        where model is "student", "teacher" or "rules"; teacher results also
+        carry "features" (the head's input, see feature_source).
+        """
         if self.model is None:
             # Rule-based fallback
-            return self._rule_based_classification(image_bytes)
+            category = self._rule_based_classification(image_bytes)
+            return {"category": category, "confidence": None, "probabilities": None, "model": "rules"}
         
         try:
             # Preprocess image
             image = Image.open(io.BytesIO(image_bytes)).convert('RGB')
+
+            # Cascade: the student answers confident cases, the rest escalate
+            if self.student is not None:
+                student_tensor = self.student_transform(image).unsqueeze(0).to(self.device)
+                with torch.no_grad():
+                    student_probs = torch.nn.functional.softmax(self.student(student_tensor)[0], dim=0)
+                student_conf, student_idx = torch.max(student_probs, 0)
+                if student_conf.item() >= self.student_threshold:
+                    self.student_answered += 1
+                    image.close()
+                    category = self.categories[student_idx.item()]
+                    print(f"✅ [CategoryClassifier] Student answered: {category} (Confidence: {student_conf.item():.2%})")
+                    return {
+                        "category": category,
+                        "confidence": student_conf.item(),
+                        "probabilities": student_probs.tolist(),
+                        "model": "student"
+                    }
+                self.escalated += 1
+                print(f"↗️ [CategoryClassifier] Student unsure ({student_conf.item():.2%}). Escalating to full model.")
+
             image_tensor = self.transform(image).unsqueeze(0).to(self.device)
             
             # Predict
@@ -113,6 +291,8 @@ class CategoryClassifier:
 
                 predicted_idx = torch.argmax(probabilities).item()
                 confidence = probabilities[predicted_idx].item()
+                probability_list = probabilities.tolist()
+                features = self._last_features()
                 
                 del outputs
                 del image_tensor
@@ -127,76 +307,93 @@ class CategoryClassifier:
             print(f"   -> Top Match: {category} (Confidence: {confidence:.2%})")
 
             # If confidence is too low, return "Other"
-            if confidence < 0.3:
+            if confidence < LOW_CONFIDENCE_THRESHOLD:
                 print(f"⚠️ [CategoryClassifier] Confidence too low. Defaulting to 'Other'.")
-                return "Other"
+                category = "Other"
             
-            return category
+            return {
+                "category": category,
+                "confidence": confidence,
+                "probabilities": probability_list,
+                "model": "teacher",
+                # Head input, stored so a later correction can train the head without the image
+                "features": features
+            }
             
         except Exception as e:
             print(f"Error in category prediction: {e}")
-            return "Other"
+            return {"category": "Other", "confidence": None, "probabilities": None, "model": "error"}
     
+    async def predict_batch(self, images: List[bytes]) -> List[str]:
+        """
+        Predict categories for several images.
+        The rule-based fallback is vectorized over the whole batch.
+        """
+        if self.model is None:
+            return self._rule_based_classification_batch(images)
+        return [await self.predict(image_bytes) for image_bytes in images]
+
     def _rule_based_classification(self, image_bytes: bytes) -> str:
         """
         Simple rule-based classification as fallback
         Analyzes image to make basic predictions
         """
-        try:
-            from PIL import Image
-            import io
-            
-            image = Image.open(io.BytesIO(image_bytes)).convert('RGB')
-            width, height = image.size
-            
-            # Analyze image characteristics
-            # Get dominant colors
-            colors = image.getcolors(maxcolors=256*256*256)
-            if colors:
-                # Sort by frequency
-                colors.sort(key=lambda x: x[0], reverse=True)
-                dominant_color = colors[0][1]  # (r, g, b)
-                avg_brightness = sum(dominant_color) / 3
-            else:
-                avg_brightness = 128
-            
-            # Analyze aspect ratio
-            aspect_ratio = width / height if height > 0 else 1
-            
-            # Simple heuristics based on image properties
-            # These are basic rules - actual ML would be much better
-            
-            # Very dark images might be sockets/electrical
-            if avg_brightness < 80:
-                return "Socket"
-            
-            # Square-ish images might be furniture
-            if 0.8 < aspect_ratio < 1.2:
-                if avg_brightness > 150:
-                    return "Chair"
-                else:
-                    return "Bench"
-            
-            # Wide images might be projectors or benches
-            if aspect_ratio > 1.5:
-                if avg_brightness > 120:
-                    return "Projector"
-                else:
-                    return "Bench"
-            
-            # Tall images might be pipes
-            if aspect_ratio < 0.7:
-                return "Pipe"
-            
-            # Default based on brightness
-            if avg_brightness < 100:
-                return "Socket"
-            elif avg_brightness > 180:
-                return "Chair"
-            else:
-                return "Other"
-                
-        except Exception as e:
-            print(f"Error in rule-based classification: {e}")
-            return "Other"
+        return self._rule_based_classification_batch([image_bytes])[0]
+
+    def _extract_rule_features(self, image_bytes: bytes):
+        """
+        Cheap colour/shape features on a downsampled copy of the image:
+        [dominant colour brightness, mean brightness, brightness std, aspect ratio]
+        """
+        image = Image.open(io.BytesIO(image_bytes))
+        width, height = image.size
+        # Let the JPEG decoder scale down (DCT scaling) so we never hold the full-res bitmap
+        image.draft('RGB', (RULE_FEATURE_SIZE, RULE_FEATURE_SIZE))
+        image = image.convert('RGB')
+        image.thumbnail((RULE_FEATURE_SIZE, RULE_FEATURE_SIZE))
+        pixels = np.asarray(image, dtype=np.uint8).reshape(-1, 3)
+        image.close()
+
+        # Quantized colour histogram (16 levels per channel -> 4096 bins)
+        q = (pixels >> 4).astype(np.int32)
+        bins = np.bincount((q[:, 0] << 8) | (q[:, 1] << 4) | q[:, 2], minlength=4096)
+        dominant = int(np.argmax(bins))
+        dominant_rgb = np.array([dominant >> 8, (dominant >> 4) & 15, dominant & 15]) * 16 + 8
+
+        brightness = pixels.mean(axis=1)
+        aspect_ratio = width / height if height > 0 else 1
+        return [dominant_rgb.mean(), brightness.mean(), brightness.std(), aspect_ratio]
+
+    def _rule_based_classification_batch(self, images: List[bytes]) -> List[str]:
+        """Vectorized heuristic rules over a batch of images."""
+        if not NUMPY_AVAILABLE:
+            print("⚠️  NumPy not available for rule-based classification.")
+            return ["Other"] * len(images)
+
+        features = np.full((len(images), 4), np.nan)
+        for i, image_bytes in enumerate(images):
+            try:
+                features[i] = self._extract_rule_features(image_bytes)
+            except Exception as e:
+                print(f"Error in rule-based classification: {e}")
+
+        avg_brightness = features[:, 0]
+        aspect_ratio = features[:, 3]
+        square = (aspect_ratio > 0.8) & (aspect_ratio < 1.2)
+        wide = aspect_ratio > 1.5
 
+        # Simple heuristics based on image properties, first match wins
+        # These are basic rules - actual ML would be much better
+        conditions = [
+            np.isnan(avg_brightness),               # Unreadable image
+            avg_brightness < 80,                    # Very dark images might be sockets/electrical
+            square & (avg_brightness > 150),        # Square-ish images might be furniture
+            square,
+            wide & (avg_brightness > 120),          # Wide images might be projectors or benches
+            wide,
+            aspect_ratio < 0.7,                     # Tall images might be pipes
+            avg_brightness < 100,                   # Default based on brightness
+            avg_brightness > 180
+        ]
+        choices = ["Other", "Socket", "Chair", "Bench", "Projector", "Bench", "Pipe", "Socket", "Chair"]
+        return np.select(conditions, choices, default="Other").tolist()
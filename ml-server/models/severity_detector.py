@@ -25,6 +25,10 @@ except ImportError:
 SEVERITY_LEVELS = ["Minor", "Moderate", "Severe", "Hazardous"]
 SEVERITY_SCORES = {"Minor": 0.15, "Moderate": 0.40, "Severe": 0.70, "Hazardous": 0.95}
 
+# Edge density thresholds for bumping severity down / up one level
+EDGE_DENSITY_LOW = 0.05
+EDGE_DENSITY_HIGH = 0.25
+
 # Category → base severity mapping
 CATEGORY_BASE_SEVERITY = {
     "Socket":    "Hazardous",
@@ -48,6 +52,14 @@ class SeverityDetector:
         Predict severity from image + category.
         Returns: Tuple of (severity_string, severity_score 0.0-1.0)
         """
+        result = await self.analyze(image_bytes, category)
+        return result["severity"], result["score"]
+
+    async def analyze(self, image_bytes: bytes, category: str = "Other") -> dict:
+        """
+        Predict severity and also return the intermediate signal.
+        Returns: {"severity", "score", "edge_density"} (edge_density None on failure)
+        """
         try:
             image = Image.open(io.BytesIO(image_bytes)).convert('RGB')
             image = image.resize((160, 160))  # Keep memory low
@@ -68,11 +80,11 @@ class SeverityDetector:
             gc.collect()
 
             print(f"✅ [SeverityDetector] Final output: {severity_str} (Score: {severity_score:.2f})")
-            return severity_str, severity_score
+            return {"severity": severity_str, "score": severity_score, "edge_density": edge_density}
 
         except Exception as e:
             print(f"Error in severity detection: {e}")
-            return "Moderate", 0.40
+            return {"severity": "Moderate", "score": 0.40, "edge_density": None}
 
     def _compute_edge_density(self, pil_image: Image.Image) -> float:
         """Use Canny edge detection to estimate structural damage."""
@@ -103,14 +115,14 @@ class SeverityDetector:
         """Shift severity up or down based on edge density."""
         idx = SEVERITY_LEVELS.index(base_severity)
 
-        if edge_density > 0.25:
+        if edge_density > EDGE_DENSITY_HIGH:
             # High edge density → bump up one level
             idx = min(idx + 1, len(SEVERITY_LEVELS) - 1)
-            print(f"   → Edge density HIGH (>{0.25}) — bumping severity UP")
-        elif edge_density < 0.05:
+            print(f"   → Edge density HIGH (>{EDGE_DENSITY_HIGH}) — bumping severity UP")
+        elif edge_density < EDGE_DENSITY_LOW:
             # Low edge density → bump down one level
             idx = max(idx - 1, 0)
-            print(f"   → Edge density LOW (<{0.05}) — bumping severity DOWN")
+            print(f"   → Edge density LOW (<{EDGE_DENSITY_LOW}) — bumping severity DOWN")
         else:
             print(f"   → Edge density NORMAL — keeping base severity")
 
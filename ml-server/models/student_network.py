@@ -0,0 +1,48 @@
+"""
+Student Network
+Tiny depthwise-separable CNN distilled from the MobileNetV2 category classifier
+(see `python train.py --distill`). Shared by training and serving so both
+build exactly the same architecture.
+"""
+import torch.nn as nn
+
+# Input resolution for the student (the teacher uses 160)
+STUDENT_INPUT_SIZE = 96
+STUDENT_WEIGHTS_PATH = "student.pth"
+STUDENT_META_PATH = "student.json"
+
+
+def _conv_bn(in_ch: int, out_ch: int, stride: int) -> nn.Sequential:
+    return nn.Sequential(
+        nn.Conv2d(in_ch, out_ch, 3, stride, 1, bias=False),
+        nn.BatchNorm2d(out_ch),
+        nn.ReLU(inplace=True)
+    )
+
+
+def _dw_separable(in_ch: int, out_ch: int, stride: int) -> nn.Sequential:
+    return nn.Sequential(
+        # Depthwise
+        nn.Conv2d(in_ch, in_ch, 3, stride, 1, groups=in_ch, bias=False),
+        nn.BatchNorm2d(in_ch),
+        nn.ReLU(inplace=True),
+        # Pointwise
+        nn.Conv2d(in_ch, out_ch, 1, 1, 0, bias=False),
+        nn.BatchNorm2d(out_ch),
+        nn.ReLU(inplace=True)
+    )
+
+
+def build_student(num_classes: int) -> nn.Module:
+    """~30K parameter classifier; a few MFLOPs per image vs ~150 MFLOPs for the teacher at 160x160."""
+    return nn.Sequential(
+        _conv_bn(3, 16, 2),           # 48x48
+        _dw_separable(16, 32, 2),     # 24x24
+        _dw_separable(32, 64, 2),     # 12x12
+        _dw_separable(64, 128, 2),    # 6x6
+        _dw_separable(128, 128, 1),
+        nn.AdaptiveAvgPool2d(1),
+        nn.Flatten(),
+        nn.Dropout(0.2),
+        nn.Linear(128, num_classes)
+    )
@@ -0,0 +1,251 @@
+"""
+Candidate Image Cache
+Bounded on-disk cache of duplicate-detection candidate images, keyed by URL.
+Images are stored already downscaled to the embedding resolution (lossless
+PNG), so a hit costs neither bandwidth nor a full-size decode.
+
+Entries older than CANDIDATE_CACHE_REVALIDATE_SECONDS are revalidated with
+If-None-Match / If-Modified-Since; a 304 keeps the cached copy. The cache is
+kept under CANDIDATE_CACHE_MAX_MB by evicting least recently used entries.
+All pre-fork workers share the directory, so the size and the LRU order (file
+mtimes, bumped on every hit) are read from disk before each eviction rather
+than tracked per process; the bound holds for the directory as a whole.
+
+The `timeout` passed to fetch() bounds the whole download (wall clock), not
+just each socket read, so a slow-dripping image host cannot hold a request
+past its deadline.
+"""
+import hashlib
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+import requests
+from PIL import Image
+
+DOWNLOAD_CHUNK_BYTES = 64 * 1024
+
+
+class CandidateImageCache:
+    def __init__(self, image_size: int):
+        self.image_size = image_size
+        self.cache_dir = os.environ.get("CANDIDATE_CACHE_DIR", "candidate_cache")
+        self.max_bytes = int(float(os.environ.get("CANDIDATE_CACHE_MAX_MB", 200)) * 1024 * 1024)
+        self.revalidate_after = float(os.environ.get("CANDIDATE_CACHE_REVALIDATE_SECONDS", 3600))
+        # Serializes eviction between this worker's pipeline threads
+        self._lock = threading.Lock()
+        self.counters = {
+            "hits": 0,
+            "misses": 0,
+            "revalidated": 0,
+            "refreshed": 0,
+            "stale_served": 0,
+            "evictions": 0,
+            "bytes_downloaded": 0
+        }
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def _key(self, url: str) -> str:
+        return f"{hashlib.sha256(url.encode('utf-8')).hexdigest()}-{self.image_size}"
+
+    def _paths(self, key: str):
+        return os.path.join(self.cache_dir, key + ".png"), os.path.join(self.cache_dir, key + ".json")
+
+    def _scan(self):
+        """(key -> size in bytes, least recently used first; total bytes) of the whole directory."""
+        index = OrderedDict()
+        if not os.path.isdir(self.cache_dir):
+            return index, 0
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if name.endswith(".png"):
+                try:
+                    stat = os.stat(os.path.join(self.cache_dir, name))
+                except OSError:
+                    # Evicted by another worker since the listing
+                    continue
+                entries.append((stat.st_mtime, name[:-4], stat.st_size))
+        for _, key, size in sorted(entries):
+            index[key] = size
+        return index, sum(index.values())
+
+    def fetch(self, url: str, timeout: float = 5) -> Optional[bytes]:
+        """Downscaled candidate image bytes (PNG), from cache or network; None on failure."""
+        if not self.enabled:
+            return self._download(url, timeout)
+
+        key = self._key(url)
+        image_path, meta_path = self._paths(key)
+        # Another worker may have cached it; the files themselves are the index
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+            with open(image_path, "rb") as f:
+                image_bytes = f.read()
+            cached = True
+        except (OSError, ValueError):
+            cached = False
+
+        if cached:
+            if time.time() - meta.get("validated_at", 0) < self.revalidate_after:
+                self.counters["hits"] += 1
+                self._touch(image_path)
+                return image_bytes
+            return self._revalidate(url, key, meta, image_bytes, timeout)
+
+        self.counters["misses"] += 1
+        return self._download_and_store(url, key, timeout)
+
+    @staticmethod
+    def _get(url: str, timeout: float, headers: Optional[dict] = None):
+        """GET with `timeout` as a wall-clock bound on the whole transfer; returns (response, body)."""
+        give_up_at = time.monotonic() + timeout
+        with requests.get(url, headers=headers, timeout=timeout, stream=True) as resp:
+            chunks = []
+            for chunk in resp.iter_content(DOWNLOAD_CHUNK_BYTES):
+                chunks.append(chunk)
+                if time.monotonic() > give_up_at:
+                    raise TimeoutError(f"download exceeded {timeout:.2f}s")
+            return resp, b"".join(chunks)
+
+    def _revalidate(self, url: str, key: str, meta: dict, image_bytes: bytes, timeout: float) -> bytes:
+        headers = {}
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+        try:
+            resp, content = self._get(url, timeout, headers)
+        except Exception as e:
+            print(f"⚠️ [CandidateCache] Revalidation failed, serving cached copy: {e}")
+            self.counters["stale_served"] += 1
+            return image_bytes
+
+        image_path, _ = self._paths(key)
+        if resp.status_code == 304:
+            self.counters["revalidated"] += 1
+            meta["validated_at"] = time.time()
+            try:
+                self._write_meta(key, meta)
+            except OSError as e:
+                print(f"⚠️ [CandidateCache] Could not update cache metadata: {e}")
+            self._touch(image_path)
+            return image_bytes
+        if resp.status_code == 200:
+            self.counters["refreshed"] += 1
+            return self._store(url, key, resp, content) or image_bytes
+
+        self.counters["stale_served"] += 1
+        return image_bytes
+
+    def _download(self, url: str, timeout: float) -> Optional[bytes]:
+        try:
+            resp, content = self._get(url, timeout)
+        except Exception as e:
+            print(f"⚠️ [CandidateCache] Failed to download candidate image: {e}")
+            return None
+        if resp.status_code != 200:
+            return None
+        self.counters["bytes_downloaded"] += len(content)
+        return content
+
+    def _download_and_store(self, url: str, key: str, timeout: float) -> Optional[bytes]:
+        try:
+            resp, content = self._get(url, timeout)
+        except Exception as e:
+            print(f"⚠️ [CandidateCache] Failed to download candidate image: {e}")
+            return None
+        if resp.status_code != 200:
+            return None
+        return self._store(url, key, resp, content)
+
+    def _store(self, url: str, key: str, resp, content: bytes) -> Optional[bytes]:
+        """Downscale to the embedding resolution and write atomically."""
+        self.counters["bytes_downloaded"] += len(content)
+        try:
+            with Image.open(io.BytesIO(content)) as image:
+                # Same resampling as transforms.Resize, so embeddings are unchanged
+                small = image.convert("RGB").resize((self.image_size, self.image_size), Image.BILINEAR)
+            buffer = io.BytesIO()
+            small.save(buffer, format="PNG")
+            image_bytes = buffer.getvalue()
+        except Exception as e:
+            print(f"⚠️ [CandidateCache] Could not decode candidate image: {e}")
+            return None
+
+        image_path, _ = self._paths(key)
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            self._atomic_write(image_path, image_bytes)
+            self._write_meta(key, {
+                "url": url,
+                "etag": resp.headers.get("ETag"),
+                "last_modified": resp.headers.get("Last-Modified"),
+                "validated_at": time.time()
+            })
+        except OSError as e:
+            # The download itself succeeded; a failed cache write must not fail the duplicate check
+            print(f"⚠️ [CandidateCache] Could not cache candidate image: {e}")
+            return image_bytes
+
+        with self._lock:
+            self._evict_locked()
+        return image_bytes
+
+    def _write_meta(self, key: str, meta: dict):
+        _, meta_path = self._paths(key)
+        self._atomic_write(meta_path, json.dumps(meta).encode("utf-8"))
+
+    def _atomic_write(self, path: str, data: bytes):
+        """Write via a uniquely named temp file (safe across processes and pipeline threads)."""
+        with tempfile.NamedTemporaryFile(dir=self.cache_dir, prefix=".", suffix=".tmp", delete=False) as f:
+            tmp_path = f.name
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+
+    def _touch(self, image_path: str):
+        try:
+            # Recency lives in the mtime, so every worker (and a restart) sees the same LRU order
+            os.utime(image_path)
+        except OSError:
+            pass
+
+    def _evict_locked(self):
+        # Rescanned every time: other workers add entries this process never saw
+        index, total_bytes = self._scan()
+        while total_bytes > self.max_bytes and index:
+            key, size = index.popitem(last=False)
+            total_bytes -= size
+            self.counters["evictions"] += 1
+            for path in self._paths(key):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def stats(self) -> dict:
+        lookups = self.counters["hits"] + self.counters["revalidated"] + self.counters["misses"]
+        index, total_bytes = self._scan() if self.enabled else ({}, 0)
+        return {
+            **self.counters,
+            "enabled": self.enabled,
+            "entries": len(index),
+            "size_mb": round(total_bytes / (1024 * 1024), 2),
+            "hit_rate": (self.counters["hits"] + self.counters["revalidated"]) / lookups if lookups else None
+        }
@@ -0,0 +1,55 @@
+"""
+Request Deadline
+Time budget of one request, measured on the monotonic clock from when the
+request arrived, so time spent waiting for memory admission or a pipeline
+thread counts against it. Passed down to every stage: required stages
+(category, severity, priority) always run; optional work (embedding,
+duplicate detection, remaining candidates) is skipped or truncated when the
+budget runs low, and the response lists those stages under "degraded".
+
+Budget: the caller's X-Request-Deadline-Ms header (RPC: "deadline_ms"),
+else ML_REQUEST_DEADLINE_MS; capped by ML_REQUEST_DEADLINE_MAX_MS.
+"""
+import os
+import time
+from typing import Optional
+
+DEFAULT_DEADLINE_MS = float(os.environ.get("ML_REQUEST_DEADLINE_MS", 30000))
+MAX_DEADLINE_MS = float(os.environ.get("ML_REQUEST_DEADLINE_MAX_MS", 120000))
+# Time kept back for everything after the last optional stage (feature store, serialization, network)
+RESERVE_MS = float(os.environ.get("ML_DEADLINE_RESERVE_MS", 300))
+# Minimum budget left to start embedding + duplicate detection at all
+DUPLICATE_MIN_BUDGET_MS = float(os.environ.get("ML_DUPLICATE_MIN_BUDGET_MS", 1000))
+
+
+class Deadline:
+    def __init__(self, budget_ms: Optional[float] = None):
+        budget_ms = DEFAULT_DEADLINE_MS if budget_ms is None else budget_ms
+        self.budget_ms = max(0.0, min(float(budget_ms), MAX_DEADLINE_MS))
+        self.started = time.monotonic()
+        self.expires_at = self.started + self.budget_ms / 1000
+
+    @classmethod
+    def from_header(cls, value) -> "Deadline":
+        """Parse a client-supplied budget in ms (falls back to the default when missing or invalid)."""
+        try:
+            return cls(float(value)) if value not in (None, "") else cls()
+        except (TypeError, ValueError):
+            return cls()
+
+    def remaining(self) -> float:
+        """Seconds left for optional work (after the reserve), never negative."""
+        return max(0.0, self.expires_at - time.monotonic() - RESERVE_MS / 1000)
+
+    def remaining_ms(self) -> float:
+        return self.remaining() * 1000
+
+    def allows(self, needed_ms: float) -> bool:
+        return self.remaining_ms() >= needed_ms
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def elapsed_ms(self) -> float:
+        return (time.monotonic() - self.started) * 1000
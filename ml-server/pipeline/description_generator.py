@@ -2,12 +2,24 @@
 Auto Description Generator Service
 Generates short issue summary from image and category
 """
+import os
 from typing import Optional
 from PIL import Image
 import io
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+# Template prototypes in the category classifier's feature space (see build_description_index.py)
+DESCRIPTION_INDEX_PATH = "description_index.npz"
 
 class DescriptionGenerator:
-    def __init__(self):
+    def __init__(self, feature_source: Optional[str] = None):
+        # feature_source of the classifier whose features are passed to generate();
+        # an index built from another model is ignored
+        self.feature_source = feature_source
         # Template descriptions based on category
         self.category_templates = {
             'Chair': [
@@ -47,14 +59,57 @@ class DescriptionGenerator:
                 "Repair needed"
             ]
         }
+        # category -> (prototype matrix, template texts)
+        self.template_index = {}
+        self.load_index()
+
+    def load_index(self, path: str = DESCRIPTION_INDEX_PATH):
+        """Load precomputed template prototypes, grouped per category for a single matmul lookup."""
+        if not NUMPY_AVAILABLE or self.feature_source is None or not os.path.exists(path):
+            return
+        try:
+            data = np.load(path)
+            # Prototypes only make sense for the model that extracted them
+            source = str(data["source"]) if "source" in data else None
+            if source != self.feature_source:
+                print(f"⚠️ Description index was built from {source}; rebuild it for {self.feature_source}. Ignoring it.")
+                return
+            prototypes, categories, texts = data["prototypes"], data["categories"], data["texts"]
+            index = {}
+            for category in set(categories.tolist()):
+                # Drop entries whose template text no longer exists
+                rows = [i for i, c in enumerate(categories) if c == category
+                        and texts[i] in self.category_templates.get(category, [])]
+                if rows:
+                    index[category] = (prototypes[rows], [str(texts[i]) for i in rows])
+            self.template_index = index
+            print(f"✅ Description index loaded ({sum(len(t) for _, t in index.values())} templates)")
+        except Exception as e:
+            print(f"⚠️ Could not load description index: {e}")
+            self.template_index = {}
+
+    def _select_template(self, category: str, features) -> Optional[str]:
+        """Nearest template prototype to the image's classifier features (cosine similarity)."""
+        if features is None or category not in self.template_index:
+            return None
+        prototypes, texts = self.template_index[category]
+        features = np.asarray(features, dtype=np.float32).reshape(-1)
+        if prototypes.shape[1] != features.shape[0]:
+            return None
+        scores = prototypes @ (features / (np.linalg.norm(features) + 1e-8))
+        return texts[int(np.argmax(scores))]
     
     async def generate(
         self,
         image_bytes: bytes,
-        category: Optional[str] = None
+        category: Optional[str] = None,
+        features=None
     ) -> str:
         """
         Generate description from image and category
+        features: the category classifier's head input for this image
+        (category_info["features"]); when given, the closest template for the
+        category is chosen (no extra model pass).
         Returns: auto-generated description string
         """
         try:
@@ -63,9 +118,8 @@ class DescriptionGenerator:
             
             print(f"🔍 [DescriptionGenerator] Selecting template for category: {category}")
             if category and category in self.category_templates:
-                # Return first template for the category
-                # In production, could analyze image to select best template
-                desc = self.category_templates[category][0]
+                # Pick the template closest to the image content, else the first one
+                desc = self._select_template(category, features) or self.category_templates[category][0]
             else:
                 desc = "Infrastructure damage requiring attention"
                 
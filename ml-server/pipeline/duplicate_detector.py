@@ -8,12 +8,13 @@ from PIL import Image
 import io
 try:
     import numpy as np
+    from pipeline.embedding_codec import EmbeddingTagMismatch, decode_embedding
     NUMPY_AVAILABLE = True
 except ImportError:
     NUMPY_AVAILABLE = False
 
-import hashlib
-import requests
+from pipeline.candidate_cache import CandidateImageCache
+from models.backbones import embedding_config
 
 try:
     import torch
@@ -27,10 +28,15 @@ except ImportError:
 class DuplicateDetector:
     def __init__(self):
         self.similarity_threshold = 0.85
+        # Embedding backbone/resolution (EMBEDDING_BACKBONE / EMBEDDING_INPUT_SIZE)
+        self.config = embedding_config()
+        self.embedding_dim = None
+        # Candidate images are cached on disk, pre-downscaled to the embedding input size
+        self.candidate_cache = CandidateImageCache(image_size=self.config["input_size"])
         if TORCH_AVAILABLE:
             self.device = torch.device('cpu')
             self.transform = transforms.Compose([
-                transforms.Resize((224, 224)),
+                transforms.Resize((self.config["input_size"], self.config["input_size"])),
                 transforms.ToTensor(),
                 transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225])
             ])
@@ -41,20 +47,22 @@ class DuplicateDetector:
             self.model = None
 
     def load_model(self):
-        """Load MobileNetV2 for feature extraction (Stage 3)"""
+        """Load the pretrained embedding backbone for feature extraction (Stage 3)"""
         if not TORCH_AVAILABLE:
             return
         try:
-            from torchvision.models import mobilenet_v2
-            # Use pretrained mobilenet just as a feature extractor
-            self.model = mobilenet_v2(pretrained=True)
+            from models.backbones import build_model, get_head, as_feature_extractor
+            name = self.config["backbone"]
+            # Use the pretrained backbone just as a feature extractor
+            self.model = build_model(name, pretrained=True)
+            self.embedding_dim = get_head(self.model, name).in_features
             # Remove the classification head to just get embeddings
-            self.model.classifier = torch.nn.Identity()
+            as_feature_extractor(self.model, name)
             self.model.eval()
             self.model.to(self.device)
-            print("✅ Duplicate Detector (MobileNet Feature Extractor) initialized")
+            print(f"✅ Duplicate Detector ({self.config['tag']} feature extractor) initialized")
         except Exception as e:
-            print(f"⚠️ Could not load MobileNet for duplicate detection: {e}")
+            print(f"⚠️ Could not load {self.config['backbone']} for duplicate detection: {e}")
             self.model = None
 
     async def detect(
@@ -63,7 +71,9 @@ class DuplicateDetector:
         category: str,
         block: Optional[str] = None,
         classroom: Optional[str] = None,
-        candidates: Optional[List[dict]] = None
+        candidates: Optional[List[dict]] = None,
+        target_embedding=None,
+        deadline=None
     ) -> dict:
         """
         Detect if image is duplicate of existing complaints using 3-stage pipeline.
@@ -76,8 +86,12 @@ class DuplicateDetector:
                "category": "...", 
                "created_at": <datetime or timestamp>,
                "image_bytes": <bytes> or "image_url": "..." # assuming we can fetch bytes for Stage 3
+               or "embedding": "<base64>"  # precomputed, see pipeline.embedding_codec
             }
         ]
+        target_embedding: embedding of the upload if the caller already computed it.
+        deadline: pipeline.deadline.Deadline; candidates that would need a download
+        are skipped once it runs out, and the result is flagged "truncated".
         """
         if not candidates:
             return {
@@ -100,7 +114,7 @@ class DuplicateDetector:
                 }
 
             # Stage 3: Image Similarity
-            if not self.model or not TORCH_AVAILABLE:
+            if target_embedding is None and (not self.model or not TORCH_AVAILABLE):
                 return {
                     "is_duplicate": False,
                     "similarity_score": 0.0,
@@ -108,41 +122,40 @@ class DuplicateDetector:
                     "message": "Model not available for image similarity."
                 }
 
-            print(f"🔍 [DuplicateDetector] Fetching embedding for current image...")
-            # Get target image embedding
-            target_embedding = self._get_embedding(image_bytes)
+            if target_embedding is None:
+                print(f"🔍 [DuplicateDetector] Fetching embedding for current image...")
+                # Get target image embedding
+                target_embedding = self.embed(image_bytes)
             if target_embedding is None:
                 print(f"⚠️ [DuplicateDetector] Failed to get embedding.")
                 return {"is_duplicate": False, "similarity_score": 0.0, "similar_complaint_id": None}
 
             best_score = 0.0
             best_id = None
+            checked = 0
+            truncated = False
+
+            # Precomputed embeddings cost nothing; compare them before any candidate that needs a download
+            if deadline is not None:
+                filtered_candidates = sorted(filtered_candidates, key=lambda c: not c.get("embedding"))
 
             print(f"🔍 [DuplicateDetector] Comparing against {len(filtered_candidates)} candidate(s) via Cosine Similarity...")
             for candidate in filtered_candidates:
-                candidate_img_bytes = candidate.get("image_bytes")
-                
-                # Fetch dynamically if we only have URL
-                if not candidate_img_bytes and candidate.get("image_url"):
-                    try:
-                        print(f"📥 [DuplicateDetector] Downloading candidate image: {candidate.get('complaint_id')}")
-                        resp = requests.get(candidate["image_url"], timeout=5)
-                        if resp.status_code == 200:
-                            candidate_img_bytes = resp.content
-                    except Exception as e:
-                        print(f"⚠️ [DuplicateDetector] Failed to download candidate image: {e}")
-                        continue
-                        
-                if not candidate_img_bytes:
-                    continue
-                
-                candidate_embedding = self._get_embedding(candidate_img_bytes)
+                timeout = 5
+                if deadline is not None and not candidate.get("embedding"):
+                    if deadline.expired:
+                        truncated = True
+                        print(f"⏱️ [DuplicateDetector] Deadline reached after {checked}/{len(filtered_candidates)} candidates.")
+                        break
+                    # Never let one slow image host overrun the request
+                    timeout = min(timeout, deadline.remaining())
+                checked += 1
+                candidate_embedding = self._get_candidate_embedding(candidate, timeout=timeout)
                 if candidate_embedding is None:
                     continue
                 
                 # Compute Cosine Similarity
-                sim = torch.nn.functional.cosine_similarity(target_embedding, candidate_embedding)
-                score = sim.item()
+                score = self._cosine_similarity(target_embedding, candidate_embedding)
                 
                 if score > best_score:
                     best_score = score
@@ -155,11 +168,15 @@ class DuplicateDetector:
             else:
                 print(f"✅ [DuplicateDetector] No duplicates detected. (Highest match: {best_score:.4f})")
 
-            return {
+            result = {
                 "is_duplicate": is_dup,
                 "similarity_score": best_score,
                 "similar_complaint_id": best_id if is_dup else None
             }
+            if truncated:
+                result["truncated"] = True
+                result["candidates_checked"] = checked
+            return result
 
         except Exception as e:
             print(f"Error in duplicate detection: {e}")
@@ -169,7 +186,48 @@ class DuplicateDetector:
                 "similar_complaint_id": None
             }
 
-    def _get_embedding(self, image_bytes: bytes):
+    def _get_candidate_embedding(self, candidate: dict, timeout: float = 5):
+        """Resolve a candidate to an embedding: precomputed vector, raw bytes, or URL download."""
+        if candidate.get("embedding"):
+            try:
+                # Same dimension is not enough: several backbones/resolutions produce 1280-d vectors
+                embedding = decode_embedding(candidate["embedding"], expected_tag=self.config["tag"])
+                if self.embedding_dim is None or embedding.shape[0] == self.embedding_dim:
+                    return embedding
+            except EmbeddingTagMismatch:
+                # Stored with a different embedding backbone; recompute from the image
+                pass
+            except Exception as e:
+                print(f"⚠️ [DuplicateDetector] Invalid embedding for candidate {candidate.get('complaint_id')}: {e}")
+                # Fall through to the image if one was also supplied
+
+        if not self.model or not TORCH_AVAILABLE:
+            return None
+
+        candidate_img_bytes = candidate.get("image_bytes")
+
+        # Fetch dynamically if we only have URL (disk cache first)
+        if not candidate_img_bytes and candidate.get("image_url"):
+            print(f"📥 [DuplicateDetector] Fetching candidate image: {candidate.get('complaint_id')}")
+            candidate_img_bytes = self.candidate_cache.fetch(candidate["image_url"], timeout=timeout)
+
+        if not candidate_img_bytes:
+            return None
+        return self.embed(candidate_img_bytes)
+
+    @staticmethod
+    def _cosine_similarity(a, b) -> float:
+        if a.shape != b.shape:
+            return 0.0
+        denom = float(np.linalg.norm(a) * np.linalg.norm(b))
+        if denom == 0.0:
+            return 0.0
+        return float(np.dot(a, b)) / denom
+
+    def embed(self, image_bytes: bytes):
+        """Return the image embedding as a 1-D float32 numpy array (None on failure)."""
+        if not self.model or not TORCH_AVAILABLE:
+            return None
         try:
             image = Image.open(io.BytesIO(image_bytes)).convert('RGB')
             tensor = self.transform(image).unsqueeze(0).to(self.device)
@@ -179,8 +237,7 @@ class DuplicateDetector:
             image.close()
             import gc
             gc.collect()
-            return embedding
+            return embedding[0].cpu().numpy().astype(np.float32)
         except Exception as e:
             print(f"Failed to get embedding: {e}")
             return None
-
@@ -0,0 +1,98 @@
+"""
+Embedding Codec
+Compact wire format for image embeddings so candidates can be sent as
+vectors instead of image URLs.
+
+Layout (little-endian): magic "EM" | dtype code (u8) | dim (u16) | scale (f32) | payload
+  - float16: payload = dim * 2 bytes, scale unused (1.0)
+  - int8:    payload = dim * 1 byte, value = int8 * scale (symmetric quantization)
+Tagged layout: magic "ET" | dtype | dim | scale | tag id (u32) | payload, where the
+tag id is the CRC32 of the embedding config tag (e.g. "mobilenet_v2@224"). Backbones
+of different architecture or resolution can share a dimension, so the tag is what
+tells whether two vectors are comparable; untagged "EM" blobs predate it and were
+all produced by LEGACY_TAG.
+The base64 form of this blob is what travels in JSON / form fields.
+"""
+import base64
+import struct
+import zlib
+from typing import Optional
+
+import numpy as np
+
+MAGIC = b"EM"
+TAGGED_MAGIC = b"ET"
+HEADER = struct.Struct("<2sBHf")
+TAG_ID = struct.Struct("<I")
+DTYPE_CODES = {"float16": 1, "int8": 2}
+CODE_DTYPES = {v: k for k, v in DTYPE_CODES.items()}
+# Embedding config of every untagged blob (the only one before configurable backbones)
+LEGACY_TAG = "mobilenet_v2@224"
+
+
+class EmbeddingTagMismatch(ValueError):
+    """The embedding was produced by a different backbone / resolution than expected."""
+
+
+def tag_id(tag: str) -> int:
+    return zlib.crc32(tag.encode("utf-8"))
+
+
+def pack_embedding(vector, dtype: str = "int8", tag: Optional[str] = None) -> bytes:
+    """Encode a 1-D float vector into the binary wire format (tagged when `tag` is given)."""
+    if dtype not in DTYPE_CODES:
+        raise ValueError(f"Unsupported embedding dtype '{dtype}' (expected one of {list(DTYPE_CODES)})")
+
+    vec = np.asarray(vector, dtype=np.float32).reshape(-1)
+    if dtype == "float16":
+        scale = 1.0
+        payload = vec.astype("<f2").tobytes()
+    else:
+        max_abs = float(np.max(np.abs(vec))) if vec.size else 0.0
+        scale = max_abs / 127.0 if max_abs > 0 else 1.0
+        payload = np.clip(np.rint(vec / scale), -127, 127).astype(np.int8).tobytes()
+
+    if tag is None:
+        return HEADER.pack(MAGIC, DTYPE_CODES[dtype], vec.size, scale) + payload
+    return HEADER.pack(TAGGED_MAGIC, DTYPE_CODES[dtype], vec.size, scale) + TAG_ID.pack(tag_id(tag)) + payload
+
+
+def unpack_embedding(blob: bytes, expected_tag: Optional[str] = None) -> np.ndarray:
+    """
+    Decode the binary wire format back into a float32 vector.
+    expected_tag: raise EmbeddingTagMismatch unless the blob was produced by that config.
+    """
+    if len(blob) < HEADER.size:
+        raise ValueError("Embedding blob too short")
+    magic, code, dim, scale = HEADER.unpack_from(blob)
+    if magic not in (MAGIC, TAGGED_MAGIC) or code not in CODE_DTYPES:
+        raise ValueError("Not an encoded embedding")
+
+    offset = HEADER.size
+    blob_tag_id = tag_id(LEGACY_TAG)
+    if magic == TAGGED_MAGIC:
+        if len(blob) < offset + TAG_ID.size:
+            raise ValueError("Embedding blob too short")
+        blob_tag_id, = TAG_ID.unpack_from(blob, offset)
+        offset += TAG_ID.size
+    if expected_tag is not None and blob_tag_id != tag_id(expected_tag):
+        raise EmbeddingTagMismatch(f"Embedding was not produced by {expected_tag}")
+
+    payload = blob[offset:]
+    if CODE_DTYPES[code] == "float16":
+        vec = np.frombuffer(payload, dtype="<f2", count=dim).astype(np.float32)
+    else:
+        vec = np.frombuffer(payload, dtype=np.int8, count=dim).astype(np.float32) * scale
+    return vec
+
+
+def encode_embedding(vector, dtype: str = "int8", tag: Optional[str] = None) -> str:
+    """Encode a vector as a base64 string (for JSON / form fields)."""
+    return base64.b64encode(pack_embedding(vector, dtype, tag)).decode("ascii")
+
+
+def decode_embedding(data, expected_tag: Optional[str] = None) -> np.ndarray:
+    """Decode either the base64 string form or the raw binary form."""
+    if isinstance(data, str):
+        data = base64.b64decode(data)
+    return unpack_embedding(bytes(data), expected_tag)
@@ -0,0 +1,359 @@
+"""
+Severity Feature Store
+Persists the intermediate signals of every pipeline run (edge density,
+category probability vector, image embedding, classifier head input) so severity / priority rules
+can be re-applied to all historical complaints in one vectorized pass,
+without re-decoding any image.
+
+Storage: append-only columnar .npz segments under FEATURE_STORE_DIR, one
+series per server worker (seg-<WORKER_ID>-<timestamp>.npz). New records are
+buffered in memory and written as a new segment by a background thread
+(every FEATURE_STORE_FLUSH_EVERY records or FEATURE_STORE_FLUSH_INTERVAL
+seconds, and on shutdown), so the request path never rewrites old data.
+Once a worker has more than FEATURE_STORE_MAX_SEGMENTS segments they are
+compacted into one, keeping at most FEATURE_STORE_MAX_RECORDS (newest first)
+and nothing older than FEATURE_STORE_MAX_AGE_DAYS (0 = no age limit).
+Rescoring reads every worker's segments.
+"""
+import atexit
+import glob
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from models.category_classifier import LOW_CONFIDENCE_THRESHOLD
+from models.severity_detector import (
+    SEVERITY_LEVELS, SEVERITY_SCORES, CATEGORY_BASE_SEVERITY, EDGE_DENSITY_LOW, EDGE_DENSITY_HIGH
+)
+from pipeline.priority_logic import PRIORITY_HIGH_THRESHOLD, PRIORITY_MEDIUM_THRESHOLD
+
+# The only columns rescoring needs (embeddings and classifier features are never loaded for it)
+RULE_COLUMNS = ("ids", "category", "probabilities", "edge_density", "created_at")
+
+
+class SeverityFeatureStore:
+    def __init__(self, categories: List[str]):
+        self.categories = list(categories)
+        self.store_dir = os.environ.get("FEATURE_STORE_DIR", "feature_store")
+        self.flush_every = int(os.environ.get("FEATURE_STORE_FLUSH_EVERY", 20))
+        self.flush_interval = float(os.environ.get("FEATURE_STORE_FLUSH_INTERVAL", 30))
+        self.max_segments = int(os.environ.get("FEATURE_STORE_MAX_SEGMENTS", 16))
+        self.max_records = int(os.environ.get("FEATURE_STORE_MAX_RECORDS", 100000))
+        self.max_age_days = float(os.environ.get("FEATURE_STORE_MAX_AGE_DAYS", 0))
+        self._lock = threading.Lock()
+        # Serializes segment writes and compaction (background thread vs. explicit flush)
+        self._write_lock = threading.Lock()
+        self._pending: Dict[str, dict] = {}
+        self._wakeup = threading.Event()
+        self._thread = None
+        self.segments_written = 0
+        self.compactions = 0
+        atexit.register(self.flush)
+
+    @property
+    def worker_id(self) -> str:
+        # Each pre-fork worker writes its own segments (WORKER_ID is set by prefork.py)
+        return os.environ.get("WORKER_ID", "0")
+
+    def _segment_paths(self, worker_id: Optional[str] = None) -> List[str]:
+        """Segments (oldest first) of one worker, or of all workers; legacy shard-*.npz files included."""
+        pattern = f"seg-{worker_id}-*.npz" if worker_id is not None else "seg-*.npz"
+        # Names end in the write timestamp (ns), so this sorts a worker's segments by age
+        paths = sorted(
+            glob.glob(os.path.join(self.store_dir, pattern)),
+            key=lambda p: int(os.path.basename(p)[:-len(".npz")].rsplit("-", 1)[1])
+        )
+        legacy = f"shard-{worker_id}.npz" if worker_id is not None else "shard-*.npz"
+        return sorted(glob.glob(os.path.join(self.store_dir, legacy))) + paths
+
+    def add(self, record_id: str, category: str, probabilities: Optional[List[float]],
+            edge_density: Optional[float], embedding=None,
+            classifier_features=None, features_source: Optional[str] = None):
+        """Buffer the signals of one pipeline run (written by the background flusher)."""
+        row = {
+            "id": record_id,
+            "category": self.categories.index(category) if category in self.categories else self.categories.index("Other"),
+            "probabilities": np.asarray(probabilities, dtype=np.float32) if probabilities is not None else None,
+            "edge_density": np.nan if edge_density is None else float(edge_density),
+            "embedding": np.asarray(embedding, dtype=np.float16) if embedding is not None else None,
+            "classifier_features": np.asarray(classifier_features, dtype=np.float16) if classifier_features is not None else None,
+            "features_source": features_source if classifier_features is not None else "",
+            "created_at": time.time()
+        }
+        with self._lock:
+            self._pending[record_id] = row
+            pending = len(self._pending)
+        self._ensure_thread()
+        if pending >= self.flush_every:
+            self._wakeup.set()
+
+    def _ensure_thread(self):
+        # Started lazily so it lives in the serving (forked) worker, not the parent
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._loop, name="feature-store-flusher", daemon=True)
+            self._thread.start()
+
+    def _loop(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"⚠️ [FeatureStore] Flush failed: {e}")
+
+    def _find(self, record_id: str) -> Optional[dict]:
+        """
+        Newest row for an id: pending buffer first, then every worker's segments
+        newest first (a feedback request may reach a different pre-fork worker than
+        the prediction did; rows another worker has not flushed yet are not visible).
+        """
+        with self._lock:
+            row = self._pending.get(record_id)
+        if row is not None:
+            return row
+        for path in reversed(self._segment_paths()):
+            try:
+                with np.load(path) as data:
+                    matches = np.nonzero(data["ids"] == record_id)[0]
+                    if len(matches):
+                        return self._read_rows(data, path, [int(matches[-1])])[0]
+            except (OSError, KeyError, IndexError):
+                # Removed by a concurrent compaction
+                continue
+        return None
+
+    def get_embedding(self, record_id: str):
+        """Stored embedding for a record (None if unknown)."""
+        row = self._find(record_id)
+        if row is None or row["embedding"] is None:
+            return None
+        return np.asarray(row["embedding"], dtype=np.float32)
+
+    def get_classifier_features(self, record_id: str, source: str):
+        """
+        Stored classifier head input for a record, only if it was produced by the
+        model identified by `source` (None otherwise). The embedding is never a
+        substitute: it comes from a different network.
+        """
+        row = self._find(record_id)
+        if row is None or row["classifier_features"] is None or row["features_source"] != source:
+            return None
+        return np.asarray(row["classifier_features"], dtype=np.float32)
+
+    def flush(self):
+        """Write buffered rows as a new segment, compacting when there are too many."""
+        with self._write_lock:
+            with self._lock:
+                rows = list(self._pending.values())
+                self._pending = {}
+            if rows:
+                os.makedirs(self.store_dir, exist_ok=True)
+                self._write_segment(rows)
+            if len(self._segment_paths(self.worker_id)) > self.max_segments:
+                self._compact()
+
+    def _write_segment(self, rows: List[dict]):
+        name = f"seg-{self.worker_id}-{time.time_ns()}.npz"
+        path = os.path.join(self.store_dir, name)
+        # Dot-prefixed so readers globbing seg-*.npz never see a half-written file
+        tmp_path = os.path.join(self.store_dir, f".{name}.tmp.npz")
+        np.savez(tmp_path, **self._to_columns(rows))
+        os.replace(tmp_path, path)
+        self.segments_written += 1
+
+    def _compact(self):
+        """Merge this worker's segments into one, applying the retention limits."""
+        paths = self._segment_paths(self.worker_id)
+        latest = {}
+        for path in paths:
+            for row in self._read_segment(path):
+                latest[row["id"]] = row
+        rows = self._retain(list(latest.values()))
+        if rows:
+            self._write_segment(rows)
+        for path in paths:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        self.compactions += 1
+
+    def _retain(self, rows: List[dict]) -> List[dict]:
+        rows.sort(key=lambda r: r["created_at"], reverse=True)
+        if self.max_age_days > 0:
+            cutoff = time.time() - self.max_age_days * 86400
+            rows = [r for r in rows if r["created_at"] >= cutoff]
+        return rows[:self.max_records]
+
+    def _to_columns(self, rows: List[dict]) -> dict:
+        n, n_classes = len(rows), len(self.categories)
+        embedding_dim = max((len(r["embedding"]) for r in rows if r["embedding"] is not None), default=0)
+        features_dim = max((len(r["classifier_features"]) for r in rows if r["classifier_features"] is not None), default=0)
+
+        probabilities = np.full((n, n_classes), np.nan, dtype=np.float32)
+        embeddings = np.zeros((n, embedding_dim), dtype=np.float16)
+        has_embedding = np.zeros(n, dtype=bool)
+        classifier_features = np.zeros((n, features_dim), dtype=np.float16)
+        has_classifier_features = np.zeros(n, dtype=bool)
+        for i, r in enumerate(rows):
+            if r["classifier_features"] is not None and len(r["classifier_features"]) == features_dim:
+                classifier_features[i] = r["classifier_features"]
+                has_classifier_features[i] = True
+            if r["probabilities"] is not None and len(r["probabilities"]) == n_classes:
+                probabilities[i] = r["probabilities"]
+            if r["embedding"] is not None and len(r["embedding"]) == embedding_dim:
+                embeddings[i] = r["embedding"]
+                has_embedding[i] = True
+
+        return {
+            "ids": np.array([r["id"] for r in rows]),
+            "category": np.array([r["category"] for r in rows], dtype=np.int8),
+            "probabilities": probabilities,
+            "edge_density": np.array([r["edge_density"] for r in rows], dtype=np.float32),
+            "embeddings": embeddings,
+            "has_embedding": has_embedding,
+            "classifier_features": classifier_features,
+            "has_classifier_features": has_classifier_features,
+            "features_source": np.array([r["features_source"] for r in rows]),
+            "created_at": np.array([r["created_at"] for r in rows], dtype=np.float64),
+            "categories": np.array(self.categories)
+        }
+
+    def _read_segment(self, path: str) -> List[dict]:
+        try:
+            with np.load(path) as data:
+                return self._read_rows(data, path, range(len(data["ids"])))
+        except OSError:
+            # Removed by a concurrent compaction
+            return []
+
+    def _read_rows(self, data, path: str, indices) -> List[dict]:
+        if list(data["categories"]) != self.categories:
+            print(f"⚠️ [FeatureStore] Skipping segment with different categories: {path}")
+            return []
+        ids, category = data["ids"], data["category"]
+        probabilities, edge_density = data["probabilities"], data["edge_density"]
+        embeddings, has_embedding, created_at = data["embeddings"], data["has_embedding"], data["created_at"]
+        # Older segments predate stored classifier features
+        has_features = data["has_classifier_features"] if "has_classifier_features" in data else np.zeros(len(ids), dtype=bool)
+        features = data["classifier_features"] if "classifier_features" in data else None
+        sources = data["features_source"] if "features_source" in data else None
+        rows = []
+        for i in indices:
+            probs = probabilities[i]
+            rows.append({
+                "id": str(ids[i]),
+                "category": int(category[i]),
+                "probabilities": None if np.isnan(probs).any() else probs,
+                "edge_density": float(edge_density[i]),
+                "embedding": embeddings[i] if has_embedding[i] else None,
+                "classifier_features": features[i] if has_features[i] else None,
+                "features_source": str(sources[i]) if has_features[i] else "",
+                "created_at": float(created_at[i])
+            })
+        return rows
+
+    def load_rule_columns(self) -> dict:
+        """
+        RULE_COLUMNS over every shard, newest record per id. Reads just those
+        arrays from each .npz, so the embedding / feature columns stay on disk.
+        """
+        self.flush()
+        parts = {name: [] for name in RULE_COLUMNS}
+        for path in self._segment_paths():
+            try:
+                with np.load(path) as data:
+                    if list(data["categories"]) != self.categories:
+                        print(f"⚠️ [FeatureStore] Skipping segment with different categories: {path}")
+                        continue
+                    columns = {name: data[name] for name in RULE_COLUMNS}
+            except OSError:
+                # Removed by a concurrent compaction
+                continue
+            for name, values in columns.items():
+                parts[name].append(values)
+        if not parts["ids"]:
+            return {
+                "ids": np.array([], dtype=str),
+                "category": np.zeros(0, dtype=np.int8),
+                "probabilities": np.zeros((0, len(self.categories)), dtype=np.float32),
+                "edge_density": np.zeros(0, dtype=np.float32),
+                "created_at": np.zeros(0, dtype=np.float64)
+            }
+        cols = {name: np.concatenate(values) for name, values in parts.items()}
+        # Newest first, then the first occurrence of each id wins
+        newest = np.argsort(-cols["created_at"], kind="stable")
+        _, first = np.unique(cols["ids"][newest], return_index=True)
+        keep = np.sort(newest[first])
+        return {name: values[keep] for name, values in cols.items()}
+
+    def rescore(
+        self,
+        edge_density_low: float = EDGE_DENSITY_LOW,
+        edge_density_high: float = EDGE_DENSITY_HIGH,
+        priority_medium: float = PRIORITY_MEDIUM_THRESHOLD,
+        priority_high: float = PRIORITY_HIGH_THRESHOLD,
+        low_confidence: float = LOW_CONFIDENCE_THRESHOLD,
+        base_severity: Optional[Dict[str, str]] = None,
+        severity_scores: Optional[Dict[str, float]] = None
+    ) -> dict:
+        """
+        Re-apply category / severity / priority rules to every stored record in one
+        NumPy pass. Mirrors CategoryClassifier, SeverityDetector._adjust_severity and
+        PriorityLogic.determine_priority with the given thresholds.
+        """
+        started = time.perf_counter()
+        for name, level in (base_severity or {}).items():
+            if name not in self.categories:
+                raise ValueError(f"Unknown category '{name}' in base_severity")
+            if level not in SEVERITY_LEVELS:
+                raise ValueError(f"Unknown severity '{level}' for {name} (expected one of {SEVERITY_LEVELS})")
+        for level in severity_scores or {}:
+            if level not in SEVERITY_LEVELS:
+                raise ValueError(f"Unknown severity '{level}' in severity_scores (expected one of {SEVERITY_LEVELS})")
+        cols = self.load_rule_columns()
+        base_severity = {**CATEGORY_BASE_SEVERITY, **(base_severity or {})}
+        severity_scores = {**SEVERITY_SCORES, **(severity_scores or {})}
+
+        # Category: argmax of the stored probabilities, "Other" below the confidence floor
+        probs = cols["probabilities"]
+        has_probs = ~np.isnan(probs).any(axis=1)
+        safe_probs = np.where(has_probs[:, None], probs, 0.0)
+        other = self.categories.index("Other")
+        predicted = np.where(safe_probs.max(axis=1) < low_confidence, other, safe_probs.argmax(axis=1))
+        category = np.where(has_probs, predicted, cols["category"])
+
+        # Severity: category base level bumped by edge density. A missing density means
+        # severity detection failed, which SeverityDetector.analyze reports as "Moderate"
+        base_lut = np.array([SEVERITY_LEVELS.index(base_severity.get(c, "Moderate")) for c in self.categories])
+        edge = cols["edge_density"]
+        bump = (edge > edge_density_high).astype(int) - (edge < edge_density_low).astype(int)
+        level = np.clip(base_lut[category] + bump, 0, len(SEVERITY_LEVELS) - 1)
+        level = np.where(np.isnan(edge), SEVERITY_LEVELS.index("Moderate"), level)
+        score = np.array([severity_scores[s] for s in SEVERITY_LEVELS], dtype=np.float32)[level]
+
+        priority = np.where(score > priority_high, "High", np.where(score > priority_medium, "Medium", "Low"))
+
+        return {
+            "ids": cols["ids"],
+            "category": np.array(self.categories)[category],
+            "severity_label": np.array(SEVERITY_LEVELS)[level],
+            "severity_score": score,
+            "priority": priority,
+            "elapsed_ms": (time.perf_counter() - started) * 1000
+        }
+
+    def stats(self) -> dict:
+        with self._lock:
+            unflushed = len(self._pending)
+        return {
+            "unflushed": unflushed,
+            "segments": len(self._segment_paths(self.worker_id)),
+            "segments_written": self.segments_written,
+            "compactions": self.compactions,
+            "max_records": self.max_records
+        }
@@ -3,6 +3,10 @@ Inference Pipeline Service
 Orchestrates the entire ML pipeline: Category -> Severity -> Priority -> Description -> Duplicate
 Ensures all models are loaded exactly once and infer sequentially.
 """
+import asyncio
+import hashlib
+import os
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional, List, Dict, Any
 
 from models.category_classifier import CategoryClassifier
@@ -10,6 +14,11 @@ from models.severity_detector import SeverityDetector
 from pipeline.priority_logic import PriorityLogic
 from pipeline.description_generator import DescriptionGenerator
 from pipeline.duplicate_detector import DuplicateDetector
+from pipeline.embedding_codec import encode_embedding
+from pipeline.stage_trace import StageTrace
+from pipeline.feature_store import SeverityFeatureStore
+from pipeline.online_learner import OnlineHeadLearner
+from pipeline.deadline import Deadline, DUPLICATE_MIN_BUDGET_MS
 
 class InferencePipeline:
     def __init__(self):
@@ -17,57 +26,163 @@ class InferencePipeline:
         self.category_classifier = CategoryClassifier()
         self.severity_detector = SeverityDetector()
         self.priority_logic = PriorityLogic()
-        self.description_generator = DescriptionGenerator()
+        self.description_generator = DescriptionGenerator(self.category_classifier.feature_source)
         self.duplicate_detector = DuplicateDetector()
+        self.feature_store = SeverityFeatureStore(self.category_classifier.categories)
+        self.online_learner = OnlineHeadLearner(self.category_classifier)
+        # Stages are CPU-bound; run them off the event loop so the server keeps
+        # accepting (and coalescing) requests while a pipeline is executing
+        self._executor = ThreadPoolExecutor(
+            max_workers=int(os.environ.get("PIPELINE_THREADS", 2)),
+            thread_name_prefix="pipeline"
+        )
         print("✅ Inference Pipeline Initialized")
 
+    async def run_pipeline_threaded(
+        self,
+        profiler=None,
+        trace_id: Optional[str] = None,
+        trace: Optional[StageTrace] = None,
+        **kwargs
+    ) -> Dict[str, Any]:
+        """
+        Run `run_pipeline` on the pipeline thread pool.
+        With a profiler and trace_id, the run is captured to a trace file.
+        Stage spans are recorded into `trace` if one is given.
+        """
+        def _run():
+            if profiler is None:
+                return asyncio.run(self.run_pipeline(trace=trace, **kwargs))
+            with profiler.capture(trace_id, trace=trace) as profiled:
+                return asyncio.run(self.run_pipeline(trace=profiled, **kwargs))
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, _run)
+
+    async def detect_duplicate_threaded(self, **kwargs) -> Dict[str, Any]:
+        """
+        Run `duplicate_detector.detect` on the pipeline thread pool: embedding and
+        candidate fetches are CPU-bound / blocking and must not stall the event loop.
+        """
+        def _run():
+            return asyncio.run(self.duplicate_detector.detect(**kwargs))
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, _run)
+
     async def run_pipeline(
         self,
         image_bytes: bytes,
         block: Optional[str] = None,
         classroom: Optional[str] = None,
-        existing_complaints: Optional[List[dict]] = None
+        existing_complaints: Optional[List[dict]] = None,
+        return_embedding: Optional[str] = None,
+        trace: Optional[StageTrace] = None,
+        record_id: Optional[str] = None,
+        deadline: Optional[Deadline] = None
     ) -> Dict[str, Any]:
         """
         Run the full sequential pipeline.
         Returns the unified JSON response.
+        return_embedding: "float16" or "int8" to include the upload's encoded
+        embedding in the response (see pipeline.embedding_codec).
+        trace: records per-stage spans (one is created if not given).
+        record_id: key for the feature store (defaults to the image content hash).
+        deadline: request time budget. Category, severity and priority always run;
+        embedding and duplicate detection are skipped or truncated when it runs
+        low and listed in the response's "degraded" field.
         """
+        trace = trace or StageTrace()
+        degraded = []
+        # Keeps this worker's head in step with heads other workers publish
+        self.online_learner.ensure_running()
         try:
             # 1. Category Classifier
             print("1. Running Category Classifier...")
-            category = await self.category_classifier.predict(image_bytes)
+            with trace.stage("category"):
+                category_info = await self.category_classifier.classify(image_bytes)
+            category = category_info["category"]
             
             # 2. Severity Detector
             print("2. Running Severity Detector...")
-            severity_str, severity_score = await self.severity_detector.predict(image_bytes, category=category)
+            with trace.stage("severity"):
+                severity_info = await self.severity_detector.analyze(image_bytes, category=category)
+            severity_str, severity_score = severity_info["severity"], severity_info["score"]
 
             # 3. Priority Logic
             print(f"3. Running Priority Logic (Severity Score: {severity_score:.2f})...")
-            priority = await self.priority_logic.determine_priority(severity_score)
+            with trace.stage("priority"):
+                priority = await self.priority_logic.determine_priority(severity_score)
+
+            # The upload is embedded once (only when duplicate detection or the caller needs it)
+            # and shared by duplicate detection and the response
+            embedding = None
+            if existing_complaints or return_embedding:
+                if deadline is None or deadline.allows(DUPLICATE_MIN_BUDGET_MS):
+                    print("3a. Computing image embedding...")
+                    with trace.stage("embedding"):
+                        embedding = self.duplicate_detector.embed(image_bytes)
+                else:
+                    print(f"⏱️ Skipping embedding ({deadline.remaining_ms():.0f} ms left)")
+                    degraded.append("embedding")
 
             # 4. Description Generator
             print("4. Running Description Generator...")
-            description = await self.description_generator.generate(image_bytes, category)
+            with trace.stage("description"):
+                description = await self.description_generator.generate(
+                    image_bytes, category, features=category_info.get("features")
+                )
+
+            # 5. Duplicate Detection (optional: needs the embedding, may be cut short by the deadline)
+            if existing_complaints and "embedding" in degraded:
+                duplicate_info = {"is_duplicate": False, "similarity_score": 0.0, "similar_complaint_id": None}
+                degraded.append("duplicate")
+            else:
+                print("5. Running Duplicate Detector...")
+                with trace.stage("duplicate"):
+                    duplicate_info = await self.duplicate_detector.detect(
+                        image_bytes=image_bytes,
+                        category=category,
+                        block=block,
+                        classroom=classroom,
+                        candidates=existing_complaints or [],
+                        target_embedding=embedding,
+                        deadline=deadline
+                    )
+                if duplicate_info.get("truncated"):
+                    degraded.append("duplicate")
 
-            # 5. Duplicate Detection
-            print("5. Running Duplicate Detector...")
-            duplicate_info = await self.duplicate_detector.detect(
-                image_bytes=image_bytes,
-                category=category,
-                block=block,
-                classroom=classroom,
-                candidates=existing_complaints or []
-            )
+            # Persist intermediate signals so rules can be re-applied later without the image
+            record_id = record_id or hashlib.sha256(image_bytes).hexdigest()
+            with trace.stage("feature_store"):
+                try:
+                    self.feature_store.add(
+                        record_id,
+                        category=category,
+                        probabilities=category_info["probabilities"],
+                        edge_density=severity_info["edge_density"],
+                        embedding=embedding,
+                        classifier_features=category_info.get("features"),
+                        features_source=self.category_classifier.feature_source
+                    )
+                except Exception as e:
+                    print(f"⚠️ [FeatureStore] Failed to record features: {e}")
 
-            return {
+            result = {
+                "feature_id": record_id,
                 "category": category,
                 "severity_score": severity_score,
                 "severity_label": severity_str,
                 "priority": priority,
                 "description": description,
                 "duplicate": duplicate_info["is_duplicate"],
-                "duplicate_reference": duplicate_info["similar_complaint_id"]
+                "duplicate_reference": duplicate_info["similar_complaint_id"],
+                # Optional stages skipped or cut short by the deadline (results above are partial)
+                "degraded": degraded
             }
+            if return_embedding:
+                result["embedding"] = encode_embedding(embedding, return_embedding, tag=self.duplicate_detector.config["tag"]) if embedding is not None else None
+            return result
 
         except Exception as e:
             import traceback
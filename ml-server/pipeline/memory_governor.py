@@ -0,0 +1,101 @@
+"""
+Memory Governor
+Admission control against an RSS budget. Each request's peak footprint is
+estimated from the image header (no decoding) and requests that would push
+the process over budget wait until in-flight ones release their share.
+"""
+import asyncio
+import io
+import os
+from contextlib import asynccontextmanager
+
+from PIL import Image
+
+from pipeline.memory_stats import MB, process_memory
+
+# Decoded bitmap is held roughly twice (decode + RGB convert) across stages
+DECODE_COPIES = 2
+# Resized tensors + CNN activations at batch size 1
+TENSOR_OVERHEAD_BYTES = 40 * MB
+
+
+class MemoryBudgetTimeout(Exception):
+    """Raised when a request waited too long for memory to become available."""
+
+
+class MemoryGovernor:
+    def __init__(self):
+        self.budget_bytes = int(float(os.environ.get("ML_MEMORY_BUDGET_MB", 450)) * MB)
+        self.queue_timeout = float(os.environ.get("ML_MEMORY_QUEUE_TIMEOUT", 60))
+        self.baseline_bytes = None
+        self.reserved_bytes = 0
+        self.active = 0
+        self.waiting = 0
+        self.admitted_count = 0
+        self.queued_count = 0
+        self.rejected_count = 0
+        self._condition = None
+
+    def estimate(self, image_bytes: bytes) -> int:
+        """Peak bytes needed to process this image, from its header only."""
+        try:
+            with Image.open(io.BytesIO(image_bytes)) as image:
+                width, height = image.size
+            return width * height * 3 * DECODE_COPIES + TENSOR_OVERHEAD_BYTES
+        except Exception:
+            # Unreadable header: assume a generous compression ratio
+            return len(image_bytes) * 10 + TENSOR_OVERHEAD_BYTES
+
+    def _fits(self, need: int) -> bool:
+        # A lone request is always admitted, otherwise an oversized image would wait forever
+        return self.active == 0 or self.baseline_bytes + self.reserved_bytes + need <= self.budget_bytes
+
+    @asynccontextmanager
+    async def admit(self, image_bytes: bytes, timeout: float = None):
+        """Hold a memory reservation for the duration of the block (wait at most `timeout` seconds)."""
+        if self._condition is None:
+            # Created lazily so it binds to the serving event loop (each forked worker has its own)
+            self._condition = asyncio.Condition()
+        need = self.estimate(image_bytes)
+        timeout = self.queue_timeout if timeout is None else min(timeout, self.queue_timeout)
+
+        async with self._condition:
+            if self.active == 0:
+                # Idle: re-measure the resident baseline (models, allocator caches)
+                self.baseline_bytes = process_memory()["rss_mb"] * MB
+            if not self._fits(need):
+                self.waiting += 1
+                self.queued_count += 1
+                print(f"⏳ [MemoryGovernor] Queuing request needing {need / MB:.0f} MB "
+                      f"({self.reserved_bytes / MB:.0f} MB reserved, budget {self.budget_bytes / MB:.0f} MB)")
+                try:
+                    await asyncio.wait_for(self._condition.wait_for(lambda: self._fits(need)), timeout)
+                except asyncio.TimeoutError:
+                    self.rejected_count += 1
+                    raise MemoryBudgetTimeout(f"No memory available within {timeout:.1f}s")
+                finally:
+                    self.waiting -= 1
+            self.reserved_bytes += need
+            self.active += 1
+            self.admitted_count += 1
+
+        try:
+            yield
+        finally:
+            async with self._condition:
+                self.reserved_bytes -= need
+                self.active -= 1
+                self._condition.notify_all()
+
+    def usage(self) -> dict:
+        return {
+            "budget_mb": round(self.budget_bytes / MB, 2),
+            "baseline_mb": round(self.baseline_bytes / MB, 2) if self.baseline_bytes is not None else None,
+            "reserved_mb": round(self.reserved_bytes / MB, 2),
+            "rss_mb": process_memory()["rss_mb"],
+            "active": self.active,
+            "waiting": self.waiting,
+            "admitted": self.admitted_count,
+            "queued": self.queued_count,
+            "rejected": self.rejected_count
+        }
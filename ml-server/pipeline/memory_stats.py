@@ -0,0 +1,29 @@
+"""
+Memory Stats
+Process memory accounting shared by the pre-fork server and the API.
+USS (unique set size) is the memory a worker would free if it exited,
+i.e. what it does NOT share copy-on-write with the parent.
+"""
+import os
+from typing import Optional
+
+import psutil
+
+MB = 1024 * 1024
+
+
+def process_memory(pid: Optional[int] = None) -> dict:
+    """RSS / USS / shared memory of a process in MB."""
+    process = psutil.Process(pid or os.getpid())
+    try:
+        info = process.memory_full_info()
+        uss = info.uss
+    except (psutil.AccessDenied, AttributeError):
+        info = process.memory_info()
+        uss = None
+    return {
+        "pid": process.pid,
+        "rss_mb": round(info.rss / MB, 2),
+        "uss_mb": round(uss / MB, 2) if uss is not None else None,
+        "shared_mb": round(getattr(info, "shared", 0) / MB, 2)
+    }
@@ -0,0 +1,186 @@
+"""
+Online Head Learner
+Turns supervisor category corrections into continuous model improvements.
+Corrections are buffered as (backbone features, label) pairs; a background
+thread periodically fine-tunes a copy of the classifier's linear head on the
+buffer with a few cheap gradient steps, then swaps it in atomically and
+saves it as a new version (loaded again on restart).
+
+With several pre-fork workers each buffers its own corrections. Every
+worker's background thread also checks online_head.pth each
+ONLINE_UPDATE_INTERVAL and adopts a newer head another worker has published,
+so workers that receive few corrections do not keep serving old versions.
+"""
+import copy
+import os
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+from models.category_classifier import ONLINE_HEAD_PATH
+
+try:
+    import torch
+    import torch.nn as nn
+    TORCH_AVAILABLE = True
+except ImportError:
+    TORCH_AVAILABLE = False
+
+
+class OnlineHeadLearner:
+    def __init__(self, classifier):
+        self.classifier = classifier
+        self.update_interval = float(os.environ.get("ONLINE_UPDATE_INTERVAL", 60))
+        self.min_new_samples = int(os.environ.get("ONLINE_MIN_SAMPLES", 8))
+        self.steps = int(os.environ.get("ONLINE_STEPS", 25))
+        self.learning_rate = float(os.environ.get("ONLINE_LR", 0.01))
+        # Pull towards the previous weights so a handful of corrections can't wreck the head
+        self.anchor_weight = float(os.environ.get("ONLINE_ANCHOR", 0.01))
+        # Replay buffer: recent corrections are re-used in every update
+        self.buffer = deque(maxlen=int(os.environ.get("ONLINE_BUFFER_SIZE", 512)))
+        self.pending = 0
+        self.updates = 0
+        self.last_update_at = None
+        self.last_loss = None
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        # mtime of the last online_head.pth looked at (skip re-reading an unchanged file)
+        self._seen_head_mtime = None
+
+    @property
+    def available(self) -> bool:
+        return TORCH_AVAILABLE and self.classifier.model is not None
+
+    def add(self, features, label: str, source: str):
+        """
+        Buffer one correction and make sure the background updater is running.
+        `source` must be the classifier's feature_source: features from any other
+        network (e.g. duplicate-detection embeddings) live in a different space.
+        """
+        if not self.available:
+            raise RuntimeError("Category model not loaded; online learning unavailable")
+        if source != self.classifier.feature_source:
+            raise ValueError("Features were not produced by the current category model")
+        if label not in self.classifier.categories:
+            raise ValueError(f"Unknown category '{label}'")
+        features = np.asarray(features, dtype=np.float32).reshape(-1)
+        expected = self.classifier.get_head().in_features
+        if features.shape[0] != expected:
+            raise ValueError(f"Expected {expected}-d features, got {features.shape[0]}")
+
+        with self._lock:
+            self.buffer.append((features, self.classifier.categories.index(label)))
+            self.pending += 1
+        self._ensure_thread()
+        if self.pending >= self.min_new_samples:
+            self._wakeup.set()
+
+    def ensure_running(self):
+        """Start the background thread (called per request, so every serving worker polls for new heads)."""
+        if self.available:
+            self._ensure_thread()
+
+    def _ensure_thread(self):
+        # Started lazily so it lives in the serving (forked) worker, not the parent
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._loop, name="online-head-learner", daemon=True)
+            self._thread.start()
+
+    def _loop(self):
+        while True:
+            self._wakeup.wait(self.update_interval)
+            self._wakeup.clear()
+            try:
+                self._adopt_saved_head()
+            except Exception as e:
+                print(f"⚠️ [OnlineLearner] Could not load published head: {e}")
+            if self.pending >= self.min_new_samples:
+                try:
+                    self.update()
+                except Exception as e:
+                    print(f"⚠️ [OnlineLearner] Update failed: {e}")
+
+    def update(self):
+        """Fine-tune a copy of the head on the buffer and swap it in."""
+        with self._lock:
+            samples = list(self.buffer)
+            self.pending = 0
+        if not samples:
+            return
+
+        features = torch.from_numpy(np.stack([f for f, _ in samples]))
+        labels = torch.tensor([l for _, l in samples], dtype=torch.long)
+
+        # Other workers may have published a newer head; build on top of it
+        self._adopt_saved_head()
+        current = self.classifier.get_head()
+        head = copy.deepcopy(current)
+        anchor = [p.detach().clone() for p in current.parameters()]
+        for param in head.parameters():
+            param.requires_grad_(True)
+        head.train()
+
+        optimizer = torch.optim.SGD(head.parameters(), lr=self.learning_rate, momentum=0.9)
+        criterion = nn.CrossEntropyLoss()
+        with torch.enable_grad():
+            for _ in range(self.steps):
+                optimizer.zero_grad()
+                loss = criterion(head(features), labels)
+                loss = loss + self.anchor_weight * sum(((p - a) ** 2).sum() for p, a in zip(head.parameters(), anchor))
+                loss.backward()
+                optimizer.step()
+
+        head.eval()
+        for param in head.parameters():
+            param.requires_grad_(False)
+
+        version = self.classifier.head_version + 1
+        self.classifier.set_head(head, version)
+        self._save(head, version)
+        self.updates += 1
+        self.last_update_at = time.time()
+        self.last_loss = loss.item()
+        print(f"🎓 [OnlineLearner] Head v{version} swapped in ({len(samples)} samples, loss {self.last_loss:.4f})")
+
+    def _adopt_saved_head(self):
+        try:
+            mtime = os.stat(ONLINE_HEAD_PATH).st_mtime_ns
+        except OSError:
+            return
+        if mtime == self._seen_head_mtime:
+            return
+        self._seen_head_mtime = mtime
+        checkpoint = torch.load(ONLINE_HEAD_PATH, map_location="cpu")
+        if checkpoint["version"] <= self.classifier.head_version or checkpoint.get("categories") != self.classifier.categories:
+            return
+        if checkpoint.get("backbone", self.classifier.backbone) != self.classifier.backbone:
+            return
+        head = copy.deepcopy(self.classifier.get_head())
+        head.load_state_dict(checkpoint["state_dict"])
+        self.classifier.set_head(head, checkpoint["version"])
+        print(f"🔄 [OnlineLearner] Adopted published head v{checkpoint['version']}")
+
+    def _save(self, head, version: int):
+        # Per-process temp name: several workers may publish at the same moment
+        tmp_path = f"{ONLINE_HEAD_PATH}.{os.getpid()}.tmp"
+        torch.save({
+            "version": version,
+            "categories": self.classifier.categories,
+            "backbone": self.classifier.backbone,
+            "state_dict": head.state_dict()
+        }, tmp_path)
+        os.replace(tmp_path, ONLINE_HEAD_PATH)
+
+    def stats(self) -> dict:
+        return {
+            "available": self.available,
+            "head_version": self.classifier.head_version,
+            "buffered": len(self.buffer),
+            "pending": self.pending,
+            "updates": self.updates,
+            "last_update_at": self.last_update_at,
+            "last_loss": self.last_loss
+        }
@@ -3,6 +3,10 @@ Priority Logic Service
 Determines priority level based on severity.
 """
 
+# Severity score thresholds (strictly greater than)
+PRIORITY_HIGH_THRESHOLD = 0.7
+PRIORITY_MEDIUM_THRESHOLD = 0.4
+
 class PriorityLogic:
     def __init__(self):
         pass
@@ -19,9 +23,9 @@ class PriorityLogic:
         # So we should probably update the severity detector to return the actual score (0-1) and string, then compute priority.
         # First let's put in the basic logic assuming a float 0.0 to 1.0.
         print(f"🔍 [PriorityLogic] Mapping severity score {severity_score:.2f} to priority level...")
-        if severity_score > 0.7:
+        if severity_score > PRIORITY_HIGH_THRESHOLD:
             priority = "High"
-        elif severity_score > 0.4:
+        elif severity_score > PRIORITY_MEDIUM_THRESHOLD:
             priority = "Medium"
         else:
             priority = "Low"
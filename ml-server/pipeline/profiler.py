@@ -0,0 +1,136 @@
+"""
+Request Profiler
+Opt-in per-request profiling of the inference pipeline. A profiled request
+runs under the torch profiler (when available) plus Python-level stage spans,
+and its Chrome trace is written to a bounded local directory.
+
+Triggered by the `X-Profile: 1` request header (honoured only together with a
+valid operator token, see api/admin.py), or by sampling (`PROFILE_SAMPLE_RATE`,
+adjustable at runtime via the operator endpoint; the new rate is saved to
+settings.json in PROFILE_DIR and picked up by every worker, see
+pipeline/shared_settings.py).
+
+The torch profiler is process-global, so only one request is profiled at a
+time; a request arriving while another is being captured runs unprofiled.
+"""
+import json
+import os
+import random
+import re
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import List, Optional
+
+from pipeline.shared_settings import SharedSettings
+from pipeline.stage_trace import StageTrace
+
+try:
+    from torch.profiler import profile, ProfilerActivity
+    TORCH_AVAILABLE = True
+except ImportError:
+    TORCH_AVAILABLE = False
+
+TRACE_ID_PATTERN = re.compile(r"^[0-9]{8}-[0-9]{6}-[0-9a-f]{8}$")
+
+# Held while a capture is running (pipeline threads run requests concurrently)
+_capture_lock = threading.Lock()
+
+
+class RequestProfiler:
+    def __init__(self):
+        self.trace_dir = os.environ.get("PROFILE_DIR", "profiles")
+        self.max_traces = int(os.environ.get("PROFILE_MAX_TRACES", 20))
+        self._sample_rate = float(os.environ.get("PROFILE_SAMPLE_RATE", 0.0))
+        self.profiled_count = 0
+        self.skipped_busy = 0
+        self._settings = SharedSettings(os.path.join(self.trace_dir, "settings.json"))
+
+    @property
+    def sample_rate(self) -> float:
+        # Another worker may have changed the rate
+        values = self._settings.poll()
+        if values is not None:
+            self._sample_rate = float(values.get("sample_rate", self._sample_rate))
+        return self._sample_rate
+
+    def update_settings(self, sample_rate: float):
+        """Operator change, applied here and published to every worker."""
+        self._sample_rate = sample_rate
+        self._settings.save({"sample_rate": sample_rate})
+
+    def should_profile(self, header_value: Optional[str] = None) -> bool:
+        if header_value and header_value.lower() in ("1", "true", "yes"):
+            return True
+        sample_rate = self.sample_rate
+        return sample_rate > 0 and random.random() < sample_rate
+
+    def new_trace_id(self) -> str:
+        return time.strftime("%Y%m%d-%H%M%S") + "-" + uuid.uuid4().hex[:8]
+
+    def trace_path(self, trace_id: str) -> Optional[str]:
+        """Path of a trace file, or None if the id is malformed (no path traversal)."""
+        if not TRACE_ID_PATTERN.match(trace_id):
+            return None
+        return os.path.join(self.trace_dir, f"{trace_id}.json")
+
+    @contextmanager
+    def capture(self, trace_id: str, trace: Optional[StageTrace] = None):
+        """Profile the enclosed block and yield the StageTrace to record stages into."""
+        trace = trace or StageTrace()
+        if not _capture_lock.acquire(blocking=False):
+            # Another request is being profiled; a second torch profiler would fail or garble both traces
+            self.skipped_busy += 1
+            print(f"⚠️ [RequestProfiler] Capture already running; {trace_id} runs unprofiled")
+            yield trace
+            return
+
+        try:
+            os.makedirs(self.trace_dir, exist_ok=True)
+            path = self.trace_path(trace_id)
+            if TORCH_AVAILABLE:
+                with profile(activities=[ProfilerActivity.CPU], record_shapes=True) as prof:
+                    yield trace
+                prof.export_chrome_trace(path)
+            else:
+                yield trace
+                with open(path, "w") as f:
+                    json.dump(trace.to_chrome_trace(), f)
+        finally:
+            _capture_lock.release()
+
+        self.profiled_count += 1
+        print(f"🧪 [RequestProfiler] Trace written: {path}")
+        self._prune()
+
+    def _prune(self):
+        """Keep only the newest `max_traces` files."""
+        traces = self.list_traces()
+        for entry in traces[self.max_traces:]:
+            try:
+                os.remove(os.path.join(self.trace_dir, f"{entry['trace_id']}.json"))
+            except OSError:
+                pass
+
+    def list_traces(self) -> List[dict]:
+        """Newest first."""
+        if not os.path.isdir(self.trace_dir):
+            return []
+        entries = []
+        for name in os.listdir(self.trace_dir):
+            trace_id = name[:-len(".json")]
+            if not name.endswith(".json") or not TRACE_ID_PATTERN.match(trace_id):
+                continue
+            stat = os.stat(os.path.join(self.trace_dir, name))
+            entries.append({"trace_id": trace_id, "size_bytes": stat.st_size, "created_at": stat.st_mtime})
+        entries.sort(key=lambda e: e["created_at"], reverse=True)
+        return entries
+
+    def stats(self) -> dict:
+        return {
+            "sample_rate": self.sample_rate,
+            "profiled": self.profiled_count,
+            "skipped_busy": self.skipped_busy,
+            "stored_traces": len(self.list_traces())
+        }
@@ -0,0 +1,57 @@
+"""
+Request Coalescer Service
+Single-flight de-duplication of identical in-flight inference requests.
+The first request for a key does the work; concurrent identical requests
+await the same result instead of re-running the pipeline.
+"""
+import asyncio
+import hashlib
+import json
+from typing import Any, Awaitable, Callable, Dict
+
+
+class RequestCoalescer:
+    def __init__(self):
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.leader_count = 0
+        self.coalesced_count = 0
+
+    @staticmethod
+    def make_key(image_bytes: bytes, **params) -> str:
+        """Key = content hash of the image + canonical JSON of the parameters."""
+        digest = hashlib.sha256(image_bytes)
+        digest.update(json.dumps(params, sort_keys=True, default=str).encode("utf-8"))
+        return digest.hexdigest()
+
+    async def run(self, key: str, work: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Run `work()` once per key. Callers arriving while it is in flight
+        share its result (or its exception).
+        """
+        task = self._inflight.get(key)
+        if task is None:
+            self.leader_count += 1
+            task = asyncio.ensure_future(work())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t, k=key: self._on_done(k, t))
+        else:
+            self.coalesced_count += 1
+            print(f"🔗 [RequestCoalescer] Joined in-flight request {key[:12]}...")
+
+        # Shield so a disconnecting caller does not cancel work others are waiting on
+        return await asyncio.shield(task)
+
+    def _on_done(self, key: str, task: asyncio.Future):
+        self._inflight.pop(key, None)
+        # Mark the exception as retrieved even if every waiter went away
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self) -> dict:
+        total = self.leader_count + self.coalesced_count
+        return {
+            "in_flight": len(self._inflight),
+            "executed": self.leader_count,
+            "coalesced": self.coalesced_count,
+            "coalesced_ratio": (self.coalesced_count / total) if total else 0.0
+        }
@@ -0,0 +1,56 @@
+"""
+Shared Settings
+Operator settings changed at runtime (POST /capture/settings, ...) must reach
+every pre-fork worker, not only the one that handled the request. They are
+written atomically to a small JSON file; every worker re-reads the file when
+it has been replaced, checking at most every SHARED_SETTINGS_POLL seconds.
+
+The file outlives the process: after a restart its values still override the
+environment defaults until it is deleted.
+"""
+import json
+import os
+import time
+from typing import Optional
+
+
+class SharedSettings:
+    def __init__(self, path: str):
+        self.path = path
+        self.poll_interval = float(os.environ.get("SHARED_SETTINGS_POLL", 1.0))
+        # (inode, mtime) of the file last read; os.replace gives every save a new inode
+        self._seen = None
+        self._checked_at = None
+
+    def save(self, values: dict):
+        """Publish new values to all workers."""
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Per-process temp name: several workers may save at the same moment
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(values, f)
+        os.replace(tmp_path, self.path)
+
+    def poll(self) -> Optional[dict]:
+        """The stored values if the file changed since the last poll, else None."""
+        now = time.monotonic()
+        if self._checked_at is not None and now - self._checked_at < self.poll_interval:
+            return None
+        self._checked_at = now
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        seen = (stat.st_ino, stat.st_mtime_ns)
+        if seen == self._seen:
+            return None
+        try:
+            with open(self.path) as f:
+                values = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"⚠️ [SharedSettings] Could not read {self.path}: {e}")
+            return None
+        self._seen = seen
+        return values if isinstance(values, dict) else None
@@ -0,0 +1,60 @@
+"""
+Stage Trace
+Lightweight wall-clock spans for pipeline stages. When torch is available
+each span is also emitted as a `record_function` range so it shows up as a
+named block inside torch profiler traces.
+"""
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+try:
+    import torch
+    TORCH_AVAILABLE = True
+except ImportError:
+    TORCH_AVAILABLE = False
+
+
+class StageTrace:
+    def __init__(self):
+        self.origin = time.perf_counter()
+        self.spans = []
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        marker = torch.profiler.record_function(name) if TORCH_AVAILABLE else nullcontext()
+        try:
+            with marker:
+                yield
+        finally:
+            end = time.perf_counter()
+            self.spans.append({
+                "name": name,
+                "start_ms": (start - self.origin) * 1000,
+                "duration_ms": (end - start) * 1000,
+                "thread": threading.get_ident()
+            })
+
+    def timings(self) -> dict:
+        """Stage name -> duration in ms (summed if a stage ran more than once)."""
+        result = {}
+        for span in self.spans:
+            result[span["name"]] = result.get(span["name"], 0.0) + span["duration_ms"]
+        return result
+
+    def to_chrome_trace(self) -> dict:
+        """Spans in Chrome trace-event format (chrome://tracing, Perfetto)."""
+        return {
+            "traceEvents": [
+                {
+                    "name": span["name"],
+                    "ph": "X",
+                    "ts": span["start_ms"] * 1000,
+                    "dur": span["duration_ms"] * 1000,
+                    "pid": 0,
+                    "tid": span["thread"]
+                }
+                for span in self.spans
+            ]
+        }
@@ -0,0 +1,158 @@
+"""
+Traffic Capture
+Opt-in recording of production request shapes for offline replay
+(see replay_traffic.py). One JSON line per request: image hash, size,
+dimensions and format, candidate counts by kind, per-stage timings and
+total latency. A sampled fraction of images is stored (deduplicated by
+hash) so the replay can run real pixels through the models.
+
+Each pre-fork worker writes its own rotating log
+(capture-<WORKER_ID>.jsonl, .1, .2, ...) under TRAFFIC_CAPTURE_DIR.
+Runtime changes (update_settings) are saved to settings.json there and picked
+up by every worker (see pipeline/shared_settings.py).
+"""
+import hashlib
+import io
+import json
+import logging
+import os
+import random
+import time
+from logging.handlers import RotatingFileHandler
+from typing import List, Optional
+
+from PIL import Image
+
+from pipeline.memory_stats import MB
+from pipeline.shared_settings import SharedSettings
+
+
+def image_shape(image_bytes: bytes) -> dict:
+    """Dimensions and format from the image header (no decoding)."""
+    try:
+        with Image.open(io.BytesIO(image_bytes)) as image:
+            return {"width": image.size[0], "height": image.size[1], "format": image.format}
+    except Exception:
+        return {"width": None, "height": None, "format": None}
+
+
+def candidate_mix(candidates: Optional[List[dict]]) -> dict:
+    """How many candidates arrive with a stored embedding vs. an image URL only."""
+    candidates = candidates or []
+    with_embedding = sum(1 for c in candidates if c.get("embedding"))
+    return {
+        "candidates": len(candidates),
+        "candidates_with_embedding": with_embedding,
+        "candidates_url_only": len(candidates) - with_embedding
+    }
+
+
+class TrafficCapture:
+    def __init__(self):
+        self._enabled = os.environ.get("TRAFFIC_CAPTURE", "0").lower() in ("1", "true", "yes")
+        self.capture_dir = os.environ.get("TRAFFIC_CAPTURE_DIR", "traffic")
+        # Fraction of requests whose image is kept
+        self.image_rate = float(os.environ.get("TRAFFIC_CAPTURE_IMAGE_RATE", 0.05))
+        self.max_images = int(os.environ.get("TRAFFIC_CAPTURE_MAX_IMAGES", 500))
+        self.max_log_bytes = int(float(os.environ.get("TRAFFIC_CAPTURE_MAX_MB", 10)) * MB)
+        self.backups = int(os.environ.get("TRAFFIC_CAPTURE_BACKUPS", 5))
+        self.recorded = 0
+        self.images_saved = 0
+        self._logger = None
+        self._settings = SharedSettings(os.path.join(self.capture_dir, "settings.json"))
+
+    @property
+    def enabled(self) -> bool:
+        # Another worker may have changed the setting
+        values = self._settings.poll()
+        if values is not None:
+            self._enabled = bool(values.get("enabled", self._enabled))
+            self.image_rate = float(values.get("image_rate", self.image_rate))
+        return self._enabled
+
+    def update_settings(self, enabled: bool, image_rate: Optional[float] = None):
+        """Operator change, applied here and published to every worker."""
+        if image_rate is not None:
+            self.image_rate = image_rate
+        self._enabled = enabled
+        self._settings.save({"enabled": enabled, "image_rate": self.image_rate})
+
+    @property
+    def image_dir(self) -> str:
+        return os.path.join(self.capture_dir, "images")
+
+    def _get_logger(self) -> logging.Logger:
+        # Opened lazily so each forked worker gets its own file (WORKER_ID is set by prefork.py)
+        if self._logger is None:
+            os.makedirs(self.capture_dir, exist_ok=True)
+            worker_id = os.environ.get("WORKER_ID", "0")
+            handler = RotatingFileHandler(
+                os.path.join(self.capture_dir, f"capture-{worker_id}.jsonl"),
+                maxBytes=self.max_log_bytes,
+                backupCount=self.backups
+            )
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            logger = logging.getLogger(f"traffic_capture.{worker_id}")
+            logger.setLevel(logging.INFO)
+            logger.propagate = False
+            logger.handlers = [handler]
+            self._logger = logger
+        return self._logger
+
+    def record(
+        self,
+        endpoint: str,
+        image_bytes: bytes,
+        candidates: Optional[List[dict]] = None,
+        timings: Optional[dict] = None,
+        total_ms: float = 0.0,
+        status: int = 200,
+        **fields
+    ):
+        """Append one request to the capture log. Never raises."""
+        if not self.enabled:
+            return
+        try:
+            digest = hashlib.sha256(image_bytes).hexdigest()
+            entry = {
+                "ts": time.time(),
+                "endpoint": endpoint,
+                "status": status,
+                "image_sha256": digest,
+                "image_bytes": len(image_bytes),
+                **image_shape(image_bytes),
+                **candidate_mix(candidates),
+                **fields,
+                "total_ms": round(total_ms, 2),
+                "stages_ms": {k: round(v, 2) for k, v in (timings or {}).items()},
+                "image_saved": self._maybe_save_image(digest, image_bytes)
+            }
+            self._get_logger().info(json.dumps(entry))
+            self.recorded += 1
+        except Exception as e:
+            print(f"⚠️ [TrafficCapture] Failed to record request: {e}")
+
+    def _maybe_save_image(self, digest: str, image_bytes: bytes) -> bool:
+        path = os.path.join(self.image_dir, digest)
+        if os.path.exists(path):
+            return True
+        if self.image_rate <= 0 or random.random() >= self.image_rate:
+            return False
+        os.makedirs(self.image_dir, exist_ok=True)
+        if len(os.listdir(self.image_dir)) >= self.max_images:
+            return False
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(image_bytes)
+        os.replace(tmp_path, path)
+        self.images_saved += 1
+        return True
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "image_rate": self.image_rate,
+            "recorded": self.recorded,
+            "images_saved": self.images_saved,
+            "capture_dir": self.capture_dir
+        }
@@ -0,0 +1,175 @@
+"""
+Pre-fork Server
+Loads the models once in the parent process, then forks N uvicorn workers
+that share the model weights copy-on-write instead of each loading its own.
+
+A worker that dies is re-forked. One that dies within WORKER_MIN_UPTIME
+seconds of starting is re-forked after an exponential backoff
+(WORKER_RESPAWN_BACKOFF, doubling up to 60 s); after WORKER_MAX_FAST_FAILURES
+such deaths in a row the server shuts down with exit status 1 instead of
+crash-looping.
+
+Usage: WEB_CONCURRENCY=4 python main.py
+"""
+import gc
+import os
+import signal
+import socket
+import time
+
+import uvicorn
+
+from pipeline.memory_stats import process_memory
+
+try:
+    import torch
+    TORCH_AVAILABLE = True
+except ImportError:
+    TORCH_AVAILABLE = False
+
+# Seconds between per-worker memory reports in the parent
+MEMORY_REPORT_INTERVAL = int(os.environ.get("MEMORY_REPORT_INTERVAL", 300))
+# A worker exiting sooner than this after its fork counts as a startup failure
+WORKER_MIN_UPTIME = float(os.environ.get("WORKER_MIN_UPTIME", 10))
+# First respawn delay after a startup failure (doubles with each consecutive one)
+WORKER_RESPAWN_BACKOFF = float(os.environ.get("WORKER_RESPAWN_BACKOFF", 1))
+WORKER_RESPAWN_MAX_DELAY = 60
+WORKER_MAX_FAST_FAILURES = int(os.environ.get("WORKER_MAX_FAST_FAILURES", 5))
+
+
+def freeze_shared_state(pipeline):
+    """
+    Prepare the loaded pipeline to be shared across forks:
+    - model weights become read-only (no grad, eval mode) so nothing writes to them
+    - every live Python object moves to the GC's permanent generation, so the
+      children's garbage collector never touches (and copies) the parent's pages
+    """
+    if TORCH_AVAILABLE:
+        modules = [
+            pipeline.category_classifier.model,
+            pipeline.category_classifier.student,
+            pipeline.duplicate_detector.model
+        ]
+        for module in modules:
+            if module is None:
+                continue
+            module.eval()
+            for tensor in list(module.parameters()) + list(module.buffers()):
+                tensor.requires_grad_(False)
+
+    gc.collect()
+    gc.freeze()
+
+
+def _bind_socket(host: str, port: int) -> socket.socket:
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+def _run_worker(app, sock: socket.socket):
+    # Uvicorn installs its own SIGINT/SIGTERM handlers in the worker
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    config = uvicorn.Config(app, log_level=os.environ.get("LOG_LEVEL", "info").lower())
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+def _spawn(app, sock: socket.socket, worker_id: int) -> int:
+    pid = os.fork()
+    if pid == 0:
+        # Stable per-slot id (survives respawns) for per-worker files such as feature store shards
+        os.environ["WORKER_ID"] = str(worker_id)
+        try:
+            _run_worker(app, sock)
+        finally:
+            os._exit(0)
+    return pid
+
+
+def report_memory(worker_pids):
+    parent = process_memory()
+    print(f"📊 [Prefork] parent {parent['pid']}: RSS {parent['rss_mb']} MB")
+    for pid in worker_pids:
+        try:
+            mem = process_memory(pid)
+        except Exception:
+            continue
+        print(f"   worker {pid}: RSS {mem['rss_mb']} MB, unique (USS) {mem['uss_mb']} MB, shared {mem['shared_mb']} MB")
+
+
+def serve(app, pipeline, host: str, port: int, workers: int):
+    """Run `workers` forked uvicorn processes sharing one listening socket."""
+    freeze_shared_state(pipeline)
+    sock = _bind_socket(host, port)
+    print(f"🚀 [Prefork] Parent {os.getpid()} listening on {host}:{port}, forking {workers} workers")
+
+    children = {}  # pid -> (worker slot, fork time)
+    for worker_id in range(workers):
+        children[_spawn(app, sock, worker_id)] = (worker_id, time.time())
+    respawn_at = {}  # worker slot -> when to re-fork it (after a startup failure)
+    fast_failures = {}  # worker slot -> consecutive startup failures
+    stopping = False
+    gave_up = False
+
+    def _stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, _stop)
+    signal.signal(signal.SIGINT, _stop)
+
+    last_report = 0.0
+    while children or (respawn_at and not stopping):
+        pid = 0
+        if children:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                children.clear()
+        if pid:
+            worker_id, started = children.pop(pid, (None, None))
+            if not stopping and worker_id is not None:
+                if time.time() - started >= WORKER_MIN_UPTIME:
+                    # Re-fork from the parent: the new worker shares the same weights
+                    fast_failures[worker_id] = 0
+                    print(f"⚠️ [Prefork] Worker {pid} exited (status {status}). Respawning.")
+                    children[_spawn(app, sock, worker_id)] = (worker_id, time.time())
+                    continue
+                failures = fast_failures.get(worker_id, 0) + 1
+                fast_failures[worker_id] = failures
+                if failures >= WORKER_MAX_FAST_FAILURES:
+                    print(f"❌ [Prefork] Worker {worker_id} failed {failures} times right after starting "
+                          f"(last status {status}). Giving up and shutting down.")
+                    gave_up = True
+                    respawn_at.clear()
+                    _stop(None, None)
+                    continue
+                delay = min(WORKER_RESPAWN_BACKOFF * 2 ** (failures - 1), WORKER_RESPAWN_MAX_DELAY)
+                print(f"⚠️ [Prefork] Worker {pid} exited {time.time() - started:.1f}s after starting "
+                      f"(status {status}). Respawning in {delay:.1f}s.")
+                respawn_at[worker_id] = time.time() + delay
+            continue
+
+        for worker_id, at in list(respawn_at.items()):
+            if not stopping and time.time() >= at:
+                del respawn_at[worker_id]
+                children[_spawn(app, sock, worker_id)] = (worker_id, time.time())
+
+        if not stopping and time.time() - last_report > MEMORY_REPORT_INTERVAL:
+            report_memory(children)
+            last_report = time.time()
+        time.sleep(1)
+
+    sock.close()
+    print("✅ [Prefork] All workers stopped")
+    if gave_up:
+        raise SystemExit(1)
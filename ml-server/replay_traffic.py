@@ -0,0 +1,255 @@
+"""
+Replay captured production traffic against an in-process InferencePipeline.
+
+Capture with TRAFFIC_CAPTURE=1 (or POST /capture/settings), then copy the
+capture directory and run, e.g.
+
+    python replay_traffic.py --capture-dir traffic --speed 4
+    python replay_traffic.py --speed 0 --json after.json --baseline before.json
+
+Requests are issued at their recorded inter-arrival times divided by --speed
+(0 = back to back, bounded by --concurrency). Sampled images are replayed
+as-is; other requests get a synthetic image of the recorded size and format.
+Candidates are rebuilt from the recorded mix: stored-embedding candidates get
+random encoded vectors, URL-only candidates get an image (no network, so the
+replay measures our code, not the image host). Requests that were coalesced in
+production are skipped unless --include-coalesced is given.
+
+The report compares replayed per-stage latency with the captured latency;
+with --baseline it also shows the change against a previous replay.
+"""
+import argparse
+import asyncio
+import contextlib
+import glob
+import io
+import json
+import os
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image
+
+from pipeline.embedding_codec import encode_embedding
+from pipeline.stage_trace import StageTrace
+
+PIPELINE_ENDPOINTS = ("/predict/all", "rpc:predict_all")
+PERCENTILES = (50, 90, 99)
+
+
+def load_session(capture_dir: str, include_coalesced: bool = False, limit: int = None):
+    """All captured requests from every worker's (rotated) log, in arrival order."""
+    entries = []
+    for path in glob.glob(os.path.join(capture_dir, "capture-*.jsonl*")):
+        with open(path) as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    entries.append(json.loads(line))
+    entries.sort(key=lambda e: e["ts"])
+    skipped = 0
+    if not include_coalesced:
+        kept = [e for e in entries if not e.get("coalesced")]
+        skipped = len(entries) - len(kept)
+        entries = kept
+    return entries[:limit] if limit else entries, skipped
+
+
+class ImageSource:
+    """Captured image bytes when sampled, otherwise a synthetic image of the same shape."""
+    def __init__(self, capture_dir: str, seed: int = 0):
+        self.image_dir = os.path.join(capture_dir, "images")
+        self.rng = np.random.default_rng(seed)
+        self._synthetic = {}
+        self.pool = []
+        if os.path.isdir(self.image_dir):
+            for name in sorted(os.listdir(self.image_dir))[:64]:
+                with open(os.path.join(self.image_dir, name), "rb") as f:
+                    self.pool.append(f.read())
+        self.real = 0
+        self.synthesized = 0
+
+    def for_entry(self, entry: dict) -> bytes:
+        path = os.path.join(self.image_dir, entry["image_sha256"])
+        if entry.get("image_saved") and os.path.exists(path):
+            self.real += 1
+            with open(path, "rb") as f:
+                return f.read()
+        self.synthesized += 1
+        return self.synthetic(entry.get("width") or 640, entry.get("height") or 480, entry.get("format") or "JPEG")
+
+    def synthetic(self, width: int, height: int, fmt: str) -> bytes:
+        key = (width, height, fmt)
+        if key not in self._synthetic:
+            # Noise compresses badly, so decode cost is at least as high as a real photo's
+            pixels = self.rng.integers(0, 256, size=(height, width, 3), dtype=np.uint8)
+            buffer = io.BytesIO()
+            Image.fromarray(pixels).save(buffer, format=fmt if fmt in ("JPEG", "PNG", "WEBP", "BMP") else "JPEG")
+            self._synthetic[key] = buffer.getvalue()
+        return self._synthetic[key]
+
+    def candidate_image(self, i: int) -> bytes:
+        if self.pool:
+            return self.pool[i % len(self.pool)]
+        return self.synthetic(640, 480, "JPEG")
+
+
+def build_candidates(entry: dict, images: ImageSource, embedding_dim: int, tag: str, rng) -> list:
+    candidates = []
+    for i in range(entry.get("candidates_with_embedding", 0)):
+        vector = rng.standard_normal(embedding_dim).astype(np.float32)
+        candidates.append({"complaint_id": f"replay-e{i}", "embedding": encode_embedding(vector, "int8", tag)})
+    for i in range(entry.get("candidates_url_only", 0)):
+        candidates.append({"complaint_id": f"replay-u{i}", "image_bytes": images.candidate_image(i)})
+    return candidates
+
+
+async def replay_one(pipeline, entry: dict, images: ImageSource, embedding_dim: int, tag: str, rng) -> dict:
+    image_bytes = images.for_entry(entry)
+    candidates = build_candidates(entry, images, embedding_dim, tag, rng)
+    trace = StageTrace()
+    started = time.perf_counter()
+    error = None
+    try:
+        if entry["endpoint"] in PIPELINE_ENDPOINTS:
+            await pipeline.run_pipeline_threaded(
+                trace=trace,
+                image_bytes=image_bytes,
+                existing_complaints=candidates,
+                return_embedding=entry.get("return_embedding")
+            )
+        else:
+            def _detect():
+                with trace.stage("duplicate"):
+                    return asyncio.run(pipeline.duplicate_detector.detect(
+                        image_bytes=image_bytes,
+                        category=entry.get("category") or "Other",
+                        candidates=candidates
+                    ))
+            await asyncio.to_thread(_detect)
+    except Exception as e:
+        error = str(e)
+    return {
+        "endpoint": entry["endpoint"],
+        "total_ms": (time.perf_counter() - started) * 1000,
+        "stages_ms": trace.timings(),
+        "captured_total_ms": entry.get("total_ms"),
+        "captured_stages_ms": entry.get("stages_ms") or {},
+        "error": error
+    }
+
+
+async def replay(pipeline, entries, images: ImageSource, speed: float, concurrency: int, seed: int):
+    embedding_dim = pipeline.duplicate_detector.embedding_dim or 1280
+    # Tagged like the server's own embeddings, so they are compared rather than recomputed
+    tag = pipeline.duplicate_detector.config["tag"]
+    rng = np.random.default_rng(seed)
+    semaphore = asyncio.Semaphore(concurrency)
+    origin_ts = entries[0]["ts"]
+    start = time.perf_counter()
+
+    async def scheduled(entry):
+        if speed > 0:
+            delay = (entry["ts"] - origin_ts) / speed - (time.perf_counter() - start)
+            if delay > 0:
+                await asyncio.sleep(delay)
+        async with semaphore:
+            return await replay_one(pipeline, entry, images, embedding_dim, tag, rng)
+
+    results = await asyncio.gather(*(scheduled(e) for e in entries))
+    return results, time.perf_counter() - start
+
+
+def percentiles(values) -> dict:
+    if not values:
+        return {}
+    return {f"p{p}": round(float(np.percentile(values, p)), 2) for p in PERCENTILES}
+
+
+def summarize(results, wall_seconds: float) -> dict:
+    ok = [r for r in results if r["error"] is None]
+    stages = sorted({s for r in ok for s in r["stages_ms"]})
+    return {
+        "requests": len(results),
+        "errors": len(results) - len(ok),
+        "wall_seconds": round(wall_seconds, 2),
+        "throughput_rps": round(len(results) / wall_seconds, 2) if wall_seconds else None,
+        "total_ms": percentiles([r["total_ms"] for r in ok]),
+        "captured_total_ms": percentiles([r["captured_total_ms"] for r in ok if r["captured_total_ms"] is not None]),
+        "stages_ms": {s: percentiles([r["stages_ms"][s] for r in ok if s in r["stages_ms"]]) for s in stages},
+        "captured_stages_ms": {
+            s: percentiles([r["captured_stages_ms"][s] for r in ok if s in r["captured_stages_ms"]]) for s in stages
+        }
+    }
+
+
+def print_report(summary: dict, baseline: dict = None):
+    print(f"\n🔁 Replayed {summary['requests']} requests in {summary['wall_seconds']}s "
+          f"({summary['throughput_rps']} req/s, {summary['errors']} errors)")
+    header = "| Stage | p50 ms | p90 ms | p99 ms | captured p50 | captured p90 |"
+    if baseline:
+        header += " Δ p50 vs baseline | Δ p90 vs baseline |"
+    print(header)
+    print("|" + "---|" * (header.count("|") - 1))
+
+    rows = [("total", summary["total_ms"], summary["captured_total_ms"], (baseline or {}).get("total_ms"))]
+    for stage, stats in summary["stages_ms"].items():
+        rows.append((stage, stats, summary["captured_stages_ms"].get(stage, {}),
+                     (baseline or {}).get("stages_ms", {}).get(stage)))
+
+    for name, stats, captured, base in rows:
+        line = (f"| {name} | {stats.get('p50', '-')} | {stats.get('p90', '-')} | {stats.get('p99', '-')} | "
+                f"{captured.get('p50', '-')} | {captured.get('p90', '-')} |")
+        if baseline:
+            for p in ("p50", "p90"):
+                if base and base.get(p) and stats.get(p) is not None:
+                    line += f" {(stats[p] - base[p]) / base[p]:+.1%} |"
+                else:
+                    line += " - |"
+        print(line)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Replay captured traffic against an in-process pipeline")
+    parser.add_argument('--capture-dir', default=os.environ.get("TRAFFIC_CAPTURE_DIR", "traffic"))
+    parser.add_argument('--speed', type=float, default=1.0,
+                        help="Speed-up over recorded arrival times (0 = as fast as possible)")
+    parser.add_argument('--concurrency', type=int, default=8, help="Max requests in flight")
+    parser.add_argument('--limit', type=int, default=None, help="Replay only the first N requests")
+    parser.add_argument('--include-coalesced', action='store_true',
+                        help="Also replay requests that shared another request's run in production")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', default=None, help="Write the summary to this file")
+    parser.add_argument('--baseline', default=None, help="Summary JSON of a previous replay to compare with")
+    parser.add_argument('--verbose', action='store_true', help="Show the pipeline's per-request logging")
+    args = parser.parse_args()
+
+    entries, skipped = load_session(args.capture_dir, args.include_coalesced, args.limit)
+    if not entries:
+        print(f"❌ No captured requests found in '{args.capture_dir}'.")
+        raise SystemExit(1)
+    print(f"📼 Loaded {len(entries)} requests from '{args.capture_dir}' ({skipped} coalesced skipped)")
+
+    # Keep replayed runs out of the production feature store
+    os.environ.setdefault("FEATURE_STORE_DIR", tempfile.mkdtemp(prefix="replay-features-"))
+    from pipeline.inference_pipeline import InferencePipeline
+    pipeline = InferencePipeline()
+    images = ImageSource(args.capture_dir, args.seed)
+
+    output = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(open(os.devnull, "w"))
+    with output:
+        results, wall_seconds = asyncio.run(replay(pipeline, entries, images, args.speed, args.concurrency, args.seed))
+    print(f"   Images: {images.real} captured, {images.synthesized} synthesized")
+
+    summary = summarize(results, wall_seconds)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    print_report(summary, baseline)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(summary, f, indent=2)
+        print(f"💾 Summary saved to: {os.path.abspath(args.json)}")
@@ -0,0 +1,241 @@
+"""
+Score image folders offline with the inference pipeline (no server needed).
+
+Images are fanned out over a process pool; each worker holds a loaded
+InferencePipeline (loaded once in the parent and shared copy-on-write where
+fork is available, otherwise loaded by every worker). Results are appended to
+<output>.partial.jsonl and flushed every --checkpoint-every images, so an
+interrupted run picks up where it stopped when started again with the same
+output. Images that failed, or changed since they were scored, are retried.
+
+Usage:
+    python score_images.py datasets/raw --output scores.csv
+    python score_images.py data/train datasets/raw --output scores.parquet --workers 16
+    python score_images.py datasets/raw --output scores.jsonl --fresh
+
+Output format follows the extension (.jsonl, .csv, .parquet; Parquet needs pandas + pyarrow).
+"""
+import argparse
+import asyncio
+import csv
+import hashlib
+import io
+import json
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+VALID_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.gif', '.webp')
+COLUMNS = [
+    "path", "file_size", "mtime", "sha256", "category", "severity_score", "severity_label",
+    "priority", "description", "elapsed_ms", "worker", "error"
+]
+
+# Set in each worker process
+_pipeline = None
+
+
+def find_images(roots):
+    images = []
+    for root in roots:
+        if os.path.isfile(root):
+            images.append(os.path.abspath(root))
+            continue
+        for dirpath, _, files in os.walk(root):
+            for name in files:
+                if name.lower().endswith(VALID_EXTENSIONS):
+                    images.append(os.path.abspath(os.path.join(dirpath, name)))
+    return sorted(images)
+
+
+def file_key(path: str):
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime_ns
+
+
+def load_checkpoint(partial_path: str) -> dict:
+    """path -> last successful record (a torn last line from a crash is ignored)."""
+    done = {}
+    if not os.path.exists(partial_path):
+        return done
+    with open(partial_path) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if record.get("error") is None:
+                done[record["path"]] = record
+            else:
+                done.pop(record["path"], None)
+    return done
+
+
+def _build_pipeline():
+    from pipeline.inference_pipeline import InferencePipeline
+    return InferencePipeline()
+
+
+def _init_worker(preloaded, verbose: bool):
+    global _pipeline
+    # Separate feature-store shard per worker (it lives in a scratch directory)
+    os.environ["WORKER_ID"] = str(os.getpid())
+    if not verbose:
+        sys.stdout = open(os.devnull, "w")
+    _pipeline = preloaded if preloaded is not None else _build_pipeline()
+
+
+def _check_decodes(image_bytes: bytes):
+    """Raise unless the bytes are a complete image (a full decode also catches truncated files)."""
+    from PIL import Image
+    try:
+        with Image.open(io.BytesIO(image_bytes)) as image:
+            image.load()
+    except Exception as e:
+        raise ValueError(f"not a decodable image: {e}")
+
+
+def score_one(path: str) -> dict:
+    started = time.perf_counter()
+    record = {"path": path, "file_size": None, "mtime": None, "worker": os.getpid(), "error": None}
+    try:
+        # The file may have vanished or become unreadable since it was listed
+        record["file_size"], record["mtime"] = file_key(path)
+        with open(path, "rb") as f:
+            image_bytes = f.read()
+        record["sha256"] = hashlib.sha256(image_bytes).hexdigest()
+        # The pipeline stages fall back to default answers on undecodable input, which
+        # would be recorded as real scores and never retried
+        _check_decodes(image_bytes)
+        result = asyncio.run(_pipeline.run_pipeline(image_bytes, record_id=record["sha256"]))
+        for column in ("category", "severity_score", "severity_label", "priority", "description"):
+            record[column] = result.get(column)
+    except Exception as e:
+        record["error"] = str(e)
+    record["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 2)
+    return record
+
+
+def write_output(records, output: str):
+    records = sorted(records, key=lambda r: r["path"])
+    extension = os.path.splitext(output)[1].lower()
+    tmp_path = output + ".tmp"
+    if extension == ".csv":
+        with open(tmp_path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=COLUMNS, extrasaction="ignore")
+            writer.writeheader()
+            writer.writerows(records)
+    elif extension == ".parquet":
+        import pandas as pd
+        pd.DataFrame(records, columns=COLUMNS).to_parquet(tmp_path, index=False)
+    else:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for record in records:
+                f.write(json.dumps(record) + "\n")
+    os.replace(tmp_path, output)
+
+
+def run(roots, output: str, workers: int, checkpoint_every: int, fresh: bool, verbose: bool):
+    extension = os.path.splitext(output)[1].lower()
+    if extension == ".parquet":
+        try:
+            import pandas  # noqa: F401
+            import pyarrow  # noqa: F401
+        except ImportError:
+            print("❌ Parquet output needs pandas and pyarrow (pip install pandas pyarrow), or use .csv/.jsonl.")
+            return
+
+    partial_path = output + ".partial.jsonl"
+    if fresh and os.path.exists(partial_path):
+        os.remove(partial_path)
+
+    images = find_images(roots)
+    done = load_checkpoint(partial_path)
+    todo, missing = [], set()
+    for path in images:
+        try:
+            key = file_key(path)
+        except OSError as e:
+            # Deleted or unreadable since the directory walk; reported, not scored
+            missing.add(path)
+            print(f"⚠️ {path}: {e}")
+            continue
+        if path not in done or (done[path]["file_size"], done[path]["mtime"]) != key:
+            todo.append(path)
+    print(f"🗂️ {len(images)} images found, {len(images) - len(missing) - len(todo)} already scored, "
+          f"{len(todo)} to go" + (f", {len(missing)} unreadable" if missing else ""))
+    images = [p for p in images if p not in missing]
+
+    scratch_dir = None
+    if todo and "FEATURE_STORE_DIR" not in os.environ:
+        # Workers write feature-store segments to a scratch directory, not the server's store
+        scratch_dir = tempfile.mkdtemp(prefix="score-features-")
+        os.environ["FEATURE_STORE_DIR"] = scratch_dir
+    try:
+        if todo:
+            _score(todo, done, partial_path, workers, checkpoint_every, verbose)
+    except KeyboardInterrupt:
+        print("   Run the same command again to resume.")
+        return
+    finally:
+        if scratch_dir is not None:
+            shutil.rmtree(scratch_dir, ignore_errors=True)
+
+    records = [done[p] for p in images if p in done]
+    write_output(records, output)
+    print(f"💾 {len(records)} results saved to: {os.path.abspath(output)}")
+    if len(records) < len(images):
+        print(f"⚠️ {len(images) - len(records)} image(s) failed; rerun to retry them.")
+
+
+def _score(todo, done: dict, partial_path: str, workers: int, checkpoint_every: int, verbose: bool):
+    """Score `todo` in a process pool, appending every record to the checkpoint (and `done` on success)."""
+    workers = max(1, min(workers, len(todo)))
+    if "fork" in multiprocessing.get_all_start_methods():
+        # Load once, share weights copy-on-write with every worker
+        from prefork import freeze_shared_state
+        preloaded = _build_pipeline()
+        freeze_shared_state(preloaded)
+        context = multiprocessing.get_context("fork")
+    else:
+        preloaded = None
+        context = multiprocessing.get_context("spawn")
+
+    print(f"🚀 Scoring with {workers} worker process(es)...")
+    started = time.time()
+    completed = failed = 0
+    with open(partial_path, "a", encoding="utf-8") as checkpoint, \
+            context.Pool(workers, initializer=_init_worker, initargs=(preloaded, verbose)) as pool:
+        try:
+            for record in pool.imap_unordered(score_one, todo, chunksize=4):
+                checkpoint.write(json.dumps(record) + "\n")
+                completed += 1
+                if record["error"] is None:
+                    done[record["path"]] = record
+                else:
+                    failed += 1
+                    print(f"⚠️ {record['path']}: {record['error']}")
+                if completed % checkpoint_every == 0 or completed == len(todo):
+                    checkpoint.flush()
+                    os.fsync(checkpoint.fileno())
+                    rate = completed / max(time.time() - started, 1e-6)
+                    print(f"   {completed}/{len(todo)} ({rate:.1f} img/s, {failed} failed)")
+        except KeyboardInterrupt:
+            checkpoint.flush()
+            pool.terminate()
+            print(f"\n⏸️ Interrupted after {completed} images.")
+            raise
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Batch-score image folders with the inference pipeline")
+    parser.add_argument('paths', nargs='+', help="Image files or directories (searched recursively)")
+    parser.add_argument('--output', default='scores.jsonl', help="Results file: .jsonl, .csv or .parquet")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--checkpoint-every', type=int, default=100, help="Images between checkpoint flushes")
+    parser.add_argument('--fresh', action='store_true', help="Ignore an existing checkpoint and start over")
+    parser.add_argument('--verbose', action='store_true', help="Show the pipeline's per-image logging")
+    args = parser.parse_args()
+    run(args.paths, args.output, args.workers, args.checkpoint_every, args.fresh, args.verbose)
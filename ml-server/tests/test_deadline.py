@@ -0,0 +1,60 @@
+import pytest
+
+from pipeline import deadline as deadline_module
+from pipeline.deadline import MAX_DEADLINE_MS, RESERVE_MS, Deadline
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(deadline_module.time, "monotonic", clock)
+    return clock
+
+
+def test_remaining_keeps_the_reserve_back(clock):
+    deadline = Deadline(2000)
+    assert deadline.remaining_ms() == pytest.approx(2000 - RESERVE_MS)
+    clock.now += 0.5
+    assert deadline.remaining_ms() == pytest.approx(1500 - RESERVE_MS)
+    assert deadline.elapsed_ms() == pytest.approx(500)
+
+
+def test_expires_when_only_the_reserve_is_left(clock):
+    deadline = Deadline(1000)
+    assert not deadline.expired
+    clock.now += (1000 - RESERVE_MS) / 1000
+    assert deadline.expired
+    clock.now += 10
+    assert deadline.remaining() == 0.0
+
+
+def test_allows(clock):
+    deadline = Deadline(RESERVE_MS + 1000)
+    assert deadline.allows(999)
+    assert not deadline.allows(1001)
+
+
+def test_budget_is_capped_and_never_negative(clock):
+    assert Deadline(MAX_DEADLINE_MS * 10).budget_ms == MAX_DEADLINE_MS
+    assert Deadline(-5).budget_ms == 0.0
+    assert Deadline(-5).expired
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("1500", 1500.0),
+    (2500, 2500.0),
+    (None, deadline_module.DEFAULT_DEADLINE_MS),
+    ("", deadline_module.DEFAULT_DEADLINE_MS),
+    ("soon", deadline_module.DEFAULT_DEADLINE_MS),
+    ([1], deadline_module.DEFAULT_DEADLINE_MS),
+])
+def test_from_header(clock, value, expected):
+    assert Deadline.from_header(value).budget_ms == min(expected, MAX_DEADLINE_MS)
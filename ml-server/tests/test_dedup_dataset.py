@@ -0,0 +1,46 @@
+from collections import Counter
+
+import pytest
+
+pytest.importorskip("numpy")
+pytest.importorskip("PIL")
+
+from dedup_dataset import UnionFind, group_split
+
+
+def make_members():
+    # 10 Chair groups, 5 Pipe groups; group 14 mixes labels but is mostly Pipe
+    members = {g: ["Chair"] * (1 + g % 3) for g in range(10)}
+    members.update({g: ["Pipe", "Pipe"] for g in range(10, 14)})
+    members[14] = ["Pipe", "Pipe", "Chair"]
+    return members
+
+
+def test_every_group_gets_exactly_one_side():
+    members = make_members()
+    split = group_split(members, 0.2, seed=42)
+    assert set(split) == set(members)
+    assert set(split.values()) <= {"train", "val"}
+
+
+def test_val_fraction_is_applied_per_class():
+    split = group_split(make_members(), 0.2, seed=42)
+    val = Counter("Chair" if g < 10 else "Pipe" for g, side in split.items() if side == "val")
+    assert val == {"Chair": 2, "Pipe": 1}
+
+
+def test_split_is_deterministic_for_a_seed():
+    members = make_members()
+    assert group_split(members, 0.3, seed=7) == group_split(dict(reversed(list(members.items()))), 0.3, seed=7)
+
+
+def test_zero_fraction_keeps_everything_in_train():
+    assert set(group_split(make_members(), 0.0, seed=1).values()) == {"train"}
+
+
+def test_union_find_merges_transitively():
+    uf = UnionFind(5)
+    uf.union(0, 3)
+    uf.union(3, 4)
+    assert uf.find(4) == uf.find(0) == 0
+    assert uf.find(1) != uf.find(0)
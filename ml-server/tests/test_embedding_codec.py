@@ -0,0 +1,82 @@
+import base64
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from pipeline.embedding_codec import (
+    HEADER, LEGACY_TAG, TAG_ID, EmbeddingTagMismatch, decode_embedding, encode_embedding,
+    pack_embedding, unpack_embedding
+)
+
+
+@pytest.fixture
+def vector():
+    return np.random.default_rng(0).standard_normal(1280).astype(np.float32)
+
+
+def test_float16_round_trip(vector):
+    decoded = unpack_embedding(pack_embedding(vector, "float16"))
+    assert decoded.dtype == np.float32
+    assert decoded.shape == vector.shape
+    np.testing.assert_allclose(decoded, vector, rtol=1e-3, atol=1e-3)
+
+
+def test_int8_round_trip_within_one_quantization_step(vector):
+    blob = pack_embedding(vector, "int8")
+    assert len(blob) == HEADER.size + vector.size
+    scale = np.max(np.abs(vector)) / 127.0
+    assert np.max(np.abs(unpack_embedding(blob) - vector)) <= scale / 2 + 1e-6
+
+
+def test_base64_and_raw_forms_decode_the_same(vector):
+    text = encode_embedding(vector, "int8")
+    np.testing.assert_array_equal(decode_embedding(text), decode_embedding(base64.b64decode(text)))
+
+
+def test_zero_vector():
+    decoded = unpack_embedding(pack_embedding(np.zeros(8), "int8"))
+    np.testing.assert_array_equal(decoded, np.zeros(8, dtype=np.float32))
+
+
+def test_unknown_dtype_rejected(vector):
+    with pytest.raises(ValueError):
+        pack_embedding(vector, "float64")
+
+
+@pytest.mark.parametrize("blob", [b"", b"EM", b"XX" + bytes(HEADER.size)])
+def test_malformed_blob_rejected(blob):
+    with pytest.raises(ValueError):
+        unpack_embedding(blob)
+
+
+def test_truncated_payload_rejected(vector):
+    with pytest.raises(ValueError):
+        unpack_embedding(pack_embedding(vector, "int8")[:-1])
+
+
+def test_tag_round_trip(vector):
+    blob = pack_embedding(vector, "int8", tag="resnet18@224")
+    assert len(blob) == HEADER.size + TAG_ID.size + vector.size
+    np.testing.assert_array_equal(unpack_embedding(blob, expected_tag="resnet18@224"), unpack_embedding(blob))
+
+
+def test_same_dimension_different_tag_rejected(vector):
+    # mobilenet_v2 and efficientnet_b0 both produce 1280-d vectors
+    blob = encode_embedding(vector, "int8", tag="efficientnet_b0@224")
+    with pytest.raises(EmbeddingTagMismatch):
+        decode_embedding(blob, expected_tag="mobilenet_v2@224")
+    with pytest.raises(EmbeddingTagMismatch):
+        decode_embedding(encode_embedding(vector, "int8", tag="mobilenet_v2@160"), expected_tag="mobilenet_v2@224")
+
+
+def test_untagged_blobs_count_as_legacy_tag(vector):
+    blob = pack_embedding(vector, "int8")
+    unpack_embedding(blob, expected_tag=LEGACY_TAG)
+    with pytest.raises(EmbeddingTagMismatch):
+        unpack_embedding(blob, expected_tag="resnet18@224")
+
+
+def test_tagged_header_without_tag_rejected(vector):
+    with pytest.raises(ValueError):
+        unpack_embedding(pack_embedding(vector, "int8", tag="resnet18@224")[:HEADER.size + 2])
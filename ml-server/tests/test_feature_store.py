@@ -0,0 +1,62 @@
+import asyncio
+
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("PIL")
+
+from models.severity_detector import CATEGORY_BASE_SEVERITY, SEVERITY_SCORES, SeverityDetector
+from pipeline.feature_store import SeverityFeatureStore
+from pipeline.priority_logic import PriorityLogic
+
+CATEGORIES = ['Bench', 'Chair', 'Other', 'Pipe', 'Projector', 'Socket']
+EDGE_DENSITIES = [0.01, 0.05, 0.10, 0.25, 0.40, None]
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.setenv("FEATURE_STORE_DIR", str(tmp_path))
+    return SeverityFeatureStore(CATEGORIES)
+
+
+def one_hot(category):
+    return [1.0 if c == category else 0.0 for c in CATEGORIES]
+
+
+def test_rescore_matches_live_rules_at_default_thresholds(store):
+    detector, priority_logic = SeverityDetector(), PriorityLogic()
+    expected = {}
+    for category in CATEGORIES:
+        for i, edge_density in enumerate(EDGE_DENSITIES):
+            record_id = f"{category}-{i}"
+            if edge_density is None:
+                # What the pipeline records when severity detection fails
+                live = asyncio.run(detector.analyze(b"not an image", category=category))
+                assert live["edge_density"] is None
+                severity = live["severity"]
+            else:
+                severity = detector._adjust_severity(CATEGORY_BASE_SEVERITY[category], edge_density)
+            priority = asyncio.run(priority_logic.determine_priority(SEVERITY_SCORES[severity]))
+            expected[record_id] = (category, severity, priority)
+            store.add(record_id, category=category, probabilities=one_hot(category), edge_density=edge_density)
+
+    result = store.rescore()
+    assert len(result["ids"]) == len(expected)
+    for i, record_id in enumerate(result["ids"]):
+        category, severity, priority = expected[str(record_id)]
+        assert result["category"][i] == category
+        assert result["severity_label"][i] == severity
+        assert result["severity_score"][i] == pytest.approx(SEVERITY_SCORES[severity])
+        assert result["priority"][i] == priority
+
+
+def test_rescore_uses_newest_record_per_id(store):
+    store.add("a", category="Chair", probabilities=one_hot("Chair"), edge_density=0.1,
+              embedding=np.ones(8), classifier_features=np.ones(16), features_source="test")
+    store.flush()
+    store.add("a", category="Socket", probabilities=one_hot("Socket"), edge_density=0.1)
+    store.add("b", category="Pipe", probabilities=None, edge_density=0.1)
+
+    result = store.rescore()
+    by_id = dict(zip(result["ids"].tolist(), result["category"].tolist()))
+    assert by_id == {"a": "Socket", "b": "Pipe"}
@@ -0,0 +1,76 @@
+import asyncio
+import io
+
+import pytest
+
+Image = pytest.importorskip("PIL.Image")
+pytest.importorskip("psutil")
+
+from pipeline import memory_governor
+from pipeline.memory_governor import (
+    DECODE_COPIES, MB, TENSOR_OVERHEAD_BYTES, MemoryBudgetTimeout, MemoryGovernor
+)
+
+
+def png(width: int, height: int) -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", (width, height)).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def governor(monkeypatch):
+    # Fixed resident baseline, so admission only depends on the reservations
+    monkeypatch.setattr(memory_governor, "process_memory", lambda: {"rss_mb": 100})
+    governor = MemoryGovernor()
+    governor.budget_bytes = 100 * MB + 2 * (TENSOR_OVERHEAD_BYTES + 1000 * 1000 * 3 * DECODE_COPIES)
+    return governor
+
+
+def test_estimate_reads_the_header_only():
+    assert MemoryGovernor().estimate(png(400, 300)) == 400 * 300 * 3 * DECODE_COPIES + TENSOR_OVERHEAD_BYTES
+
+
+def test_lone_oversized_request_is_admitted(governor):
+    async def main():
+        async with governor.admit(png(4000, 4000)):
+            assert governor.active == 1
+
+    asyncio.run(main())
+    assert governor.admitted_count == 1
+    assert governor.reserved_bytes == 0
+
+
+def test_request_waits_until_memory_is_released(governor):
+    image = png(1000, 1000)
+    order = []
+
+    async def request(name, hold):
+        async with governor.admit(image):
+            order.append(f"{name} in")
+            await asyncio.sleep(hold)
+            order.append(f"{name} out")
+
+    async def main():
+        # Two fit the budget, the third has to wait for one of them
+        await asyncio.gather(request("a", 0.05), request("b", 0.05), request("c", 0))
+
+    asyncio.run(main())
+    assert order.index("c in") > min(order.index("a out"), order.index("b out"))
+    assert governor.queued_count == 1
+    assert governor.active == 0 and governor.waiting == 0
+
+
+def test_wait_is_bounded_by_timeout(governor):
+    image = png(1000, 1000)
+
+    async def main():
+        async with governor.admit(image), governor.admit(image):
+            with pytest.raises(MemoryBudgetTimeout):
+                async with governor.admit(image, timeout=0.01):
+                    pass
+
+    asyncio.run(main())
+    assert governor.rejected_count == 1
+    assert governor.waiting == 0
+    assert governor.reserved_bytes == 0
@@ -0,0 +1,50 @@
+import struct
+
+import pytest
+
+from api.rpc_protocol import U16, U32, RpcError, decode_frame, encode_frame
+
+
+def body_of(frame: bytes) -> bytes:
+    length, = U32.unpack_from(frame, 0)
+    assert length == len(frame) - 4
+    return frame[4:]
+
+
+def test_round_trip_with_blobs():
+    header = {"method": "predict_all", "image_blob": 0, "candidates": [{"complaint_id": "c1", "embedding_blob": 1}]}
+    blobs = [b"\xff\xd8image", b"", b"EM\x02embedding"]
+    request_id, decoded, decoded_blobs = decode_frame(body_of(encode_frame(7, header, blobs)))
+    assert request_id == 7
+    assert decoded == header
+    assert decoded_blobs == blobs
+
+
+def test_empty_header_and_no_blobs():
+    body = U32.pack(3) + U16.pack(0) + U16.pack(0)
+    assert decode_frame(body) == (3, {}, [])
+
+
+def test_blob_longer_than_frame_is_a_client_error():
+    body = body_of(encode_frame(1, {"method": "ping"}, [b"abcdef"]))
+    with pytest.raises(RpcError) as excinfo:
+        decode_frame(body[:-2])
+    assert excinfo.value.status == 400
+
+
+@pytest.mark.parametrize("body", [
+    b"",                                                  # no request id
+    U32.pack(1),                                          # no header length
+    U32.pack(1) + U16.pack(2) + b"{}",                    # no blob count
+    U32.pack(1) + U16.pack(2) + b"{}" + U16.pack(1),      # blob length missing
+])
+def test_truncated_frame_raises_struct_error(body):
+    with pytest.raises(struct.error):
+        decode_frame(body)
+
+
+@pytest.mark.parametrize("header", [b"not json", b"[1, 2]", b"\xff\xfe"])
+def test_bad_header_raises_value_error(header):
+    body = U32.pack(1) + U16.pack(len(header)) + header + U16.pack(0)
+    with pytest.raises(ValueError):
+        decode_frame(body)
@@ -0,0 +1,62 @@
+import io
+import json
+
+import pytest
+
+from score_images import load_checkpoint, score_one
+
+
+def record(path, error=None):
+    return {"path": path, "file_size": 10, "mtime": 1, "error": error}
+
+
+def write_lines(path, lines):
+    with open(path, "w") as f:
+        f.write("".join(lines))
+
+
+def test_missing_checkpoint_is_empty(tmp_path):
+    assert load_checkpoint(str(tmp_path / "none.partial.jsonl")) == {}
+
+
+def test_torn_last_line_is_ignored(tmp_path):
+    partial = tmp_path / "scores.jsonl.partial.jsonl"
+    torn = json.dumps(record("/img/b.jpg"))[:25]
+    write_lines(partial, [json.dumps(record("/img/a.jpg")) + "\n", torn])
+    assert list(load_checkpoint(str(partial))) == ["/img/a.jpg"]
+
+
+def test_later_records_win(tmp_path):
+    partial = tmp_path / "scores.jsonl.partial.jsonl"
+    write_lines(partial, [
+        json.dumps(record("/img/a.jpg")) + "\n",
+        json.dumps(record("/img/a.jpg", error="decode failed")) + "\n",  # retried and failed: rescore
+        json.dumps(record("/img/b.jpg", error="decode failed")) + "\n",
+        json.dumps(record("/img/b.jpg")) + "\n",                         # retried and succeeded
+    ])
+    assert list(load_checkpoint(str(partial))) == ["/img/b.jpg"]
+
+
+def test_vanished_file_becomes_an_error_record(tmp_path):
+    result = score_one(str(tmp_path / "gone.jpg"))
+    assert result["error"]
+    assert result["file_size"] is None
+
+
+@pytest.mark.parametrize("content", [b"not an image", b"\xff\xd8\xff\xe0" + b"\x00" * 20])
+def test_undecodable_file_becomes_an_error_record(tmp_path, content):
+    pytest.importorskip("PIL")
+    path = tmp_path / "broken.jpg"
+    path.write_bytes(content)
+    result = score_one(str(path))
+    assert result["error"].startswith("not a decodable image")
+    assert result.get("category") is None
+
+
+def test_truncated_image_becomes_an_error_record(tmp_path):
+    Image = pytest.importorskip("PIL.Image")
+    buffer = io.BytesIO()
+    Image.new("RGB", (64, 64), "red").save(buffer, format="PNG")
+    path = tmp_path / "truncated.png"
+    path.write_bytes(buffer.getvalue()[:-40])
+    assert score_one(str(path))["error"]
@@ -0,0 +1,26 @@
+from pipeline.shared_settings import SharedSettings
+
+
+def test_poll_sees_values_saved_by_another_instance(tmp_path, monkeypatch):
+    monkeypatch.setenv("SHARED_SETTINGS_POLL", "0")
+    path = str(tmp_path / "settings.json")
+    writer, reader = SharedSettings(path), SharedSettings(path)
+    assert reader.poll() is None
+
+    writer.save({"enabled": True})
+    assert reader.poll() == {"enabled": True}
+    # Unchanged file: nothing new
+    assert reader.poll() is None
+
+    writer.save({"enabled": False})
+    assert reader.poll() == {"enabled": False}
+
+
+def test_poll_is_rate_limited(tmp_path, monkeypatch):
+    monkeypatch.setenv("SHARED_SETTINGS_POLL", "3600")
+    path = str(tmp_path / "settings.json")
+    writer, reader = SharedSettings(path), SharedSettings(path)
+    writer.save({"enabled": True})
+    assert reader.poll() == {"enabled": True}
+    writer.save({"enabled": False})
+    assert reader.poll() is None
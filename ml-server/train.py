@@ -1,23 +1,74 @@
 import torch
 import torch.nn as nn
 import torch.optim as optim
-from torchvision import datasets, models, transforms
+from torchvision import datasets, transforms
 from torch.utils.data import DataLoader, random_split
+import argparse
+import json
 import os
 import time
 
-def train_model():
+from models.backbones import (
+    BACKBONES, DEFAULT_BACKBONE, build_model, get_head, load_model_config, save_model_config
+)
+from models.student_network import (
+    build_student, STUDENT_INPUT_SIZE, STUDENT_WEIGHTS_PATH, STUDENT_META_PATH
+)
+
+# Point directly to the existing folder structure
+DATA_DIR = os.path.join('datasets', 'category_classification')
+MODEL_SAVE_PATH = 'model.pth'
+
+
+class ManifestDataset(torch.utils.data.Dataset):
+    """(image, class index) pairs listed in a dedup_dataset.py manifest."""
+    def __init__(self, samples, classes, transform=None):
+        self.samples = samples
+        self.classes = classes
+        self.transform = transform
+
+    def __len__(self):
+        return len(self.samples)
+
+    def __getitem__(self, index):
+        path, target = self.samples[index]
+        image = datasets.folder.default_loader(path)
+        if self.transform is not None:
+            image = self.transform(image)
+        return image, target
+
+
+def load_manifest_splits(manifest_path):
+    """
+    Deduplicated, group-aware train/val samples from a manifest
+    (near-duplicates never straddle the split, so val accuracy is honest).
+    """
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+    classes = manifest["classes"]
+    splits = {'train': [], 'val': []}
+    for entry in manifest["images"]:
+        path = os.path.join(manifest["data_dir"], entry["path"])
+        # Files renamed to .bad by the integrity check are skipped
+        if entry["keep"] and os.path.exists(path):
+            splits[entry["split"]].append((path, classes.index(entry["label"])))
+    return classes, splits['train'], splits['val']
+
+
+def train_model(backbone=DEFAULT_BACKBONE, input_size=None, manifest=None):
     # 1. Configuration
-    # Point directly to the existing folder structure
-    DATA_DIR = os.path.join('datasets', 'category_classification')
-    MODEL_SAVE_PATH = 'model.pth'
     NUM_EPOCHS = 10
     BATCH_SIZE = 32
     LEARNING_RATE = 0.001
+    input_size = input_size or BACKBONES[backbone]["default_input_size"]
+    data_dir = DATA_DIR
+    if manifest:
+        with open(manifest) as f:
+            data_dir = json.load(f)["data_dir"]
     
     # Check if data exists
-    if not os.path.exists(DATA_DIR):
-        print(f"❌ Data directory '{DATA_DIR}' not found.")
+    if not os.path.exists(data_dir):
+        print(f"❌ Data directory '{data_dir}' not found.")
         print("   Please ensure you have 'datasets/category_classification' with category folders.")
         return
 
@@ -26,7 +77,7 @@ def train_model():
     valid_extensions = ('.jpg', '.jpeg', '.png', '.bmp', '.gif')
     bad_files = 0
     
-    for root, dirs, files in os.walk(DATA_DIR):
+    for root, dirs, files in os.walk(data_dir):
         for file in files:
             if file.lower().endswith(valid_extensions):
                 path = os.path.join(root, file)
@@ -62,9 +113,9 @@ def train_model():
     # We use the same transform for both initially for simplicity in splitting a single dataset
     # Ideally, train gets augmentation and val gets only resize, but for auto-split 
     # on a small dataset, this robust transform set is acceptable.
+    # Same resize as CategoryClassifier at serving time, so train and serve agree
     data_transforms = transforms.Compose([
-        transforms.Resize(256),
-        transforms.CenterCrop(224),
+        transforms.Resize((input_size, input_size)),
         transforms.RandomHorizontalFlip(), # Basic augmentation
         transforms.ToTensor(),
         transforms.Normalize([0.485, 0.456, 0.406], [0.229, 0.224, 0.225])
@@ -72,14 +123,29 @@ def train_model():
 
     # 3. Load and Split Data
     try:
-        full_dataset = datasets.ImageFolder(DATA_DIR, transform=data_transforms)
-        
-        # Calculate split sizes (80% train, 20% validation)
-        total_size = len(full_dataset)
-        train_size = int(0.8 * total_size)
-        val_size = total_size - train_size
-        
-        train_dataset, val_dataset = random_split(full_dataset, [train_size, val_size])
+        if manifest:
+            # Pre-split by dedup_dataset.py, so val can skip augmentation
+            class_names, train_samples, val_samples = load_manifest_splits(manifest)
+            val_transforms = transforms.Compose([
+                transforms.Resize((input_size, input_size)),
+                transforms.ToTensor(),
+                transforms.Normalize([0.485, 0.456, 0.406], [0.229, 0.224, 0.225])
+            ])
+            train_dataset = ManifestDataset(train_samples, class_names, data_transforms)
+            val_dataset = ManifestDataset(val_samples, class_names, val_transforms)
+            train_size, val_size = len(train_dataset), len(val_dataset)
+            total_size = train_size + val_size
+            print(f"📋 Using deduplicated manifest: {manifest}")
+        else:
+            full_dataset = datasets.ImageFolder(data_dir, transform=data_transforms)
+            class_names = full_dataset.classes
+
+            # Calculate split sizes (80% train, 20% validation)
+            total_size = len(full_dataset)
+            train_size = int(0.8 * total_size)
+            val_size = total_size - train_size
+
+            train_dataset, val_dataset = random_split(full_dataset, [train_size, val_size])
         
         dataloaders = {
             'train': DataLoader(train_dataset, batch_size=BATCH_SIZE, shuffle=True, num_workers=0),
@@ -87,7 +153,6 @@ def train_model():
         }
         
         dataset_sizes = {'train': train_size, 'val': val_size}
-        class_names = full_dataset.classes
         
         print(f"✅ Found {len(class_names)} classes: {class_names}")
         print(f"   Total images: {total_size}")
@@ -106,20 +171,22 @@ def train_model():
     device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
     print(f"   Using device: {device}")
 
-    model = models.mobilenet_v2(pretrained=True)
+    print(f"   Backbone: {backbone} @ {input_size}px")
+
+    # Pretrained backbone with the head replaced for our classes
+    model = build_model(backbone, num_classes=len(class_names), pretrained=True)
     
-    # Freeze base layers
+    # Freeze base layers, train only the new head
     for param in model.parameters():
         param.requires_grad = False
-        
-    # Replace the head
-    num_ftrs = model.classifier[1].in_features
-    model.classifier[1] = nn.Linear(num_ftrs, len(class_names))
+    head = get_head(model, backbone)
+    for param in head.parameters():
+        param.requires_grad = True
     
     model = model.to(device)
     
     criterion = nn.CrossEntropyLoss()
-    optimizer = optim.Adam(model.classifier.parameters(), lr=LEARNING_RATE)
+    optimizer = optim.Adam(head.parameters(), lr=LEARNING_RATE)
 
     # 5. Training Loop
     print("\n🚀 Starting Training...")
@@ -166,11 +233,192 @@ def train_model():
             if phase == 'val' and epoch_acc > best_acc:
                 best_acc = epoch_acc
                 torch.save(model.state_dict(), MODEL_SAVE_PATH)
+                # Tells CategoryClassifier which architecture/resolution model.pth needs
+                save_model_config(backbone, input_size, class_names, manifest)
 
     time_elapsed = time.time() - since
     print(f'\n🏁 Training complete in {time_elapsed // 60:.0f}m {time_elapsed % 60:.0f}s')
     print(f'   Best val Acc: {best_acc:4f}')
     print(f"💾 Model saved to: {os.path.abspath(MODEL_SAVE_PATH)}")
 
+class PairTransform:
+    """Return the same image at teacher and student resolution."""
+    def __init__(self, teacher_tf, student_tf):
+        self.teacher_tf = teacher_tf
+        self.student_tf = student_tf
+
+    def __call__(self, image):
+        return self.teacher_tf(image), self.student_tf(image)
+
+
+def calibrate_threshold(student_conf, student_correct, teacher_correct, min_threshold=0.5):
+    """
+    Lowest confidence threshold at which the images the student keeps are
+    classified at least as accurately as the teacher would on the same images.
+    Everything below the threshold escalates, so hard cases keep teacher accuracy.
+    """
+    order = torch.argsort(student_conf, descending=True)
+    conf = student_conf[order]
+    s_cum = torch.cumsum(student_correct[order].float(), 0)
+    t_cum = torch.cumsum(teacher_correct[order].float(), 0)
+
+    threshold = 1.01  # Never trust the student
+    for i in range(len(conf)):
+        # Only cut between distinct confidence values
+        if i + 1 < len(conf) and conf[i + 1] == conf[i]:
+            continue
+        if conf[i] < min_threshold:
+            break
+        if s_cum[i] >= t_cum[i]:
+            threshold = conf[i].item()
+    return threshold
+
+
+def distill_student(manifest=None):
+    """
+    Distill the trained teacher (model.pth + model.json) into the tiny cascade student.
+    Needs the split manifest the teacher was trained with: the escalation threshold
+    is calibrated on its val split, which neither model has trained on.
+    """
+    NUM_EPOCHS = 30
+    BATCH_SIZE = 32
+    LEARNING_RATE = 0.003
+    TEMPERATURE = 4.0
+    ALPHA = 0.7  # Weight of the soft (teacher) loss
+
+    if not os.path.exists(MODEL_SAVE_PATH):
+        print(f"❌ Teacher weights '{MODEL_SAVE_PATH}' not found. Run `python train.py` first.")
+        return
+
+    # Teacher at its serving architecture and resolution
+    config = load_model_config()
+    teacher_size = config["input_size"]
+
+    # A random split here would not match the teacher's, so the teacher would be scored
+    # on its own training images and the threshold would trust the student too much
+    manifest = manifest or config["manifest"]
+    if not manifest:
+        print("❌ Distillation needs a held-out split. Build one with dedup_dataset.py, train the teacher "
+              "with `python train.py --manifest dataset_manifest.json`, then rerun --distill.")
+        return
+    if config["manifest"] and os.path.abspath(manifest) != config["manifest"]:
+        print(f"❌ The teacher was trained with {config['manifest']}; distill with the same manifest.")
+        return
+
+    normalize = transforms.Normalize([0.485, 0.456, 0.406], [0.229, 0.224, 0.225])
+    train_tf = PairTransform(
+        transforms.Compose([transforms.Resize((teacher_size, teacher_size)), transforms.ToTensor(), normalize]),
+        transforms.Compose([
+            transforms.Resize((STUDENT_INPUT_SIZE, STUDENT_INPUT_SIZE)),
+            transforms.RandomHorizontalFlip(),
+            transforms.ToTensor(),
+            normalize
+        ])
+    )
+    val_tf = PairTransform(
+        transforms.Compose([transforms.Resize((teacher_size, teacher_size)), transforms.ToTensor(), normalize]),
+        transforms.Compose([transforms.Resize((STUDENT_INPUT_SIZE, STUDENT_INPUT_SIZE)), transforms.ToTensor(), normalize])
+    )
+
+    # Same leakage-free split as the teacher: the student trains on the teacher's train
+    # images, and the threshold is calibrated on val images neither model has seen
+    class_names, train_samples, val_samples = load_manifest_splits(manifest)
+    if not train_samples or not val_samples:
+        print("❌ The manifest needs both train and val images!")
+        return
+    train_dataset = ManifestDataset(train_samples, class_names, train_tf)
+    val_dataset = ManifestDataset(val_samples, class_names, val_tf)
+    train_loader = DataLoader(train_dataset, batch_size=BATCH_SIZE, shuffle=True, num_workers=0)
+    val_loader = DataLoader(val_dataset, batch_size=BATCH_SIZE, shuffle=False, num_workers=0)
+
+    device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
+    print(f"🎓 Distilling student from {MODEL_SAVE_PATH} on {device}")
+    print(f"   Training set: {len(train_dataset)} images, validation set: {len(val_dataset)} images")
+
+    teacher = build_model(config["backbone"], num_classes=len(class_names))
+    teacher.load_state_dict(torch.load(MODEL_SAVE_PATH, map_location=device))
+    teacher = teacher.to(device).eval()
+
+    student = build_student(len(class_names)).to(device)
+    optimizer = optim.Adam(student.parameters(), lr=LEARNING_RATE)
+    scheduler = optim.lr_scheduler.CosineAnnealingLR(optimizer, NUM_EPOCHS)
+    ce = nn.CrossEntropyLoss()
+    kl = nn.KLDivLoss(reduction='batchmean')
+
+    since = time.time()
+    for epoch in range(NUM_EPOCHS):
+        student.train()
+        running_loss = 0.0
+        for (teacher_in, student_in), labels in train_loader:
+            teacher_in, student_in, labels = teacher_in.to(device), student_in.to(device), labels.to(device)
+            with torch.no_grad():
+                teacher_logits = teacher(teacher_in)
+            student_logits = student(student_in)
+
+            soft_loss = kl(
+                torch.log_softmax(student_logits / TEMPERATURE, dim=1),
+                torch.softmax(teacher_logits / TEMPERATURE, dim=1)
+            ) * (TEMPERATURE ** 2)
+            loss = ALPHA * soft_loss + (1 - ALPHA) * ce(student_logits, labels)
+
+            optimizer.zero_grad()
+            loss.backward()
+            optimizer.step()
+            running_loss += loss.item() * labels.size(0)
+        scheduler.step()
+        print(f'Epoch {epoch + 1}/{NUM_EPOCHS} distill loss: {running_loss / len(train_dataset):.4f}')
+
+    # Calibrate the escalation threshold on the held-out validation split
+    student.eval()
+    confs, s_correct, t_correct = [], [], []
+    with torch.no_grad():
+        for (teacher_in, student_in), labels in val_loader:
+            teacher_in, student_in, labels = teacher_in.to(device), student_in.to(device), labels.to(device)
+            s_prob = torch.softmax(student(student_in), dim=1)
+            conf, s_pred = torch.max(s_prob, 1)
+            t_pred = torch.argmax(teacher(teacher_in), 1)
+            confs.append(conf.cpu())
+            s_correct.append((s_pred == labels).cpu())
+            t_correct.append((t_pred == labels).cpu())
+    confs, s_correct, t_correct = torch.cat(confs), torch.cat(s_correct), torch.cat(t_correct)
+
+    threshold = calibrate_threshold(confs, s_correct, t_correct)
+    accepted = confs >= threshold
+    coverage = accepted.float().mean().item()
+    cascade_correct = torch.where(accepted, s_correct, t_correct).float().mean().item()
+
+    torch.save(student.cpu().state_dict(), STUDENT_WEIGHTS_PATH)
+    with open(STUDENT_META_PATH, 'w') as f:
+        json.dump({
+            "categories": class_names,
+            "input_size": STUDENT_INPUT_SIZE,
+            "threshold": threshold,
+            "val_student_coverage": coverage,
+            "val_cascade_acc": cascade_correct,
+            "val_teacher_acc": t_correct.float().mean().item()
+        }, f, indent=2)
+
+    time_elapsed = time.time() - since
+    print(f'\n🏁 Distillation complete in {time_elapsed // 60:.0f}m {time_elapsed % 60:.0f}s')
+    print(f'   Threshold: {threshold:.3f} (student answers {coverage:.1%} of validation images)')
+    print(f'   Cascade val Acc: {cascade_correct:.4f} vs teacher {t_correct.float().mean().item():.4f}')
+    print(f"💾 Student saved to: {os.path.abspath(STUDENT_WEIGHTS_PATH)}")
+
+
 if __name__ == '__main__':
-    train_model()
+    parser = argparse.ArgumentParser(description="Train the category classifier")
+    parser.add_argument('--distill', action='store_true',
+                        help="Distill model.pth into the tiny cascade student")
+    parser.add_argument('--backbone', default=DEFAULT_BACKBONE, choices=list(BACKBONES),
+                        help="Backbone to fine-tune (compare them with evaluate_backbones.py)")
+    parser.add_argument('--input-size', type=int, default=None,
+                        help="Training/serving resolution (default: the backbone's default)")
+    parser.add_argument('--manifest', default=None,
+                        help="Deduplicated split manifest from dedup_dataset.py (instead of a random split; "
+                             "--distill uses the teacher's manifest by default)")
+    args = parser.parse_args()
+
+    if args.distill:
+        distill_student(args.manifest)
+    else:
+        train_model(args.backbone, args.input_size, args.manifest)